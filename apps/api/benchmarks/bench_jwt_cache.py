@@ -0,0 +1,67 @@
+"""
+JWT Verification Benchmark
+Cold (full RS256 decode) versus warm (digest cache hit) cost of TokenVerifier.verify
+
+Run from apps/api: python benchmarks/bench_jwt_cache.py [requests]
+"""
+
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt
+
+from security import TokenVerifier, JWT_AUDIENCE, JWT_ISSUER
+
+def _keys():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+def main(count: int):
+    private_pem, public_pem = _keys()
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": "user1", "iat": now, "exp": now + 3600, "iss": JWT_ISSUER, "aud": JWT_AUDIENCE},
+        private_pem,
+        algorithm="RS256"
+    )
+    
+    # Previous behaviour: PEM string parsed and signature checked on every request
+    uncached = timeit.timeit(
+        lambda: jwt.decode(token, public_pem, algorithms=["RS256"], audience=JWT_AUDIENCE, issuer=JWT_ISSUER),
+        number=count // 10
+    ) / (count // 10)
+    
+    verifier = TokenVerifier(public_pem)
+    
+    def cold():
+        verifier.clear()
+        verifier.verify(token)
+    
+    cold_cost = timeit.timeit(cold, number=count // 10) / (count // 10)
+    verifier.verify(token)
+    warm_cost = timeit.timeit(lambda: verifier.verify(token), number=count) / count
+    
+    print("🚀 JWT verification cost")
+    print("=" * 40)
+    print(f"decode, PEM per call {uncached * 1e6:8.2f} µs/request")
+    print(f"cold (cache miss)    {cold_cost * 1e6:8.2f} µs/request")
+    print(f"warm (cache hit)     {warm_cost * 1e6:8.2f} µs/request")
+    print(f"speedup              {uncached / warm_cost:8.1f}x")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
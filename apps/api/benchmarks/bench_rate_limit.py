@@ -0,0 +1,60 @@
+"""
+Rate Limiter Backend Benchmark
+Measures check_rate_limit + record_attempt per request for each backend
+
+The Mongo and Redis backends are skipped when MONGO_URI / REDIS_URL are unreachable.
+Run from apps/api: python benchmarks/bench_rate_limit.py [iterations]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import config
+from rate_limit_backends import InMemoryRateLimitBackend, MongoRateLimitBackend, RedisRateLimitBackend
+from session_management import RateLimiter
+
+async def bench_backend(backend, db, iterations: int) -> float:
+    RateLimiter.set_backend(backend)
+    started = time.perf_counter()
+    for i in range(iterations):
+        identifier = f"bench_user_{i % 500}"
+        await RateLimiter.check_rate_limit(db, identifier, "payment", "10.0.0.1")
+        await RateLimiter.record_attempt(db, identifier, "payment", "10.0.0.1", True)
+    return (time.perf_counter() - started) / iterations
+
+async def main(iterations: int):
+    print("🚀 Rate limiter benchmark (check + record per request)")
+    print("=" * 40)
+    
+    per_request = await bench_backend(InMemoryRateLimitBackend(), None, iterations)
+    print(f"memory  {per_request * 1e6:10.1f} µs/request")
+    
+    redis_backend = RedisRateLimitBackend(config.REDIS_URL)
+    try:
+        await redis_backend._redis.ping()
+        per_request = await bench_backend(redis_backend, None, min(iterations, 5000))
+        print(f"redis   {per_request * 1e6:10.1f} µs/request")
+    except Exception as e:
+        print(f"redis   skipped ({type(e).__name__})")
+    
+    client = AsyncIOMotorClient(config.MONGO_URI, serverSelectionTimeoutMS=1000)
+    db = client.bipay_benchmark
+    try:
+        await db.command("ping")
+    except Exception as e:
+        print(f"mongo   skipped ({type(e).__name__})")
+        return
+    
+    await db.rate_limit_windows.drop()
+    per_request = await bench_backend(MongoRateLimitBackend(), db, min(iterations, 2000))
+    print(f"mongo   {per_request * 1e6:10.1f} µs/request")
+    await db.rate_limit_windows.drop()
+    client.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
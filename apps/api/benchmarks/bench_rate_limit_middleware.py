@@ -0,0 +1,83 @@
+"""
+Rate Limit Middleware Overhead Benchmark
+Per-request cost RateLimitMiddleware adds in front of an ASGI app (target: well under 50µs)
+
+Run from apps/api: python benchmarks/bench_rate_limit_middleware.py [requests]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jose import jwt
+
+import security
+from rate_limit_middleware import RateLimitMiddleware
+
+BENCH_SECRET = "bench-secret-" + "x" * 32
+
+async def noop_app(scope, receive, send):
+    return None
+
+async def receive():
+    return {"type": "http.request"}
+
+async def send(message):
+    return None
+
+def _tokens(identities: int):
+    """One token per user, already verified as the routes would have (HS256 keeps setup fast)"""
+    security.token_verifier = security.TokenVerifier(BENCH_SECRET, algorithm="HS256")
+    claims = {"iss": security.JWT_ISSUER, "aud": security.JWT_AUDIENCE, "exp": time.time() + 3600}
+    tokens = [jwt.encode({**claims, "sub": f"u{user}"}, BENCH_SECRET, algorithm="HS256") for user in range(identities)]
+    for token in tokens:
+        security.token_verifier.verify(token)
+    return tokens
+
+def _scopes(count: int, identities: int):
+    tokens = _tokens(identities)
+    scopes = []
+    for i in range(count):
+        user = i % identities
+        scopes.append({
+            "type": "http",
+            "method": "GET",
+            "path": "/v1/transactions" if i % 4 == 0 else "/v1/notifications",
+            "client": (f"10.0.{user // 250}.{user % 250}", 50000),
+            "headers": [
+                (b"host", b"api.bipay.test"),
+                (b"user-agent", b"bipay-android/1.0"),
+                (b"authorization", f"Bearer {tokens[user]}".encode()),
+            ],
+        })
+    return scopes
+
+async def timed(app, scopes) -> float:
+    started = time.perf_counter()
+    for scope in scopes:
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / len(scopes)
+
+async def main(count: int):
+    scopes = _scopes(count, identities=10_000)
+    # Generous limits so every request takes the full (allowed) path
+    middleware = RateLimitMiddleware(
+        noop_app,
+        limits={"window": 60, "max_attempts": 10 ** 9},
+        route_overrides={"/v1/transactions": {"window": 60, "max_attempts": 10 ** 9}}
+    )
+    
+    baseline = await timed(noop_app, scopes)
+    wrapped = await timed(middleware, scopes)
+    
+    print("🚀 Rate limit middleware overhead")
+    print("=" * 40)
+    print(f"baseline   {baseline * 1e6:6.2f} µs/request")
+    print(f"middleware {wrapped * 1e6:6.2f} µs/request")
+    print(f"overhead   {(wrapped - baseline) * 1e6:6.2f} µs/request over {count} requests, {len(middleware.counter)} counters")
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
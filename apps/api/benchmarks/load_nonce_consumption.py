@@ -0,0 +1,56 @@
+"""
+Nonce Consumption Load Test
+Fires many concurrent verify_nonce calls per nonce and checks each is consumed exactly once
+
+Needs a reachable MongoDB (MONGO_URI). Uses a throwaway database.
+Covers whichever NONCE_MODE is configured (stateless or stored).
+Run from apps/api: python benchmarks/load_nonce_consumption.py [nonces] [concurrency]
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from config import config
+from nonce_utils import issue_nonce, verify_nonce
+
+async def run(nonce_count: int, concurrency: int):
+    client = AsyncIOMotorClient(config.MONGO_URI, maxPoolSize=max(100, concurrency))
+    db = client.bipay_loadtest
+    await db.nonces.drop()
+    await db.consumed_nonces.drop()
+    await db.nonces.create_index("nonce", unique=True)
+    
+    nonces = [await issue_nonce(db, "load_user", "load_device") for _ in range(nonce_count)]
+    
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        verify_nonce(db, nonce, "load_user", "load_device")
+        for nonce in nonces
+        for _ in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - started
+    
+    per_nonce = [sum(results[i * concurrency:(i + 1) * concurrency]) for i in range(nonce_count)]
+    double_spent = sum(1 for n in per_nonce if n > 1)
+    never_consumed = sum(1 for n in per_nonce if n == 0)
+    
+    print(f"🚀 {len(results)} verify calls over {nonce_count} nonces in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.0f} ops/s)")
+    print(f"{'✅' if not double_spent else '❌'} nonces consumed more than once: {double_spent}")
+    print(f"{'✅' if not never_consumed else '❌'} nonces never consumed: {never_consumed}")
+    
+    await db.nonces.drop()
+    await db.consumed_nonces.drop()
+    client.close()
+    return double_spent == 0 and never_consumed == 0
+
+if __name__ == "__main__":
+    nonce_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    ok = asyncio.run(run(nonce_count, concurrency))
+    sys.exit(0 if ok else 1)
@@ -1,8 +1,14 @@
+import asyncio
 import hashlib
 import base64
 import json
+import struct
+import threading
 import time
-from typing import Dict, Any, Optional
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Sequence, Tuple
 from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.primitives.asymmetric import padding, rsa
 from cryptography.hazmat.backends import default_backend
@@ -13,8 +19,77 @@ def canonical_json(data: dict) -> str:
     """Create deterministic, canonical JSON for consistent signing"""
     return json.dumps(data, sort_keys=True, separators=(',', ':'))
 
+# Signed payload encodings (sent by clients in X-Signature-Version)
+SIGNATURE_VERSION_JSON = 1  # legacy canonical JSON
+SIGNATURE_VERSION_COMPACT = 2  # fixed field layout for payment intents
+
+# Fixed field order per intent; the intent itself is the one-byte code
+PAYMENT_INTENT_LAYOUTS = {
+    "p2p": (1, ("user_id", "device_id", "nonce", "ts", "amount", "currency", "to_account", "memo")),
+    "merchant": (2, ("user_id", "device_id", "nonce", "ts", "amount", "currency", "merchant_id", "order_id", "memo")),
+}
+_INTENT_INT_FIELDS = frozenset({"ts", "amount"})
+_COMPILED_LAYOUTS = {
+    intent: (bytes((SIGNATURE_VERSION_COMPACT, code)), tuple((field, field in _INTENT_INT_FIELDS) for field in fields))
+    for intent, (code, fields) in PAYMENT_INTENT_LAYOUTS.items()
+}
+_pack_int = struct.Struct(">q").pack
+_pack_len = struct.Struct(">H").pack
+
+def encode_payment_intent(payload: dict) -> bytes:
+    """
+    Encode a payment intent in the compact v2 layout
+    
+    Layout: version byte, intent code byte, then each field of the intent
+    in fixed order - integers as signed 64-bit big-endian, strings as a
+    16-bit length followed by UTF-8 bytes. Unknown intents, missing or
+    extra fields, and values of the wrong type (including None - send ""
+    for an empty memo) raise ValueError so nothing unsigned can slip
+    through and no two payloads share an encoding.
+    """
+    layout = _COMPILED_LAYOUTS.get(payload.get("intent"))
+    if layout is None:
+        raise ValueError(f"No compact layout for intent: {payload.get('intent')}")
+    header, fields = layout
+    if len(payload) != len(fields) + 1:
+        raise ValueError("Payment intent fields do not match layout")
+    
+    parts = [header]
+    for field, is_int in fields:
+        try:
+            value = payload[field]
+        except KeyError:
+            raise ValueError(f"Missing payment intent field: {field}")
+        if is_int:
+            if type(value) is not int:
+                raise ValueError(f"Field {field} must be an integer")
+            parts.append(_pack_int(value))
+        else:
+            # str() would encode None as "None", the same bytes as the string "None"
+            if type(value) is not str:
+                raise ValueError(f"Field {field} must be a string")
+            encoded = value.encode('utf-8')
+            if len(encoded) > 0xFFFF:
+                raise ValueError(f"Field {field} too long")
+            parts.append(_pack_len(len(encoded)))
+            parts.append(encoded)
+    return b"".join(parts)
+
+def canonical_payload_bytes(payload: dict, version: int = SIGNATURE_VERSION_JSON) -> bytes:
+    """Return the exact bytes a client signs for the given encoding version"""
+    if version == SIGNATURE_VERSION_COMPACT:
+        return encode_payment_intent(payload)
+    if version == SIGNATURE_VERSION_JSON:
+        return canonical_json(payload).encode('utf-8')
+    raise ValueError(f"Unsupported signature version: {version}")
+
 # Enhanced biometric signature verification with comprehensive error handling
-def verify_biometric_signature(public_key_pem: str, payload: dict, signature_b64: str) -> bool:
+def verify_biometric_signature(
+    public_key_pem: str,
+    payload: dict,
+    signature_b64: str,
+    version: int = SIGNATURE_VERSION_JSON
+) -> bool:
     """
     Verify biometric signature with enhanced security checks
     
@@ -22,6 +97,7 @@ def verify_biometric_signature(public_key_pem: str, payload: dict, signature_b64
         public_key_pem: PEM-encoded public key from device
         payload: The data that was signed
         signature_b64: Base64-encoded signature
+        version: Payload encoding the client signed (legacy JSON by default)
     
     Returns:
         bool: True if signature is valid, False otherwise
@@ -31,51 +107,183 @@ def verify_biometric_signature(public_key_pem: str, payload: dict, signature_b64
         if not public_key_pem or not payload or not signature_b64:
             return False
         
-        # Use canonical JSON for consistent verification
-        canonical = canonical_json(payload).encode('utf-8')
-        
-        # Decode signature
-        try:
-            signature = base64.b64decode(signature_b64)
-        except Exception:
-            return False
-        
         # Load and validate public key
-        try:
-            public_key = serialization.load_pem_public_key(
-                public_key_pem.encode(), 
-                backend=default_backend()
-            )
-        except Exception:
-            return False
-        
-        # Verify it's an RSA key with appropriate size
-        if not isinstance(public_key, rsa.RSAPublicKey):
+        public_key = _load_device_public_key(public_key_pem)
+        if public_key is None:
             return False
         
-        key_size = public_key.key_size
-        if key_size < 2048:  # Minimum secure key size
-            return False
-        
-        # Verify signature with proper exception handling
-        try:
-            public_key.verify(
-                signature,
-                canonical,
-                padding.PKCS1v15(),
-                hashes.SHA256()
-            )
-            return True
-        except InvalidSignature:
-            return False
-        except Exception:
-            return False
+        return _verify_with_key(public_key, payload, signature_b64, version)
             
     except Exception as e:
         # Log security events without exposing internal errors
         print(f"Biometric verification failed: {type(e).__name__}")
         return False
 
+def _load_device_public_key(public_key_pem: str) -> Optional[rsa.RSAPublicKey]:
+    """Load a device public key, rejecting non-RSA and undersized keys"""
+    try:
+        public_key = serialization.load_pem_public_key(
+            public_key_pem.encode(), 
+            backend=default_backend()
+        )
+    except Exception:
+        return None
+    
+    # Verify it's an RSA key with appropriate size
+    if not isinstance(public_key, rsa.RSAPublicKey):
+        return None
+    
+    if public_key.key_size < 2048:  # Minimum secure key size
+        return None
+    
+    return public_key
+
+def _verify_with_key(
+    public_key: rsa.RSAPublicKey,
+    payload: dict,
+    signature_b64: str,
+    version: int = SIGNATURE_VERSION_JSON
+) -> bool:
+    """Verify one signature against an already loaded device key"""
+    if not payload or not signature_b64:
+        return False
+    
+    # Rebuild the exact signed bytes for the client's encoding
+    try:
+        canonical = canonical_payload_bytes(payload, version)
+    except ValueError:
+        return False
+    
+    # Decode signature
+    try:
+        signature = base64.b64decode(signature_b64)
+    except Exception:
+        return False
+    
+    # Verify signature with proper exception handling
+    try:
+        public_key.verify(
+            signature,
+            canonical,
+            padding.PKCS1v15(),
+            hashes.SHA256()
+        )
+        return True
+    except InvalidSignature:
+        return False
+    except Exception:
+        return False
+
+# Batch verification for queued and offline (NFC) payment reconciliation
+BATCH_INLINE_THRESHOLD = 64  # below this, a process pool costs more than it saves
+BATCH_CHUNK_SIZE = 256
+
+# Shared by every batch in this process; starting worker processes costs more than most batches
+_batch_pool: Optional[ProcessPoolExecutor] = None
+_batch_pool_lock = threading.Lock()
+
+def _shared_batch_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """The process-wide verification pool, started on first use"""
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(max_workers=max_workers)
+        return _batch_pool
+
+def shutdown_batch_pool(pool: Optional[ProcessPoolExecutor] = None, wait: bool = True):
+    """Stop the shared verification pool (only if it is still pool), e.g. at shutdown"""
+    global _batch_pool
+    with _batch_pool_lock:
+        if pool is not None and pool is not _batch_pool:
+            return
+        pool, _batch_pool = _batch_pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+def _verify_key_group(public_key_pem: str, entries: List[Tuple[int, dict, str, int]]) -> List[Tuple[int, bool]]:
+    """Verify every signature made with one device key (runs in a worker process)"""
+    try:
+        public_key = _load_device_public_key(public_key_pem) if public_key_pem else None
+    except Exception:
+        public_key = None
+    
+    if public_key is None:
+        return [(index, False) for index, _, _, _ in entries]
+    
+    results = []
+    for index, payload, signature_b64, version in entries:
+        try:
+            results.append((index, _verify_with_key(public_key, payload, signature_b64, version)))
+        except Exception:
+            results.append((index, False))
+    return results
+
+def verify_biometric_signatures_batch(
+    items: Sequence[tuple],
+    max_workers: Optional[int] = None,
+    executor: Optional[Executor] = None
+) -> List[bool]:
+    """
+    Verify many biometric signatures at once
+    
+    Items are grouped by device key so each key is parsed once, and the
+    groups are verified in parallel across a process pool.
+    
+    Args:
+        items: (public_key_pem, payload, signature_b64) tuples, optionally
+            with a fourth signature version element
+        max_workers: Size of the shared pool, if this call starts it
+        executor: Executor to use instead of the shared pool
+    
+    Returns:
+        list: One bool per item, in input order
+    """
+    results = [False] * len(items)
+    if not items:
+        return results
+    
+    # Group by key so each key is loaded once per chunk of work
+    groups: Dict[str, List[Tuple[int, dict, str, int]]] = defaultdict(list)
+    for index, item in enumerate(items):
+        version = item[3] if len(item) > 3 else SIGNATURE_VERSION_JSON
+        groups[item[0]].append((index, item[1], item[2], version))
+    
+    # Split hot keys (e.g. one merchant terminal) so they still spread across the pool
+    work = [
+        (pem, entries[start:start + BATCH_CHUNK_SIZE])
+        for pem, entries in groups.items()
+        for start in range(0, len(entries), BATCH_CHUNK_SIZE)
+    ]
+    
+    if executor is None and len(items) < BATCH_INLINE_THRESHOLD:
+        group_results = [_verify_key_group(pem, entries) for pem, entries in work]
+    else:
+        pool = executor or _shared_batch_pool(max_workers)
+        try:
+            futures = [pool.submit(_verify_key_group, pem, entries) for pem, entries in work]
+            group_results = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died; the next batch starts a fresh shared pool
+            if executor is None:
+                shutdown_batch_pool(pool, wait=False)
+            raise
+    
+    for group in group_results:
+        for index, valid in group:
+            results[index] = valid
+    
+    return results
+
+async def verify_biometric_signatures_batch_async(
+    items: Sequence[tuple],
+    executor: Optional[Executor] = None
+) -> List[bool]:
+    """Run batch verification without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, verify_biometric_signatures_batch, items, None, executor
+    )
+
 # Enhanced attestation validation with comprehensive checks
 def validate_attestation(attestation: dict) -> Dict[str, Any]:
     """
@@ -232,13 +440,14 @@ def generate_device_keypair() -> Dict[str, str]:
         raise RuntimeError(f"Failed to generate keypair: {e}")
 
 # Sign payload with private key (for testing)
-def sign_payload(private_key_pem: str, payload: dict) -> str:
+def sign_payload(private_key_pem: str, payload: dict, version: int = SIGNATURE_VERSION_JSON) -> str:
     """
     Sign payload with private key (for testing biometric signatures)
     
     Args:
         private_key_pem: PEM-encoded private key
         payload: Data to sign
+        version: Payload encoding to sign
     
     Returns:
         str: Base64-encoded signature
@@ -251,8 +460,8 @@ def sign_payload(private_key_pem: str, payload: dict) -> str:
             backend=default_backend()
         )
         
-        # Create canonical JSON
-        canonical = canonical_json(payload).encode('utf-8')
+        # Create canonical bytes
+        canonical = canonical_payload_bytes(payload, version)
         
         # Sign with private key
         signature = private_key.sign(
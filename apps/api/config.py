@@ -20,19 +20,36 @@ class Config:
     JWT_PUBLIC_KEY_PEM = os.getenv("JWT_PUBLIC_KEY_PEM", "")
     JWT_PRIVATE_KEY_PEM = os.getenv("JWT_PRIVATE_KEY_PEM", "")
     JWT_ALGORITHM = "RS256"
-    JWT_EXPIRATION_HOURS = 24
+    ACCESS_TOKEN_TTL_MINUTES = int(os.getenv("ACCESS_TOKEN_TTL_MINUTES", "15"))
+    REFRESH_TOKEN_TTL_DAYS = int(os.getenv("REFRESH_TOKEN_TTL_DAYS", "30"))
+    TOKEN_REVOCATION_SYNC_INTERVAL = int(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL", "5"))  # seconds
     
     # Redis Configuration
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
     
+    # Rate Limiting ("mongo" attempt documents, in-process "memory" or shared "redis" windows)
+    RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "mongo")
+    
     # Message Queue Configuration
     KAFKA_BROKERS = os.getenv("KAFKA_BROKERS", "localhost:9092")
     
     # Security Configuration
     WEBHOOK_HMAC_SECRET = os.getenv("WEBHOOK_HMAC_SECRET_DEFAULT", "hackathonsecret")
     
+    # Push Provider (FCM-style batch endpoint)
+    PUSH_PROVIDER_URL = os.getenv("PUSH_PROVIDER_URL", "https://fcm.googleapis.com")
+    PUSH_API_KEY = os.getenv("PUSH_API_KEY", "")
+    
+    # Nonce Configuration ("stored" nonce documents, or opt-in "stateless" HMAC nonces)
+    NONCE_MODE = os.getenv("NONCE_MODE", "stored")
+    NONCE_HMAC_SECRET = os.getenv("NONCE_HMAC_SECRET", "")  # dedicated key, required in stateless mode
+    NONCE_HMAC_SECRET_MIN_LENGTH = 32
+    
     # External API Keys
     PLAY_INTEGRITY_API_KEY = os.getenv("PLAY_INTEGRITY_API_KEY", "")
+    PLAY_INTEGRITY_URL = os.getenv("PLAY_INTEGRITY_URL", "https://playintegrity.googleapis.com/v1")
+    ANDROID_PACKAGE_NAME = os.getenv("ANDROID_PACKAGE_NAME", "com.bipay.app")
+    ATTESTATION_VERDICT_TTL = int(os.getenv("ATTESTATION_VERDICT_TTL", "86400"))  # seconds
     RISK_ENGINE_URL = os.getenv("RISK_ENGINE_URL", "")
     
     # S3 Configuration
@@ -40,6 +57,7 @@ class Config:
     S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY", "")
     S3_SECRET_KEY = os.getenv("S3_SECRET_KEY", "")
     S3_BUCKET = os.getenv("S3_BUCKET", "")
+    RECEIPT_CACHE_DIR = os.getenv("RECEIPT_CACHE_DIR", "/tmp/bipay-receipts")
     
     # Application Settings
     DEBUG = os.getenv("DEBUG", "false").lower() == "true"
@@ -63,6 +81,18 @@ class Config:
             raise RuntimeError(f"Missing required configuration: {', '.join(missing_configs)}")
         
         return True
+    
+    def validate_nonce_config(self):
+        """Stateless nonces need a dedicated signing secret; raises RuntimeError at startup otherwise"""
+        if self.NONCE_MODE != "stateless":
+            return
+        if len(self.NONCE_HMAC_SECRET) < self.NONCE_HMAC_SECRET_MIN_LENGTH:
+            raise RuntimeError(
+                f"NONCE_HMAC_SECRET must be set (at least {self.NONCE_HMAC_SECRET_MIN_LENGTH} characters) "
+                "when NONCE_MODE is stateless"
+            )
+        if self.NONCE_HMAC_SECRET == self.WEBHOOK_HMAC_SECRET:
+            raise RuntimeError("NONCE_HMAC_SECRET must not reuse the webhook secret")
 
 # Create global config instance
 config = Config()
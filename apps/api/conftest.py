@@ -0,0 +1,473 @@
+"""
+Shared test fixtures
+In-memory stand-in for the Motor collections the services use
+"""
+
+import asyncio
+import copy
+from types import SimpleNamespace
+
+import pytest
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+def _get(doc, path):
+    for part in path.split("."):
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return doc
+
+def _set(doc, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+def _unset(doc, path):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part)
+        if not isinstance(doc, dict):
+            return
+    doc.pop(last, None)
+
+def _has(doc, path):
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.get(part) if isinstance(doc, dict) else None
+    return isinstance(doc, dict) and last in doc
+
+def _equals(value, operand):
+    # An array field matches any of its elements
+    if isinstance(value, list) and not isinstance(operand, list):
+        return operand in value
+    return value == operand
+
+def _compare(value, operand, test):
+    return value is not None and test(value, operand)
+
+OPERATORS = {
+    "$eq": lambda doc, path, value, operand: _equals(value, operand),
+    "$ne": lambda doc, path, value, operand: not _equals(value, operand),
+    "$in": lambda doc, path, value, operand: any(_equals(value, option) for option in operand),
+    "$nin": lambda doc, path, value, operand: not any(_equals(value, option) for option in operand),
+    "$lt": lambda doc, path, value, operand: _compare(value, operand, lambda a, b: a < b),
+    "$lte": lambda doc, path, value, operand: _compare(value, operand, lambda a, b: a <= b),
+    "$gt": lambda doc, path, value, operand: _compare(value, operand, lambda a, b: a > b),
+    "$gte": lambda doc, path, value, operand: _compare(value, operand, lambda a, b: a >= b),
+    "$exists": lambda doc, path, value, operand: _has(doc, path) == bool(operand),
+    "$not": lambda doc, path, value, operand: not _matches_condition(doc, path, operand),
+}
+
+def _matches_condition(doc, path, condition):
+    value = _get(doc, path)
+    if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+        return all(OPERATORS[op](doc, path, value, operand) for op, operand in condition.items())
+    return _equals(value, condition)
+
+def matches(doc, query):
+    """Whether doc satisfies a find filter"""
+    for field, condition in query.items():
+        if field == "$and":
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif field == "$or":
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif not _matches_condition(doc, field, condition):
+            return False
+    return True
+
+def _expression(doc, expr, variables=None):
+    """The aggregation expressions used in pipeline updates"""
+    if isinstance(expr, str) and expr.startswith("$$"):
+        return _get(variables, expr[2:])
+    if isinstance(expr, str) and expr.startswith("$"):
+        return _get(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_expression(doc, item, variables) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if not any(key.startswith("$") for key in expr):
+        return {key: _expression(doc, value, variables) for key, value in expr.items()}
+    (op, args), = expr.items()
+    if op == "$filter":
+        return [
+            item for item in _expression(doc, args["input"], variables)
+            if _expression(doc, args["cond"], {**(variables or {}), "this": item})
+        ]
+    args = _expression(doc, args, variables)
+    if op == "$setUnion":
+        return sorted(set().union(*(arg or [] for arg in args)))
+    if op == "$cond":
+        return args[1] if args[0] else args[2]
+    if op == "$ifNull":
+        return args[0] if args[0] is not None else args[1]
+    if op == "$size":
+        return len(args)
+    if op == "$gt":
+        return args[0] > args[1]
+    if op == "$gte":
+        return args[0] >= args[1]
+    if op == "$concatArrays":
+        return [item for arg in args for item in arg]
+    if op == "$slice":
+        return args[0][args[1]:] if args[1] < 0 else args[0][:args[1]]
+    raise NotImplementedError(op)
+
+def _apply(doc, update, inserting=False):
+    if isinstance(update, list):
+        for stage in update:
+            for field, expr in stage["$set"].items():
+                _set(doc, field, _expression(doc, expr))
+        return
+    if inserting:
+        for field, value in update.get("$setOnInsert", {}).items():
+            _set(doc, field, copy.deepcopy(value))
+    for field, value in update.get("$set", {}).items():
+        _set(doc, field, copy.deepcopy(value))
+    for field, delta in update.get("$inc", {}).items():
+        _set(doc, field, (_get(doc, field) or 0) + delta)
+    for field, value in update.get("$max", {}).items():
+        current = _get(doc, field)
+        _set(doc, field, value if current is None else max(current, value))
+    for field in update.get("$unset", {}):
+        _unset(doc, field)
+    for field, value in update.get("$push", {}).items():
+        values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+        _set(doc, field, (_get(doc, field) or []) + values)
+    for field, condition in update.get("$pull", {}).items():
+        _set(doc, field, [item for item in _get(doc, field) or [] if not matches(item, condition)])
+    for field, value in update.get("$addToSet", {}).items():
+        values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+        current = _get(doc, field) or []
+        _set(doc, field, current + [v for v in values if v not in current])
+
+def _seed(query):
+    # Equality conditions of an upsert's filter become fields of the new document
+    doc = {}
+    for field, condition in query.items():
+        if not field.startswith("$") and not (isinstance(condition, dict) and any(k.startswith("$") for k in condition)):
+            _set(doc, field, copy.deepcopy(condition))
+    return doc
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    included = {field for field, flag in projection.items() if flag and field != "_id"}
+    if not included:
+        excluded = {field for field, flag in projection.items() if not flag}
+        return {k: copy.deepcopy(v) for k, v in doc.items() if k not in excluded}
+    if projection.get("_id", 1):
+        included.add("_id")
+    result = {}
+    for field in included:
+        if _has(doc, field):
+            _set(result, field, copy.deepcopy(_get(doc, field)))
+    return result
+
+def _sort_key(value):
+    # Missing fields sort first, as in MongoDB
+    return (value is not None, value)
+
+def _sorted(docs, keys):
+    docs = list(docs)
+    for field, direction in reversed(keys):
+        docs.sort(key=lambda doc: _sort_key(_get(doc, field)), reverse=direction < 0)
+    return docs
+
+class FakeCursor:
+    """find() / aggregate() cursor: chainable, async-iterable, to_list()"""
+    
+    def __init__(self, docs, projection=None):
+        self._docs = list(docs)
+        self._projection = projection
+        self._limit = 0
+        self._skip = 0
+    
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        self._docs = _sorted(self._docs, keys)
+        return self
+    
+    def skip(self, count):
+        self._skip = count
+        return self
+    
+    def limit(self, count):
+        self._limit = count
+        return self
+    
+    def batch_size(self, size):
+        return self
+    
+    def _results(self):
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(doc, self._projection) for doc in docs]
+    
+    async def to_list(self, length=None):
+        docs = self._results()
+        return docs[:length] if length else docs
+    
+    def __aiter__(self):
+        self._iter = iter(self._results())
+        return self
+    
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class FakeCollection:
+    """
+    Async collection over a dict of documents keyed by _id
+    
+    Every call yields to the event loop once before touching the data, so
+    concurrent callers interleave between round trips the way they would
+    against a server, while each operation itself stays atomic. Calls are
+    recorded in `calls` as (method, filter or batch size).
+    """
+    
+    def __init__(self, docs=()):
+        self.docs = {}
+        self.calls = []
+        self.unique = []  # (field, partialFilterExpression) of unique indexes
+        for doc in docs:
+            doc = dict(doc)
+            doc.setdefault("_id", ObjectId())
+            self.docs[doc["_id"]] = doc
+    
+    async def create_index(self, keys, unique=False, partialFilterExpression=None, **kwargs):
+        if unique:
+            field = keys if isinstance(keys, str) else keys[0][0]
+            self.unique.append((field, partialFilterExpression or {}))
+    
+    def count(self, method):
+        return sum(1 for name, _ in self.calls if name == method)
+    
+    def _matching(self, query):
+        doc_id = query.get("_id")
+        if doc_id is not None and not isinstance(doc_id, dict):
+            # _id lookups use the primary key, as on the server
+            doc = self.docs.get(doc_id)
+            return [doc] if doc is not None and matches(doc, query) else []
+        return [doc for doc in self.docs.values() if matches(doc, query)]
+    
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError(f"E11000 duplicate key _id: {doc['_id']!r}")
+        for field, partial in self.unique:
+            value = _get(doc, field)
+            if matches(doc, partial) and any(
+                _get(other, field) == value and matches(other, partial) for other in self.docs.values()
+            ):
+                raise DuplicateKeyError(f"E11000 duplicate key {field}: {value!r}")
+        self.docs[doc["_id"]] = doc
+        return doc["_id"]
+    
+    def _update(self, query, update, many=False, upsert=False):
+        matched = self._matching(query)
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            _apply(doc, update)
+        if matched or not upsert:
+            return SimpleNamespace(matched_count=len(matched), modified_count=len(matched), upserted_id=None)
+        doc = _seed(query)
+        _apply(doc, update, inserting=True)
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=self._insert(doc))
+    
+    def _delete(self, query, many=False):
+        matched = self._matching(query)
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(matched))
+    
+    async def insert_one(self, doc):
+        self.calls.append(("insert_one", None))
+        await asyncio.sleep(0)
+        inserted_id = self._insert(doc)
+        doc.setdefault("_id", inserted_id)
+        return SimpleNamespace(inserted_id=inserted_id)
+    
+    async def insert_many(self, docs, ordered=True):
+        docs = list(docs)
+        self.calls.append(("insert_many", len(docs)))
+        await asyncio.sleep(0)
+        ids = []
+        for doc in docs:
+            ids.append(self._insert(doc))
+            doc.setdefault("_id", ids[-1])
+        return SimpleNamespace(inserted_ids=ids)
+    
+    def find(self, query=None, projection=None, sort=None, limit=0):
+        query = query or {}
+        self.calls.append(("find", query))
+        cursor = FakeCursor(self._matching(query), projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.limit(limit)
+    
+    async def find_one(self, query=None, projection=None, sort=None):
+        query = query or {}
+        self.calls.append(("find_one", query))
+        await asyncio.sleep(0)
+        docs = _sorted(self._matching(query), sort or [])
+        return _project(docs[0], projection) if docs else None
+    
+    async def find_one_and_update(
+        self, query, update, projection=None, sort=None, upsert=False, return_document=ReturnDocument.BEFORE
+    ):
+        self.calls.append(("find_one_and_update", query))
+        await asyncio.sleep(0)
+        docs = _sorted(self._matching(query), sort or [])
+        if not docs:
+            if not upsert:
+                return None
+            result = self._update(query, update, upsert=True)
+            return _project(self.docs[result.upserted_id], projection) if return_document else None
+        before = copy.deepcopy(docs[0])
+        _apply(docs[0], update)
+        return _project(docs[0] if return_document else before, projection)
+    
+    async def find_one_and_delete(self, query, projection=None, sort=None):
+        self.calls.append(("find_one_and_delete", query))
+        await asyncio.sleep(0)
+        docs = _sorted(self._matching(query), sort or [])
+        if not docs:
+            return None
+        return _project(self.docs.pop(docs[0]["_id"]), projection)
+    
+    async def update_one(self, query, update, upsert=False):
+        self.calls.append(("update_one", query))
+        await asyncio.sleep(0)
+        return self._update(query, update, upsert=upsert)
+    
+    async def update_many(self, query, update, upsert=False):
+        self.calls.append(("update_many", query))
+        await asyncio.sleep(0)
+        return self._update(query, update, many=True, upsert=upsert)
+    
+    async def delete_one(self, query):
+        self.calls.append(("delete_one", query))
+        await asyncio.sleep(0)
+        return self._delete(query)
+    
+    async def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        await asyncio.sleep(0)
+        return self._delete(query, many=True)
+    
+    async def count_documents(self, query, limit=0):
+        self.calls.append(("count_documents", query))
+        await asyncio.sleep(0)
+        count = len(self._matching(query))
+        return min(count, limit) if limit else count
+    
+    async def bulk_write(self, operations, ordered=True):
+        operations = list(operations)
+        self.calls.append(("bulk_write", len(operations)))
+        await asyncio.sleep(0)
+        modified = upserted = inserted = deleted = 0
+        for operation in operations:
+            if isinstance(operation, InsertOne):
+                self._insert(operation._doc)
+                inserted += 1
+            elif isinstance(operation, (UpdateOne, UpdateMany)):
+                result = self._update(
+                    operation._filter, operation._doc, many=isinstance(operation, UpdateMany), upsert=operation._upsert
+                )
+                modified += result.modified_count
+                upserted += result.upserted_id is not None
+            elif isinstance(operation, (DeleteOne, DeleteMany)):
+                deleted += self._delete(operation._filter, many=isinstance(operation, DeleteMany)).deleted_count
+        return SimpleNamespace(
+            modified_count=modified, upserted_count=upserted, inserted_count=inserted, deleted_count=deleted
+        )
+    
+    def aggregate(self, pipeline):
+        """$match, $sort, $limit and $group with $sum"""
+        self.calls.append(("aggregate", len(pipeline)))
+        docs = list(self.docs.values())
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif name == "$sort":
+                docs = _sorted(docs, list(spec.items()))
+            elif name == "$limit":
+                docs = docs[:spec]
+            elif name == "$group":
+                groups = {}
+                for doc in docs:
+                    key = _expression(doc, spec["_id"])
+                    group = groups.setdefault(key, {"_id": key})
+                    for field, accumulator in spec.items():
+                        if field != "_id":
+                            group[field] = group.get(field, 0) + _expression(doc, accumulator["$sum"])
+                docs = list(groups.values())
+            else:
+                raise NotImplementedError(name)
+        return FakeCursor(docs)
+
+class FakeDatabase:
+    """Collections are created on first access, like a real database"""
+    
+    def __init__(self, **collections):
+        for name, docs in collections.items():
+            setattr(self, name, FakeCollection(docs))
+    
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        collection = FakeCollection()
+        setattr(self, name, collection)
+        return collection
+    
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+@pytest.fixture
+def fake_db():
+    """Factory for in-memory databases: fake_db(notifications=[...], devices=[...])"""
+    return FakeDatabase
+
+@pytest.fixture(scope="session")
+def signing_keys():
+    """(private PEM, public PEM) of an RSA key pair for test tokens"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+@pytest.fixture
+def auth_headers(monkeypatch, signing_keys):
+    """Signs tokens that JWTBearer accepts: auth_headers(user_id="alice") -> headers"""
+    import security
+    from config import config
+    
+    private_pem, public_pem = signing_keys
+    monkeypatch.setattr(config, "JWT_PRIVATE_KEY_PEM", private_pem)
+    monkeypatch.setattr(security, "token_verifier", security.TokenVerifier(public_pem, revocations=security.RevocationList()))
+    
+    def headers(user_id="user1", wallet_id="wallet1"):
+        token = security.create_jwt_token({"user_id": user_id, "wallet_id": wallet_id})
+        return {"Authorization": f"Bearer {token}"}
+    return headers
@@ -0,0 +1,146 @@
+"""
+Device Attestation Verification
+Local attestation checks plus cached remote integrity verdicts per device key
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Tuple
+from biometric import validate_attestation
+from cache_utils import TTLCache, SingleFlight
+from config import config
+from integrity_client import get_integrity_client, evaluate_integrity_verdict, IntegrityServiceError
+
+class AttestationVerifier:
+    """
+    Attestation validation with verdict reuse across re-enrollments
+    
+    Verdicts are cached per (user, device, key fingerprint). A cached
+    verdict is only honored while the caller's device document, read from
+    the database on every enrollment, is active and owned by the same
+    user, so a revocation on any worker takes effect everywhere at once.
+    """
+    
+    VERDICT_TTL = config.ATTESTATION_VERDICT_TTL  # seconds a passing verdict is reused
+    NEGATIVE_TTL = 60  # seconds a failing verdict is reused
+    
+    _verdicts = TTLCache(maxsize=100_000, ttl=VERDICT_TTL)
+    _inflight = SingleFlight()
+    
+    @staticmethod
+    def key_fingerprint(public_key_pem: str) -> str:
+        """Stable fingerprint of a device public key"""
+        normalized = "".join(public_key_pem.split())
+        return hashlib.sha256(normalized.encode()).hexdigest()
+    
+    @staticmethod
+    async def verify(
+        user_id: str,
+        device_id: str,
+        public_key_pem: str,
+        attestation: dict,
+        stored_device: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Validate attestation, consulting the integrity service at most once
+        per user, device and key within the verdict TTL
+        
+        Args:
+            user_id: User enrolling the device
+            device_id: Device being enrolled
+            public_key_pem: Device public key being enrolled
+            attestation: Attestation submitted by the device
+            stored_device: The device's current document, None if it was never enrolled
+        
+        Returns:
+            dict: validate_attestation result, extended with the integrity verdict
+        """
+        result = validate_attestation(attestation)
+        if not result["valid"]:
+            return result
+        
+        client = get_integrity_client()
+        if client is None:
+            # Remote verdicts not enabled; local checks only
+            return result
+        
+        integrity_token = attestation.get("integrity_token")
+        if not integrity_token:
+            result["valid"] = False
+            result["reason"] = "Integrity token required"
+            result["checks"]["play_integrity"] = False
+            return result
+        
+        key = (user_id, device_id, AttestationVerifier.key_fingerprint(public_key_pem))
+        
+        verdict = AttestationVerifier._cached_verdict(key, stored_device)
+        if verdict is not None:
+            result["checks"]["integrity_cached"] = True
+        else:
+            verdict = await AttestationVerifier._inflight.do(
+                key,
+                lambda: AttestationVerifier._fetch_verdict(client, key, integrity_token)
+            )
+            result["checks"]["integrity_cached"] = False
+        
+        result["integrity_verdict"] = verdict
+        result["checks"]["play_integrity"] = verdict["passed"]
+        if not verdict["passed"]:
+            result["valid"] = False
+            result["reason"] = verdict["reason"]
+        
+        return result
+    
+    @staticmethod
+    def revoke(device_id: str):
+        """Drop this process's cached verdicts for a device (call on revocation or key change)"""
+        AttestationVerifier._verdicts.pop_matching(lambda key: key[1] == device_id)
+    
+    @staticmethod
+    def _cached_verdict(
+        key: Tuple[str, str, str],
+        stored_device: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Look up a verdict in memory, then on the stored device document"""
+        user_id, _, fingerprint = key
+        if stored_device is not None and (
+            stored_device.get("status") != "active" or stored_device.get("user_id") != user_id
+        ):
+            # Revoked (possibly by another worker) or enrolled to someone else
+            return None
+        
+        verdict = AttestationVerifier._verdicts.get(key)
+        if verdict is not None or stored_device is None:
+            return verdict
+        
+        stored = stored_device.get("attestation_result", {}).get("integrity_verdict")
+        if not stored or not stored.get("passed") or stored.get("fingerprint") != fingerprint:
+            return None
+        
+        age = datetime.utcnow() - stored["verified_at"]
+        if age > timedelta(seconds=AttestationVerifier.VERDICT_TTL):
+            return None
+        
+        remaining = AttestationVerifier.VERDICT_TTL - age.total_seconds()
+        AttestationVerifier._verdicts.set(key, stored, ttl=remaining)
+        return stored
+    
+    @staticmethod
+    async def _fetch_verdict(client, key: Tuple[str, str, str], integrity_token: str) -> Dict[str, Any]:
+        """Ask the integrity service and cache the outcome"""
+        fingerprint = key[2]
+        try:
+            decoded = await client.decode_token(integrity_token, config.ANDROID_PACKAGE_NAME)
+        except IntegrityServiceError as e:
+            # Service errors are not cached so the next enrollment retries
+            return {"passed": False, "reason": str(e), "fingerprint": fingerprint, "verified_at": datetime.utcnow()}
+        
+        verdict = {
+            **evaluate_integrity_verdict(decoded, config.ANDROID_PACKAGE_NAME),
+            "fingerprint": fingerprint,
+            "verified_at": datetime.utcnow()
+        }
+        
+        ttl = AttestationVerifier.VERDICT_TTL if verdict["passed"] else AttestationVerifier.NEGATIVE_TTL
+        AttestationVerifier._verdicts.set(key, verdict, ttl=ttl)
+        return verdict
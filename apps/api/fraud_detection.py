@@ -8,6 +8,7 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from principal_cache import PrincipalCache
 import hashlib
 import statistics
 
@@ -123,7 +124,7 @@ class FraudDetectionEngine:
         
         # New device check
         if len(device_txns) == 0:
-            device_registration = await db.devices.find_one({"_id": device_id})
+            device_registration = await PrincipalCache.get_device(db, device_id)
             if device_registration:
                 days_since_registration = (datetime.utcnow() - device_registration["created_at"]).days
                 if days_since_registration < 1:
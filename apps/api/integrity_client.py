@@ -0,0 +1,108 @@
+"""
+Play Integrity Client
+Pooled client for the remote integrity verdict service, with a local stub for tests
+"""
+
+from typing import Dict, Any, Optional
+import httpx
+from config import config
+
+class IntegrityServiceError(Exception):
+    """Remote integrity verdict could not be obtained"""
+
+class PlayIntegrityClient:
+    """Decodes integrity tokens over one pooled HTTP connection set"""
+    
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = config.PLAY_INTEGRITY_URL,
+        timeout: float = 5.0,
+        max_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.api_key = api_key
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            transport=transport
+        )
+    
+    async def decode_token(self, integrity_token: str, package_name: str) -> Dict[str, Any]:
+        """Return the decoded token payload (the integrity verdict)"""
+        try:
+            response = await self._client.post(
+                f"/{package_name}:decodeIntegrityToken",
+                params={"key": self.api_key},
+                json={"integrity_token": integrity_token}
+            )
+        except httpx.HTTPError as e:
+            raise IntegrityServiceError(f"Integrity service unreachable: {type(e).__name__}")
+        
+        if response.status_code != 200:
+            raise IntegrityServiceError(f"Integrity service returned {response.status_code}")
+        
+        return response.json().get("tokenPayloadExternal", {})
+    
+    async def aclose(self):
+        await self._client.aclose()
+
+class LocalIntegrityStub:
+    """Offline stand-in that returns a passing verdict unless the token says otherwise"""
+    
+    def __init__(self):
+        self.calls = 0
+    
+    async def decode_token(self, integrity_token: str, package_name: str) -> Dict[str, Any]:
+        self.calls += 1
+        passing = not integrity_token.startswith("fail")
+        return {
+            "requestDetails": {"requestPackageName": package_name},
+            "appIntegrity": {
+                "appRecognitionVerdict": "PLAY_RECOGNIZED" if passing else "UNRECOGNIZED_VERSION",
+                "packageName": package_name
+            },
+            "deviceIntegrity": {
+                "deviceRecognitionVerdict": ["MEETS_DEVICE_INTEGRITY"] if passing else []
+            }
+        }
+    
+    async def aclose(self):
+        pass
+
+def evaluate_integrity_verdict(verdict: Dict[str, Any], package_name: str) -> Dict[str, Any]:
+    """Reduce a decoded integrity payload to pass/fail with a reason"""
+    app_integrity = verdict.get("appIntegrity", {})
+    device_verdicts = verdict.get("deviceIntegrity", {}).get("deviceRecognitionVerdict", [])
+    
+    if app_integrity.get("packageName", package_name) != package_name:
+        return {"passed": False, "reason": "Integrity verdict for another package"}
+    if app_integrity.get("appRecognitionVerdict") != "PLAY_RECOGNIZED":
+        return {"passed": False, "reason": "App not recognized by Play"}
+    if "MEETS_DEVICE_INTEGRITY" not in device_verdicts:
+        return {"passed": False, "reason": "Device integrity not met"}
+    return {"passed": True, "reason": "Integrity verdict passed"}
+
+_client = None
+
+def get_integrity_client():
+    """Shared pooled client, or None while PLAY_INTEGRITY_API_KEY is unset"""
+    global _client
+    if _client is None and config.PLAY_INTEGRITY_API_KEY:
+        _client = PlayIntegrityClient(config.PLAY_INTEGRITY_API_KEY)
+    return _client
+
+def set_integrity_client(client):
+    """Swap the shared client (e.g. LocalIntegrityStub in tests)"""
+    global _client
+    _client = client
+
+async def close_integrity_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
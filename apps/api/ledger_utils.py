@@ -5,8 +5,9 @@ from datetime import datetime
 from decimal import Decimal
 from blockchain_audit import BlockchainAuditTrail
 from payment_ethics import PaymentEthicsCompliance
+from principal_cache import PrincipalCache
 
-async def post_ledger_entry(db: AsyncIOMotorDatabase, txn_id: str, account_id: str, direction: str, amount_minor: int, balance_after: int):
+async def post_ledger_entry(db: AsyncIOMotorDatabase, txn_id: str, account_id: str, direction: str, amount_minor: int, balance_after: int, session=None):
     """Post double-entry ledger entry with immutable hash"""
     entry = {
         "txn_id": txn_id,
@@ -24,7 +25,7 @@ async def post_ledger_entry(db: AsyncIOMotorDatabase, txn_id: str, account_id: s
     ).hexdigest()
     entry["entry_hash"] = entry_hash
     
-    await db.ledger_entries.insert_one(entry)
+    await db.ledger_entries.insert_one(entry, session=session)
 
 async def commit_transaction(db: AsyncIOMotorDatabase, from_account: str, to_account: str, amount_minor: int, currency: str, biometric_verified: bool, hash_payload: dict, user_id: str = None, request_metadata: dict = None):
     """Commit transaction with enhanced security, compliance, and audit trail"""
@@ -75,109 +76,133 @@ async def commit_transaction(db: AsyncIOMotorDatabase, from_account: str, to_acc
             return {"error": "CONSENT_REQUIRED"}
     
     async with await db.client.start_session() as s:
-        async with s.start_transaction():
-            # Debit sender with enhanced validation
-            sender = await db.accounts.find_one({"_id": from_account})
-            if not sender:
-                return {"error": "SENDER_ACCOUNT_NOT_FOUND"}
-            
-            if sender["balance_minor"] < amount_minor:
-                return {"error": "INSUFFICIENT_FUNDS"}
-            
-            new_sender_balance = sender["balance_minor"] - amount_minor
-            await db.accounts.update_one(
-                {"_id": from_account}, 
-                {"$set": {"balance_minor": new_sender_balance, "last_updated": datetime.utcnow()}}
+        # Balances, the transaction record and its ledger entries commit together or not at all;
+        # with_transaction retries transient errors such as write conflicts
+        result = await s.with_transaction(
+            lambda session: _move_funds(
+                db, session, from_account, to_account, amount_minor, currency, biometric_verified, request_metadata
             )
-            
-            # Credit receiver with validation
-            receiver = await db.accounts.find_one({"_id": to_account})
-            if not receiver:
-                return {"error": "RECEIVER_ACCOUNT_NOT_FOUND"}
-            
-            new_receiver_balance = receiver["balance_minor"] + amount_minor
-            await db.accounts.update_one(
-                {"_id": to_account}, 
-                {"$set": {"balance_minor": new_receiver_balance, "last_updated": datetime.utcnow()}}
-            )
-            
-            # Create enhanced transaction record
-            txn_doc = {
-                "type": "p2p",
-                "from_account": from_account,
-                "to_account": to_account,
-                "amount_minor": amount_minor,
-                "currency": currency,
-                "status": "success",
-                "biometric_verified": biometric_verified,
-                "created_at": datetime.utcnow(),
-                "compliance_checks": {
-                    "kyc_verified": True,
-                    "aml_clear": True,
-                    "limits_validated": True
-                },
-                "metadata": request_metadata or {}
-            }
-            
-            txn_result = await db.transactions.insert_one(txn_doc)
-            txn_id = txn_result.inserted_id
-            
-            # Post ledger entries with immutable hashes
-            await post_ledger_entry(db, str(txn_id), from_account, "debit", amount_minor, new_sender_balance)
-            await post_ledger_entry(db, str(txn_id), to_account, "credit", amount_minor, new_receiver_balance)
-            
-            # Create immutable transaction hash
-            hash_data = {
-                "txn_id": str(txn_id),
-                "from_account": from_account,
-                "to_account": to_account,
-                "amount_minor": amount_minor,
-                "currency": currency,
-                "timestamp": txn_doc["created_at"].isoformat(),
-                "sender_balance_after": new_sender_balance,
-                "receiver_balance_after": new_receiver_balance,
-                "biometric_verified": biometric_verified
-            }
-            
-            txn_hash = hashlib.sha256(
-                json.dumps(hash_data, sort_keys=True).encode()
-            ).hexdigest()
-            
-            await db.transactions.update_one(
-                {"_id": txn_id}, 
-                {"$set": {"hash": txn_hash, "hash_data": hash_data}}
-            )
-            
-            # Add to blockchain audit trail
-            try:
-                audit_transactions = [{"_id": str(txn_id), **txn_doc, "hash": txn_hash}]
-                block_hash = await BlockchainAuditTrail.create_audit_block(db, audit_transactions)
-                
-                await db.transactions.update_one(
-                    {"_id": txn_id},
-                    {"$set": {"audit_block_hash": block_hash}}
-                )
-            except Exception as e:
-                # Log audit trail error but don't fail transaction
-                print(f"Audit trail error: {e}")
-            
-            # Log compliance event
-            if user_id:
-                metadata = request_metadata or {}
-                await PaymentEthicsCompliance.log_compliance_event(
-                    db, "transaction_completed", user_id, {
-                        "txn_id": str(txn_id),
-                        "amount": float(amount_decimal),
-                        "hash": txn_hash,
-                        **metadata
-                    }
-                )
-            
-            return {
-                "status": "success",
-                "txn_id": str(txn_id),
-                "hash": txn_hash,
-                "audit_block_hash": block_hash if 'block_hash' in locals() else None,
-                "sender_balance": new_sender_balance,
-                "receiver_balance": new_receiver_balance
+        )
+    if "error" in result:
+        return result
+    
+    txn_id = result["txn_id"]
+    txn_doc = result.pop("txn_doc")
+    PrincipalCache.invalidate_wallet(from_account)
+    PrincipalCache.invalidate_wallet(to_account)
+    
+    # Add to blockchain audit trail
+    block_hash = None
+    try:
+        audit_transactions = [{"_id": txn_id, **txn_doc, "hash": result["hash"]}]
+        block_hash = await BlockchainAuditTrail.create_audit_block(db, audit_transactions)
+        
+        await db.transactions.update_one(
+            {"_id": txn_doc["_id"]},
+            {"$set": {"audit_block_hash": block_hash}}
+        )
+    except Exception as e:
+        # Log audit trail error but don't fail transaction
+        print(f"Audit trail error: {e}")
+    
+    # Log compliance event
+    if user_id:
+        metadata = request_metadata or {}
+        await PaymentEthicsCompliance.log_compliance_event(
+            db, "transaction_completed", user_id, {
+                "txn_id": txn_id,
+                "amount": float(amount_decimal),
+                "hash": result["hash"],
+                **metadata
             }
+        )
+    
+    return {**result, "audit_block_hash": block_hash}
+
+async def _move_funds(db: AsyncIOMotorDatabase, session, from_account: str, to_account: str, amount_minor: int, currency: str, biometric_verified: bool, request_metadata: dict = None):
+    """Debit, credit, transaction record and ledger entries, inside session's transaction"""
+    
+    # Both accounts are checked before either balance changes
+    sender = await db.accounts.find_one({"_id": from_account}, session=session)
+    if not sender:
+        return {"error": "SENDER_ACCOUNT_NOT_FOUND"}
+    
+    if sender["balance_minor"] < amount_minor:
+        return {"error": "INSUFFICIENT_FUNDS"}
+    
+    receiver = await db.accounts.find_one({"_id": to_account}, session=session)
+    if not receiver:
+        return {"error": "RECEIVER_ACCOUNT_NOT_FOUND"}
+    
+    # Debit sender
+    new_sender_balance = sender["balance_minor"] - amount_minor
+    await db.accounts.update_one(
+        {"_id": from_account}, 
+        {"$set": {"balance_minor": new_sender_balance, "last_updated": datetime.utcnow()}},
+        session=session
+    )
+    
+    # Credit receiver
+    new_receiver_balance = receiver["balance_minor"] + amount_minor
+    await db.accounts.update_one(
+        {"_id": to_account}, 
+        {"$set": {"balance_minor": new_receiver_balance, "last_updated": datetime.utcnow()}},
+        session=session
+    )
+    
+    # Create enhanced transaction record; a metadata.queue_id already committed fails here
+    txn_doc = {
+        "type": "p2p",
+        "from_account": from_account,
+        "to_account": to_account,
+        "amount_minor": amount_minor,
+        "currency": currency,
+        "status": "success",
+        "biometric_verified": biometric_verified,
+        "created_at": datetime.utcnow(),
+        "compliance_checks": {
+            "kyc_verified": True,
+            "aml_clear": True,
+            "limits_validated": True
+        },
+        "metadata": request_metadata or {}
+    }
+    
+    txn_result = await db.transactions.insert_one(txn_doc, session=session)
+    txn_id = txn_result.inserted_id
+    
+    # Post ledger entries with immutable hashes
+    await post_ledger_entry(db, str(txn_id), from_account, "debit", amount_minor, new_sender_balance, session)
+    await post_ledger_entry(db, str(txn_id), to_account, "credit", amount_minor, new_receiver_balance, session)
+    
+    # Create immutable transaction hash
+    hash_data = {
+        "txn_id": str(txn_id),
+        "from_account": from_account,
+        "to_account": to_account,
+        "amount_minor": amount_minor,
+        "currency": currency,
+        "timestamp": txn_doc["created_at"].isoformat(),
+        "sender_balance_after": new_sender_balance,
+        "receiver_balance_after": new_receiver_balance,
+        "biometric_verified": biometric_verified
+    }
+    
+    txn_hash = hashlib.sha256(
+        json.dumps(hash_data, sort_keys=True).encode()
+    ).hexdigest()
+    
+    await db.transactions.update_one(
+        {"_id": txn_id}, 
+        {"$set": {"hash": txn_hash, "hash_data": hash_data}},
+        session=session
+    )
+    
+    return {
+        "status": "success",
+        "txn_id": str(txn_id),
+        "hash": txn_hash,
+        "sender_balance": new_sender_balance,
+        "receiver_balance": new_receiver_balance,
+        "txn_doc": txn_doc
+    }
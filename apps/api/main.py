@@ -1,9 +1,46 @@
 
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from biometric import shutdown_batch_pool
+from config import config
+from db import get_db
+from integrity_client import close_integrity_client
+from session_management import SessionManager
+from security import revocation_list
+from rate_limit_middleware import RateLimitMiddleware
+from principal_cache import PrincipalScopeMiddleware
+from notification_service import NotificationService
+from notification_stream import notification_hub
 from routers import auth, devices, payments, accounts, transactions, receipts, merchants, nonce, add_money, feature_flags, optional_payments, contacts, devices_manage, scheduled_payments, admin, notifications
 
-app = FastAPI(title="BiPay API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    config.validate_nonce_config()
+    db = get_db()
+    background_tasks = [
+        asyncio.create_task(SessionManager.activity.run(db)),
+        asyncio.create_task(SessionManager.run_sweeper(db)),
+        asyncio.create_task(revocation_list.run(db)),
+        asyncio.create_task(notification_hub.run(db)),
+    ]
+    yield
+    notification_hub.close()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await NotificationService.batcher.close()
+    await close_integrity_client()
+    shutdown_batch_pool()
+
+app = FastAPI(title="BiPay API", version="1.0.0", lifespan=lifespan)
+
+# Innermost: only requests that pass rate limiting get a principal scope
+app.add_middleware(PrincipalScopeMiddleware)
+
+# Added before CORS so that 429 responses still carry CORS headers
+app.add_middleware(RateLimitMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
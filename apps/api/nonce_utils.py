@@ -1,25 +1,100 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import struct
 import time
-import random
-import string
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from config import config
 
 NONCE_TTL = 60  # seconds
 
+# Stateless nonces: "s1." + base64url(expiry | random | truncated HMAC over user, device, expiry, random)
+STATELESS_PREFIX = "s1."
+_RANDOM_BYTES = 16
+_MAC_BYTES = 16
+_EXPIRY = struct.Struct(">I")
+
+def _expiry_datetime(timestamp: int) -> datetime:
+    # Naive UTC, like every other datetime stored by the API
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).replace(tzinfo=None)
+
+def _nonce_mac(user_id: str, device_id: str, body: bytes) -> bytes:
+    if not config.NONCE_HMAC_SECRET:
+        raise RuntimeError("NONCE_HMAC_SECRET is not configured")
+    message = b"|".join((b"nonce-v1", user_id.encode(), device_id.encode(), body))
+    return hmac.new(config.NONCE_HMAC_SECRET.encode(), message, hashlib.sha256).digest()[:_MAC_BYTES]
+
+def issue_stateless_nonce(user_id: str, device_id: str, ttl: int = NONCE_TTL) -> str:
+    """Issue a self-verifying nonce without touching the database"""
+    body = _EXPIRY.pack(int(time.time()) + ttl) + secrets.token_bytes(_RANDOM_BYTES)
+    token = body + _nonce_mac(user_id, device_id, body)
+    return STATELESS_PREFIX + base64.urlsafe_b64encode(token).rstrip(b"=").decode()
+
+def open_stateless_nonce(nonce: str, user_id: str, device_id: str):
+    """Return (expires_at, random bytes) for an authentic, unexpired nonce, else None"""
+    if not nonce or not nonce.startswith(STATELESS_PREFIX):
+        return None
+    encoded = nonce[len(STATELESS_PREFIX):]
+    try:
+        token = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+    except (ValueError, TypeError):
+        return None
+    if len(token) != _EXPIRY.size + _RANDOM_BYTES + _MAC_BYTES:
+        return None
+    
+    body, mac = token[:-_MAC_BYTES], token[-_MAC_BYTES:]
+    if not hmac.compare_digest(mac, _nonce_mac(user_id, device_id, body)):
+        return None
+    
+    (expires_at,) = _EXPIRY.unpack(body[:_EXPIRY.size])
+    if expires_at < int(time.time()):
+        return None
+    return expires_at, body[_EXPIRY.size:]
+
 async def issue_nonce(db: AsyncIOMotorDatabase, user_id: str, device_id: str) -> str:
-    nonce = ''.join(random.choices(string.ascii_letters + string.digits, k=32))
-    expires_at = int(time.time()) + NONCE_TTL
+    if config.NONCE_MODE == "stateless":
+        return issue_stateless_nonce(user_id, device_id)
+    
+    nonce = secrets.token_urlsafe(24)
     await db.nonces.insert_one({
         "nonce": nonce,
         "user_id": user_id,
         "device_id": device_id,
-        "expires_at": expires_at,
+        # datetime so the TTL index on expires_at can purge used and stale nonces
+        "expires_at": _expiry_datetime(int(time.time()) + NONCE_TTL),
         "used": False
     })
     return nonce
 
 async def verify_nonce(db: AsyncIOMotorDatabase, nonce: str, user_id: str, device_id: str) -> bool:
-    doc = await db.nonces.find_one({"nonce": nonce, "user_id": user_id, "device_id": device_id, "used": False})
-    if not doc or doc["expires_at"] < int(time.time()):
-        return False
-    await db.nonces.update_one({"nonce": nonce}, {"$set": {"used": True}})
-    return True
+    if nonce and nonce.startswith(STATELESS_PREFIX):
+        opened = open_stateless_nonce(nonce, user_id, device_id)
+        if opened is None:
+            return False
+        expires_at, random_part = opened
+        # Single use: the consumed set rejects a second insert of the same nonce
+        try:
+            await db.consumed_nonces.insert_one({
+                "_id": random_part,
+                "expires_at": _expiry_datetime(expires_at)
+            })
+        except DuplicateKeyError:
+            return False
+        return True
+    
+    # Single conditional update: only one concurrent caller can flip used -> True
+    doc = await db.nonces.find_one_and_update(
+        {
+            "nonce": nonce,
+            "user_id": user_id,
+            "device_id": device_id,
+            "used": False,
+            "expires_at": {"$gte": datetime.utcnow()}
+        },
+        {"$set": {"used": True}},
+        projection={"_id": 1}
+    )
+    return doc is not None
@@ -1,15 +1,97 @@
 """
 Real-time Notification System
 Multi-channel notification delivery with fraud alerts
+
+Each event is stored once in `notifications`; the in-app feed (in_app),
+history (history) and push/email delivery are views of that record. Push
+is queued on the record (push_status) and sent by the worker's PushDispatcher.
 """
 
 import asyncio
 import json
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Set, Tuple
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from bson import ObjectId
+from pymongo import UpdateOne
+from principal_cache import PrincipalCache
+from pagination import fetch_page
+from push_dispatcher import PUSH_RANKS
 import logging
 
+class NotificationBatcher:
+    """
+    Coalesces notifications submitted within MAX_DELAY into one deliver_many call
+
+    Submitters wait until their batch is written, so callers keep
+    per-notification semantics while concurrent requests share round trips.
+    """
+    
+    MAX_BATCH = 500
+    MAX_DELAY = 0.01  # seconds
+    
+    def __init__(self, max_batch: int = MAX_BATCH, max_delay: float = MAX_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: List[Tuple[AsyncIOMotorDatabase, Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.Task] = None
+        # Flushes started for full batches, held until done so they are not garbage collected
+        self._flushes: Set[asyncio.Task] = set()
+    
+    async def submit(self, db: AsyncIOMotorDatabase, notification_data: Dict[str, Any]):
+        """Queue a notification and wait for its batch; returns the notification id"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((db, notification_data, future))
+        
+        if len(self._pending) >= self.max_batch:
+            flush = asyncio.create_task(self.flush())
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+        
+        return await future
+    
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_delay)
+        await self.flush()
+    
+    async def flush(self):
+        """Deliver everything queued so far"""
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        
+        # Normally a single database; keep batches per database regardless
+        by_db: Dict[int, list] = {}
+        for entry in batch:
+            by_db.setdefault(id(entry[0]), []).append(entry)
+        
+        for entries in by_db.values():
+            try:
+                notification_ids = await NotificationService.deliver_many(
+                    entries[0][0], [notification_data for _, notification_data, _ in entries]
+                )
+            except Exception as e:
+                for _, _, future in entries:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, _, future), notification_id in zip(entries, notification_ids):
+                if not future.done():
+                    future.set_result(notification_id)
+    
+    async def close(self):
+        """Deliver what is queued and wait for flushes in progress, e.g. at shutdown"""
+        if self._timer is not None:
+            self._timer.cancel()
+        await self.flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+    
+    def __len__(self) -> int:
+        return len(self._pending)
+
 class NotificationService:
     """Advanced notification system with multiple channels"""
     
@@ -25,6 +107,15 @@ class NotificationService:
     CHANNEL_EMAIL = "email"
     CHANNEL_IN_APP = "in_app"
     
+    # Unread counters (notification_counters) are repaired from the records hourly
+    COUNTER_REPAIR_INTERVAL = 3600  # seconds
+    COUNTER_REPAIR_BATCH = 1000
+    
+    # Fields returned by list views; the data payload is opt-in
+    LIST_FIELDS = {"type": 1, "priority": 1, "title": 1, "message": 1, "read": 1, "created_at": 1}
+    
+    batcher = NotificationBatcher()
+    
     @staticmethod
     async def send_fraud_alert(
         db: AsyncIOMotorDatabase,
@@ -34,9 +125,31 @@ class NotificationService:
     ):
         """Send immediate fraud alert to user"""
         
+        await NotificationService._deliver_notification(
+            db, NotificationService._fraud_alert(user_id, fraud_data, transaction_data)
+        )
+    
+    @staticmethod
+    async def send_fraud_alerts(
+        db: AsyncIOMotorDatabase,
+        alerts: List[Tuple[str, Dict[str, Any], Dict[str, Any]]]
+    ) -> int:
+        """Send fraud alerts for many (user_id, fraud_data, transaction_data) at once"""
+        
+        return await NotificationService._deliver_in_batches(db, [
+            NotificationService._fraud_alert(user_id, fraud_data, transaction_data)
+            for user_id, fraud_data, transaction_data in alerts
+        ])
+    
+    @staticmethod
+    def _fraud_alert(
+        user_id: str,
+        fraud_data: Dict[str, Any],
+        transaction_data: Dict[str, Any]
+    ) -> Dict[str, Any]:
         alert_message = f"Suspicious transaction detected: ${transaction_data.get('amount_minor', 0)/100:.2f}"
         
-        notification_data = {
+        return {
             "user_id": user_id,
             "type": "fraud_alert",
             "priority": NotificationService.PRIORITY_CRITICAL,
@@ -53,8 +166,6 @@ class NotificationService:
                 NotificationService.CHANNEL_IN_APP
             ]
         }
-        
-        await NotificationService._deliver_notification(db, notification_data)
     
     @staticmethod
     async def send_transaction_notification(
@@ -62,9 +173,10 @@ class NotificationService:
         user_id: str,
         transaction_type: str,
         transaction_data: Dict[str, Any],
-        success: bool = True
+        success: bool = True,
+        history: Optional[Dict[str, Any]] = None
     ):
-        """Send transaction completion notification"""
+        """Send transaction completion notification, optionally recorded as history"""
         
         amount = transaction_data.get("amount_minor", 0) / 100
         
@@ -86,9 +198,56 @@ class NotificationService:
             "data": transaction_data,
             "channels": [NotificationService.CHANNEL_PUSH, NotificationService.CHANNEL_IN_APP]
         }
+        if history:
+            notification_data["history"] = history
+        
+        await NotificationService._deliver_notification(db, notification_data)
+    
+    @staticmethod
+    async def notify(
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        title: str,
+        message: str,
+        notification_type: str,
+        history: Optional[Dict[str, Any]] = None
+    ):
+        """Send a plain in-app notification"""
+        
+        notification_data = {
+            "user_id": user_id,
+            "type": notification_type,
+            "priority": NotificationService.PRIORITY_LOW,
+            "title": title,
+            "message": message,
+            "data": {},
+            "channels": [NotificationService.CHANNEL_IN_APP]
+        }
+        if history:
+            notification_data["history"] = history
         
         await NotificationService._deliver_notification(db, notification_data)
     
+    @staticmethod
+    async def record_history(
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        action: str,
+        details: Dict[str, Any]
+    ):
+        """Record an account history entry without notifying the user"""
+        
+        await NotificationService._deliver_notification(db, {
+            "user_id": user_id,
+            "type": "history",
+            "priority": NotificationService.PRIORITY_LOW,
+            "title": action,
+            "message": "",
+            "data": {},
+            "channels": [],
+            "history": {"action": action, "details": details}
+        })
+    
     @staticmethod
     async def send_security_notification(
         db: AsyncIOMotorDatabase,
@@ -152,6 +311,30 @@ class NotificationService:
     ):
         """Send compliance-related notifications"""
         
+        await NotificationService._deliver_notification(
+            db, NotificationService._compliance_notification(user_id, compliance_type, details)
+        )
+    
+    @staticmethod
+    async def send_compliance_broadcast(
+        db: AsyncIOMotorDatabase,
+        user_ids: List[str],
+        compliance_type: str,
+        details: Dict[str, Any]
+    ) -> int:
+        """Send the same compliance notification to many users"""
+        
+        return await NotificationService._deliver_in_batches(db, [
+            NotificationService._compliance_notification(user_id, compliance_type, details)
+            for user_id in user_ids
+        ])
+    
+    @staticmethod
+    def _compliance_notification(
+        user_id: str,
+        compliance_type: str,
+        details: Dict[str, Any]
+    ) -> Dict[str, Any]:
         compliance_messages = {
             "kyc_required": {
                 "title": "Verification Required",
@@ -181,7 +364,7 @@ class NotificationService:
             "priority": NotificationService.PRIORITY_MEDIUM
         })
         
-        notification_data = {
+        return {
             "user_id": user_id,
             "type": f"compliance_{compliance_type}",
             "priority": event_config["priority"],
@@ -194,8 +377,18 @@ class NotificationService:
                 NotificationService.CHANNEL_EMAIL
             ]
         }
+    
+    @staticmethod
+    async def _deliver_in_batches(
+        db: AsyncIOMotorDatabase,
+        notifications: List[Dict[str, Any]]
+    ) -> int:
+        """Deliver a large fan-out in chunks of NotificationBatcher.MAX_BATCH"""
         
-        await NotificationService._deliver_notification(db, notification_data)
+        batch_size = NotificationService.batcher.max_batch
+        for start in range(0, len(notifications), batch_size):
+            await NotificationService.deliver_many(db, notifications[start:start + batch_size])
+        return len(notifications)
     
     @staticmethod
     async def _deliver_notification(
@@ -204,144 +397,119 @@ class NotificationService:
     ):
         """Internal method to deliver notifications through various channels"""
         
-        # Store notification in database
-        notification_record = {
-            **notification_data,
-            "created_at": datetime.utcnow(),
-            "status": "pending",
-            "delivery_attempts": 0,
-            "delivered_channels": []
-        }
-        
-        result = await db.notifications.insert_one(notification_record)
-        notification_id = result.inserted_id
-        
-        # Deliver through each channel
-        delivery_tasks = []
-        for channel in notification_data.get("channels", []):
-            if channel == NotificationService.CHANNEL_PUSH:
-                delivery_tasks.append(
-                    NotificationService._send_push_notification(
-                        db, notification_data["user_id"], notification_data
-                    )
-                )
-            elif channel == NotificationService.CHANNEL_IN_APP:
-                delivery_tasks.append(
-                    NotificationService._create_in_app_notification(
-                        db, notification_data["user_id"], notification_data
-                    )
-                )
-            elif channel == NotificationService.CHANNEL_EMAIL:
-                delivery_tasks.append(
-                    NotificationService._send_email_notification(
-                        db, notification_data["user_id"], notification_data
-                    )
-                )
-        
-        # Execute delivery tasks
-        if delivery_tasks:
-            delivery_results = await asyncio.gather(*delivery_tasks, return_exceptions=True)
-            
-            # Update notification status
-            successful_channels = []
-            for i, result in enumerate(delivery_results):
-                if not isinstance(result, Exception):
-                    successful_channels.append(notification_data["channels"][i])
-            
-            await db.notifications.update_one(
-                {"_id": notification_id},
-                {
-                    "$set": {
-                        "status": "delivered" if successful_channels else "failed",
-                        "delivered_channels": successful_channels,
-                        "delivery_attempts": 1,
-                        "delivered_at": datetime.utcnow()
-                    }
-                }
-            )
+        # Concurrent notifications share one bulk write (see NotificationBatcher)
+        return await NotificationService.batcher.submit(db, notification_data)
     
     @staticmethod
-    async def _send_push_notification(
+    async def deliver_many(
         db: AsyncIOMotorDatabase,
-        user_id: str,
-        notification_data: Dict[str, Any]
-    ) -> bool:
-        """Send push notification to user's devices"""
+        notifications: List[Dict[str, Any]]
+    ) -> List[Any]:
+        """Store and deliver a batch of notifications with one round trip per step"""
         
-        try:
-            # Get user's FCM tokens
-            user_devices = await db.devices.find({
-                "user_id": user_id,
-                "fcm_token": {"$exists": True, "$ne": None}
-            }).to_list(10)
-            
-            if not user_devices:
-                return False
-            
-            # Prepare push notification payload
-            push_payload = {
-                "notification": {
-                    "title": notification_data["title"],
-                    "body": notification_data["message"]
-                },
-                "data": {
-                    "type": notification_data["type"],
-                    "priority": notification_data["priority"],
-                    **notification_data.get("data", {})
-                }
-            }
-            
-            # Send to each device (in production, use FCM batch API)
-            for device in user_devices:
-                # Simulate FCM call (replace with actual FCM in production)
-                logging.info(f"Push notification sent to device {device['_id']}: {push_payload}")
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Push notification failed for user {user_id}: {e}")
-            return False
-    
-    @staticmethod
-    async def _create_in_app_notification(
-        db: AsyncIOMotorDatabase,
-        user_id: str,
-        notification_data: Dict[str, Any]
-    ) -> bool:
-        """Create in-app notification"""
+        if not notifications:
+            return []
         
-        try:
-            in_app_notification = {
-                "user_id": user_id,
-                "type": notification_data["type"],
-                "priority": notification_data["priority"],
-                "title": notification_data["title"],
-                "message": notification_data["message"],
-                "data": notification_data.get("data", {}),
-                "read": False,
-                "created_at": datetime.utcnow()
+        # Store each event once; the in-app feed and history read the same record
+        now = datetime.utcnow()
+        records = []
+        for notification_data in notifications:
+            channels = notification_data.get("channels", [])
+            in_app = NotificationService.CHANNEL_IN_APP in channels
+            record = {
+                **notification_data,
+                "in_app": in_app,
+                "read": not in_app,
+                "created_at": now,
+                "status": "pending" if channels else "recorded",
+                "delivery_attempts": 0,
+                "delivered_channels": []
             }
-            
-            await db.in_app_notifications.insert_one(in_app_notification)
-            return True
-            
-        except Exception as e:
-            logging.error(f"In-app notification failed for user {user_id}: {e}")
-            return False
+            if NotificationService.CHANNEL_PUSH in channels:
+                record.update({
+                    "push_status": "queued",
+                    "push_rank": PUSH_RANKS.get(notification_data.get("priority"), len(PUSH_RANKS)),
+                    "push_attempts": 0,
+                    "next_push_at": now
+                })
+            records.append(record)
+        result = await db.notifications.insert_many(records)
+        notification_ids = result.inserted_ids
+        
+        unread: Dict[str, int] = {}
+        for record in records:
+            if record["in_app"]:
+                unread[record["user_id"]] = unread.get(record["user_id"], 0) + 1
+        await NotificationService._adjust_unread(db, unread)
+        
+        # Group by channel, then deliver each channel for the whole batch
+        channel_senders = {
+            NotificationService.CHANNEL_EMAIL: NotificationService._send_email_notifications,
+        }
+        by_channel: Dict[str, List[int]] = {}
+        for index, notification_data in enumerate(notifications):
+            for channel in notification_data.get("channels", []):
+                if channel in channel_senders:
+                    by_channel.setdefault(channel, []).append(index)
+        
+        # In-app delivery is the stored record itself
+        delivered = [
+            {NotificationService.CHANNEL_IN_APP} if record["in_app"] else set()
+            for record in records
+        ]
+        if not any(record["status"] == "pending" for record in records):
+            return notification_ids
+        
+        channels = list(by_channel)
+        delivery_results = await asyncio.gather(*[
+            channel_senders[channel](db, [(index, notifications[index]) for index in by_channel[channel]])
+            for channel in channels
+        ], return_exceptions=True)
+        
+        for channel, outcome in zip(channels, delivery_results):
+            if isinstance(outcome, Exception):
+                logging.error(f"{channel} delivery failed for {len(by_channel[channel])} notifications: {outcome}")
+                continue
+            for index in outcome:
+                delivered[index].add(channel)
+        
+        # Update notification status; the dispatcher may already be recording push
+        delivered_at = datetime.utcnow()
+        operations = []
+        for index, notification_id in enumerate(notification_ids):
+            record = records[index]
+            if record["status"] != "pending":
+                continue
+            update = {"$set": {"delivery_attempts": 1, "delivered_at": delivered_at}}
+            if delivered[index]:
+                update["$set"]["status"] = "delivered"
+                update["$addToSet"] = {"delivered_channels": {"$each": [
+                    channel for channel in record["channels"] if channel in delivered[index]
+                ]}}
+            elif "push_status" not in record:
+                update["$set"]["status"] = "failed"
+            operations.append(UpdateOne({"_id": notification_id}, update))
+        await db.notifications.bulk_write(operations, ordered=False)
+        
+        return notification_ids
     
     @staticmethod
-    async def _send_email_notification(
+    async def _send_email_notifications(
         db: AsyncIOMotorDatabase,
-        user_id: str,
-        notification_data: Dict[str, Any]
-    ) -> bool:
-        """Send email notification"""
+        items: List[Tuple[int, Dict[str, Any]]]
+    ) -> List[int]:
+        """Send email notifications; returns delivered indexes"""
         
-        try:
-            # Get user email
-            user = await db.users.find_one({"_id": user_id})
+        # Get user emails
+        users = await PrincipalCache.get_users(
+            db, [notification_data["user_id"] for _, notification_data in items]
+        )
+        
+        delivered = []
+        for index, notification_data in items:
+            user = users.get(notification_data["user_id"])
             if not user or not user.get("email"):
-                return False
+                continue
             
             # Prepare email (in production, use proper email service)
             email_data = {
@@ -354,32 +522,46 @@ class NotificationService:
             
             # Simulate email sending (replace with actual email service in production)
             logging.info(f"Email notification sent to {user['email']}: {email_data}")
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Email notification failed for user {user_id}: {e}")
-            return False
+            delivered.append(index)
+        
+        return delivered
     
     @staticmethod
     async def get_user_notifications(
         db: AsyncIOMotorDatabase,
         user_id: str,
         limit: int = 50,
-        unread_only: bool = False
-    ) -> List[Dict[str, Any]]:
-        """Get user's in-app notifications"""
+        unread_only: bool = False,
+        cursor: Optional[str] = None,
+        include_data: bool = False
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of the user's in-app notifications and the cursor for the next"""
         
-        query = {"user_id": user_id}
+        query = {"user_id": user_id, "in_app": True}
         if unread_only:
             query["read"] = False
         
-        notifications = await db.in_app_notifications.find(query)\
+        projection = dict(NotificationService.LIST_FIELDS)
+        if include_data:
+            projection["data"] = 1
+        
+        notifications, next_cursor = await fetch_page(db.notifications, query, limit, cursor, projection)
+        for notification in notifications:
+            notification["id"] = str(notification.pop("_id"))
+        return notifications, next_cursor
+    
+    @staticmethod
+    async def get_user_history(
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """Get user's account history entries"""
+        
+        return await db.notifications.find({"user_id": user_id, "history": {"$exists": True}})\
             .sort("created_at", -1)\
             .limit(limit)\
             .to_list(limit)
-        
-        return notifications
     
     @staticmethod
     async def mark_notification_read(
@@ -390,10 +572,126 @@ class NotificationService:
         """Mark notification as read"""
         
         try:
-            result = await db.in_app_notifications.update_one(
-                {"_id": notification_id, "user_id": user_id},
+            query = {"_id": ObjectId(notification_id), "user_id": user_id, "in_app": True}
+            result = await db.notifications.update_one(
+                {**query, "read": False},
                 {"$set": {"read": True, "read_at": datetime.utcnow()}}
             )
-            return result.modified_count > 0
+            if result.modified_count:
+                await NotificationService._adjust_unread(db, {user_id: -1})
+                return True
+            # Already read
+            return await db.notifications.count_documents(query, limit=1) > 0
         except Exception:
             return False
+    
+    @staticmethod
+    async def mark_all_notifications_read(db: AsyncIOMotorDatabase, user_id: str) -> int:
+        """Mark every unread in-app notification as read; returns how many changed"""
+        
+        result = await db.notifications.update_many(
+            {"user_id": user_id, "in_app": True, "read": False},
+            {"$set": {"read": True, "read_at": datetime.utcnow()}}
+        )
+        # Notifications arriving meanwhile stay unread and keep their increment
+        await NotificationService._adjust_unread(db, {user_id: -result.modified_count})
+        return result.modified_count
+    
+    @staticmethod
+    async def get_unread_count(db: AsyncIOMotorDatabase, user_id: str) -> int:
+        """Unread in-app notifications, read from the user's counter"""
+        
+        counter = await db.notification_counters.find_one({"_id": user_id}, {"unread": 1})
+        return max(0, counter["unread"]) if counter else 0
+    
+    @staticmethod
+    async def _adjust_unread(db: AsyncIOMotorDatabase, deltas: Dict[str, int]):
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"_id": user_id}, {"$inc": {"unread": delta}, "$set": {"updated_at": now}}, upsert=True)
+            for user_id, delta in deltas.items()
+            if delta
+        ]
+        if operations:
+            await db.notification_counters.bulk_write(operations, ordered=False)
+    
+    @staticmethod
+    async def repair_unread_counters(
+        db: AsyncIOMotorDatabase,
+        user_ids: Optional[List[str]] = None
+    ) -> int:
+        """
+        Recompute unread counters from the notifications (all users, or user_ids)
+        
+        Users are recounted COUNTER_REPAIR_BATCH at a time. A corrected value
+        is only written if the counter still holds what was read before the
+        recount, so increments landing meanwhile are never overwritten; such
+        counters are left for the next run. Returns how many were corrected.
+        """
+        
+        batch = NotificationService.COUNTER_REPAIR_BATCH
+        repaired = 0
+        if user_ids is not None:
+            for start in range(0, len(user_ids), batch):
+                repaired += await NotificationService._repair_counter_batch(db, user_ids[start:start + batch])
+            return repaired
+        
+        last_id = None
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            counters = await db.notification_counters.find(query, {"unread": 1})\
+                .sort("_id", 1)\
+                .limit(batch)\
+                .to_list(batch)
+            if not counters:
+                return repaired
+            repaired += await NotificationService._repair_counter_batch(
+                db, [counter["_id"] for counter in counters], counters
+            )
+            last_id = counters[-1]["_id"]
+    
+    @staticmethod
+    async def _repair_counter_batch(
+        db: AsyncIOMotorDatabase,
+        user_ids: List[str],
+        counters: Optional[List[Dict[str, Any]]] = None
+    ) -> int:
+        if counters is None:
+            counters = await db.notification_counters.find({"_id": {"$in": user_ids}}, {"unread": 1})\
+                .to_list(len(user_ids))
+        observed = {counter["_id"]: counter.get("unread", 0) for counter in counters}
+        
+        actual = {}
+        async for row in db.notifications.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}, "in_app": True, "read": False}},
+            {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}
+        ]):
+            actual[row["_id"]] = row["unread"]
+        
+        now = datetime.utcnow()
+        operations = []
+        for user_id in user_ids:
+            unread = actual.get(user_id, 0)
+            fields = {"unread": unread, "updated_at": now, "repaired_at": now}
+            if user_id not in observed:
+                # A delivery creating the counter meanwhile wins
+                if unread:
+                    operations.append(UpdateOne({"_id": user_id}, {"$setOnInsert": fields}, upsert=True))
+            elif observed[user_id] != unread:
+                operations.append(UpdateOne({"_id": user_id, "unread": observed[user_id]}, {"$set": fields}))
+        
+        if not operations:
+            return 0
+        result = await db.notification_counters.bulk_write(operations, ordered=False)
+        return result.modified_count + result.upserted_count
+    
+    @staticmethod
+    async def run_counter_repair(db: AsyncIOMotorDatabase, interval: Optional[float] = None):
+        """Periodically recompute unread counters until cancelled"""
+        interval = interval or NotificationService.COUNTER_REPAIR_INTERVAL
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await NotificationService.repair_unread_counters(db)
+            except Exception as e:
+                logging.error(f"Unread counter repair failed: {e}")
@@ -0,0 +1,177 @@
+"""
+Notification Stream
+Fans one MongoDB change stream out to per-user queues for streaming clients
+"""
+
+import asyncio
+import json
+import logging
+import random
+from typing import Any, Dict, Optional, Set
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure
+from notification_service import NotificationService
+
+# Resume token no longer in the oplog
+CHANGE_STREAM_HISTORY_LOST = 286
+
+# In-app notification inserts and balance changes, trimmed to what clients are sent
+CHANGE_PIPELINE = [
+    {"$match": {"$or": [
+        {"ns.coll": "notifications", "operationType": "insert", "fullDocument.in_app": True},
+        {
+            "ns.coll": "accounts",
+            "operationType": "update",
+            "updateDescription.updatedFields.balance_minor": {"$exists": True}
+        }
+    ]}},
+    {"$project": {
+        "ns": 1,
+        "operationType": 1,
+        "clusterTime": 1,
+        "documentKey": 1,
+        "updateDescription.updatedFields.balance_minor": 1,
+        "fullDocument._id": 1,
+        "fullDocument.user_id": 1,
+        **{f"fullDocument.{field}": 1 for field in NotificationService.LIST_FIELDS}
+    }}
+]
+
+class Subscription:
+    """
+    One connected client's bounded event queue
+
+    A client that falls more than maxsize events behind loses the backlog
+    and receives a single "resync" event instead, telling it to re-fetch
+    the feed and balance; the shared reader never waits on a slow client.
+    """
+
+    def __init__(self, user_id: str, wallet_id: Optional[str], maxsize: int):
+        self.user_id = user_id
+        self.wallet_id = wallet_id
+        self.dropped = 0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            while not self._queue.empty():
+                if self._queue.get_nowait()["event"] != "resync":
+                    self.dropped += 1
+            self._queue.put_nowait({"event": "resync", "id": event["id"], "data": {}})
+
+    def close(self):
+        """End the client's stream after what is already queued"""
+        if self._queue.full():
+            # The client reloads everything when it reconnects
+            while not self._queue.empty():
+                self._queue.get_nowait()
+        self._queue.put_nowait({"event": "close", "id": "", "data": {}})
+    
+    async def get(self) -> Dict[str, Any]:
+        return await self._queue.get()
+
+class NotificationStreamHub:
+    """
+    Shares a single change stream reader between all streaming clients
+
+    Changes are routed to subscriptions by user (notifications) or wallet
+    (balances). The reader keeps the last resume token and reconnects
+    after errors without losing or repeating events; if the token has
+    aged out of the oplog every client is told to resync.
+    """
+
+    QUEUE_SIZE = 64
+    RECONNECT_BASE = 0.5  # seconds
+    RECONNECT_CAP = 30.0
+
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.resume_token: Optional[Dict[str, Any]] = None
+        # ("user", id) / ("wallet", id) -> subscriptions
+        self._routes: Dict[tuple, Set[Subscription]] = {}
+
+    def subscribe(self, user_id: str, wallet_id: Optional[str] = None) -> Subscription:
+        subscription = Subscription(user_id, wallet_id, self.queue_size)
+        for key in self._keys(subscription):
+            self._routes.setdefault(key, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for key in self._keys(subscription):
+            subscribers = self._routes.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._routes[key]
+
+    @staticmethod
+    def _keys(subscription: Subscription):
+        keys = [("user", subscription.user_id)]
+        if subscription.wallet_id:
+            keys.append(("wallet", subscription.wallet_id))
+        return keys
+
+    def __len__(self) -> int:
+        return len({subscription for subscribers in self._routes.values() for subscription in subscribers})
+
+    def dispatch(self, change: Dict[str, Any]):
+        """Route one change stream event to its subscribers"""
+        if change["ns"]["coll"] == "notifications":
+            notification = dict(change["fullDocument"])
+            key = ("user", notification.pop("user_id"))
+            notification["id"] = str(notification.pop("_id"))
+            event = {"event": "notification", "id": notification["id"], "data": notification}
+        else:
+            wallet_id = change["documentKey"]["_id"]
+            key = ("wallet", wallet_id)
+            event = {
+                "event": "balance",
+                "id": f"{wallet_id}:{change.get('clusterTime', '')}",
+                "data": {
+                    "wallet_id": wallet_id,
+                    "balance_minor": change["updateDescription"]["updatedFields"]["balance_minor"]
+                }
+            }
+
+        for subscription in self._routes.get(key, ()):
+            subscription.offer(event)
+
+    def close(self):
+        """End every open stream, e.g. at shutdown; clients reconnect elsewhere"""
+        for subscription in {subscription for subscribers in self._routes.values() for subscription in subscribers}:
+            subscription.close()
+    
+    def _resync_all(self):
+        for subscribers in self._routes.values():
+            for subscription in subscribers:
+                subscription.offer({"event": "resync", "id": "", "data": {}})
+
+    async def run(self, db: AsyncIOMotorDatabase):
+        """Read the change stream until cancelled, resuming after errors"""
+        failures = 0
+        while True:
+            try:
+                async with db.watch(CHANGE_PIPELINE, resume_after=self.resume_token) as stream:
+                    async for change in stream:
+                        self.resume_token = change["_id"]
+                        failures = 0
+                        self.dispatch(change)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, OperationFailure) and e.code == CHANGE_STREAM_HISTORY_LOST:
+                    self.resume_token = None
+                    self._resync_all()
+                logging.warning(f"Notification change stream interrupted: {e}")
+                failures += 1
+                await asyncio.sleep(random.uniform(0, min(self.RECONNECT_CAP, self.RECONNECT_BASE * 2 ** failures)))
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Server-sent event frame for a hub event"""
+    data = json.dumps(event["data"], default=str, separators=(",", ":"))
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {data}\n\n"
+
+notification_hub = NotificationStreamHub()
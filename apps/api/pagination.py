@@ -0,0 +1,70 @@
+"""
+Keyset Pagination
+Opaque cursors over (created_at, _id) for newest- or oldest-first listings
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Every keyset listing sorts on this (or its reverse) and needs a matching compound index
+KEYSET_SORT = [("created_at", -1), ("_id", -1)]
+KEYSET_SORT_ASCENDING = [("created_at", 1), ("_id", 1)]
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Cursor pointing just past doc"""
+    doc_id = doc["_id"]
+    payload = {
+        "t": doc["created_at"].isoformat(),
+        "id": str(doc_id),
+        "oid": isinstance(doc_id, ObjectId)
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, Any]:
+    """(created_at, _id) from a cursor; raises ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        created_at = datetime.fromisoformat(payload["t"])
+        doc_id = ObjectId(payload["id"]) if payload["oid"] else payload["id"]
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise ValueError("Invalid cursor") from e
+    return created_at, doc_id
+
+def keyset_query(query: Dict[str, Any], cursor: Optional[str], ascending: bool = False) -> Dict[str, Any]:
+    """query restricted to documents after cursor"""
+    if not cursor:
+        return query
+    created_at, doc_id = decode_cursor(cursor)
+    past = "$gt" if ascending else "$lt"
+    after = {"$or": [
+        {"created_at": {past: created_at}},
+        {"created_at": created_at, "_id": {past: doc_id}}
+    ]}
+    return {"$and": [query, after]} if query else after
+
+async def fetch_page(
+    collection,
+    query: Dict[str, Any],
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None,
+    ascending: bool = False
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of documents, newest first unless ascending, and the cursor for the next page (None at the end)"""
+
+    if projection is not None:
+        # The keys are needed to build the next cursor
+        projection = {**projection, "created_at": 1, "_id": 1}
+    docs = await collection.find(keyset_query(query, cursor, ascending), projection)\
+        .sort(KEYSET_SORT_ASCENDING if ascending else KEYSET_SORT)\
+        .limit(limit + 1)\
+        .to_list(limit + 1)
+
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
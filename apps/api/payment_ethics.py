@@ -3,6 +3,7 @@ from typing import Dict, Any, Optional
 from decimal import Decimal
 import logging
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from principal_cache import PrincipalCache
 
 class PaymentEthicsCompliance:
     """Ethical payment compliance and AML/KYC validation"""
@@ -92,7 +93,7 @@ class PaymentEthicsCompliance:
     @staticmethod
     async def validate_kyc_status(db: AsyncIOMotorDatabase, user_id: str) -> Dict[str, Any]:
         """Validate user KYC compliance status"""
-        user = await db.users.find_one({"_id": user_id})
+        user = await PrincipalCache.get_user(db, user_id)
         
         if not user:
             return {"valid": False, "reason": "User not found"}
@@ -130,7 +131,7 @@ class PaymentEthicsCompliance:
     @staticmethod
     async def check_aml_sanctions(db: AsyncIOMotorDatabase, user_id: str) -> Dict[str, Any]:
         """Check user against AML sanctions list"""
-        user = await db.users.find_one({"_id": user_id})
+        user = await PrincipalCache.get_user(db, user_id)
         
         if not user:
             return {"clear": False, "reason": "User not found"}
@@ -0,0 +1,136 @@
+"""
+PDF Documents
+Streaming text-and-table PDF writer for statements and receipts
+"""
+
+import zlib
+from typing import BinaryIO, List, Sequence, Tuple
+
+def _escape(text: str) -> bytes:
+    # Standard fonts use WinAnsi; anything outside Latin-1 is replaced
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return text.encode("latin-1", "replace")
+
+class PdfTableWriter:
+    """
+    Writes an A4 PDF to a binary file object one page at a time
+
+    Only the current page's text is held in memory; each finished page is
+    compressed and written out, so documents of any length use constant
+    memory. Every page repeats the title and the column headings.
+    """
+
+    PAGE_WIDTH = 595
+    PAGE_HEIGHT = 842
+    MARGIN = 50
+    FONT_SIZE = 9
+    LINE_HEIGHT = 14
+
+    # Fixed object numbers; pages start after these
+    CATALOG, PAGES, FONT, FONT_BOLD = 1, 2, 3, 4
+
+    def __init__(self, out: BinaryIO, title: str, columns: Sequence[Tuple[str, int]] = ()):
+        """columns: (heading, x offset from the left margin)"""
+        self.out = out
+        self.title = title
+        self.columns = list(columns)
+        self.page_count = 0
+        self._offsets = {}
+        self._written = 0
+        self._next_object = self.FONT_BOLD + 1
+        self._page_objects: List[int] = []
+        self._lines: List[bytes] = []
+        self._y = 0
+
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(self.CATALOG, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(self.FONT, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        self._object(self.FONT_BOLD, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    def _write(self, data: bytes):
+        self.out.write(data)
+        self._written += len(data)
+
+    def _object(self, number: int, body: bytes):
+        self._offsets[number] = self._written
+        self._write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+
+    def _allocate(self) -> int:
+        number = self._next_object
+        self._next_object += 1
+        return number
+
+    def _text(self, x: float, text: str, bold: bool = False, size: int = FONT_SIZE):
+        font = b"/F2" if bold else b"/F1"
+        self._lines.append(
+            b"BT %s %d Tf 1 0 0 1 %.1f %.1f Tm (%s) Tj ET" % (font, size, self.MARGIN + x, self._y, _escape(text))
+        )
+
+    def _start_page(self):
+        self._lines = []
+        self._y = self.PAGE_HEIGHT - self.MARGIN
+        self._text(0, self.title, bold=True, size=12)
+        self._text(self.PAGE_WIDTH - 2 * self.MARGIN - 40, f"Page {self.page_count + 1}")
+        self._y -= 2 * self.LINE_HEIGHT
+        if self.columns:
+            for heading, x in self.columns:
+                self._text(x, heading, bold=True)
+            self._y -= self.LINE_HEIGHT
+
+    def _finish_page(self):
+        content = zlib.compress(b"\n".join(self._lines))
+        content_object, page_object = self._allocate(), self._allocate()
+        self._object(
+            content_object,
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        self._object(page_object, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+        ) % (self.PAGE_WIDTH, self.PAGE_HEIGHT, content_object))
+        self._page_objects.append(page_object)
+        self.page_count += 1
+        self._lines = []
+
+    def _ensure_room(self):
+        if not self._lines:
+            self._start_page()
+        elif self._y < self.MARGIN:
+            self._finish_page()
+            self._start_page()
+
+    def add_line(self, text: str = "", bold: bool = False):
+        """Free text across the page"""
+        self._ensure_room()
+        if text:
+            self._text(0, text, bold=bold)
+        self._y -= self.LINE_HEIGHT
+
+    def add_row(self, values: Sequence[str]):
+        """One table row, aligned with the column headings"""
+        self._ensure_room()
+        for (_, x), value in zip(self.columns, values):
+            self._text(x, value)
+        self._y -= self.LINE_HEIGHT
+
+    def close(self):
+        """Finish the last page and write the page tree, cross-reference table and trailer"""
+        if self._lines or not self._page_objects:
+            if not self._lines:
+                self._start_page()
+            self._finish_page()
+
+        kids = b" ".join(b"%d 0 R" % number for number in self._page_objects)
+        self._object(self.PAGES, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._page_objects)))
+
+        xref_offset = self._written
+        size = self._next_object
+        entries = [b"0000000000 65535 f \n"] + [b"%010d 00000 n \n" % self._offsets[n] for n in range(1, size)]
+        self._write(b"xref\n0 %d\n" % size + b"".join(entries))
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_offset))
+
+def format_minor(amount_minor: int, currency: str = "INR") -> str:
+    """1234567 -> "INR 12,345.67" """
+    sign = "-" if amount_minor < 0 else ""
+    units, cents = divmod(abs(amount_minor), 100)
+    return f"{sign}{currency} {units:,}.{cents:02d}"
@@ -0,0 +1,143 @@
+"""
+Principal Cache
+Request- and process-scoped caching of user, wallet and device documents
+"""
+
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from cache_utils import SingleFlight, TTLCache
+
+# (kind, id) -> document, for the request being served
+_request_scope: ContextVar[Optional[Dict[tuple, Dict[str, Any]]]] = ContextVar(
+    "principal_request_scope", default=None
+)
+
+class PrincipalCache:
+    """
+    Loads users, wallets and devices once and shares them across routers,
+    compliance checks and notifications
+
+    Lookups go through the current request's scope, then a short-lived
+    process cache, then MongoDB (coalesced per document). Writers must call
+    the matching invalidate_* so this process sees the change at once;
+    other processes see it within the TTL. Returned documents are shared
+    and must be treated as read-only.
+    """
+
+    USER_TTL = 30  # seconds
+    DEVICE_TTL = 15
+    WALLET_TTL = 5  # balances move with every payment
+
+    _caches = {
+        "user": TTLCache(maxsize=50_000, ttl=USER_TTL),
+        "device": TTLCache(maxsize=50_000, ttl=DEVICE_TTL),
+        "wallet": TTLCache(maxsize=50_000, ttl=WALLET_TTL),
+    }
+    _collections = {"user": "users", "device": "devices", "wallet": "accounts"}
+    _inflight = SingleFlight()
+
+    @staticmethod
+    async def _get(db: AsyncIOMotorDatabase, kind: str, doc_id: str) -> Optional[Dict[str, Any]]:
+        key = (kind, doc_id)
+        scope = _request_scope.get()
+        if scope is not None and key in scope:
+            return scope[key]
+
+        cache = PrincipalCache._caches[kind]
+        doc = cache.get(doc_id)
+        if doc is None:
+            collection = db[PrincipalCache._collections[kind]]
+            doc = await PrincipalCache._inflight.do(key, lambda: collection.find_one({"_id": doc_id}))
+            if doc is not None:
+                cache.set(doc_id, doc)
+
+        if scope is not None and doc is not None:
+            scope[key] = doc
+        return doc
+
+    @staticmethod
+    async def get_user(db: AsyncIOMotorDatabase, user_id: str) -> Optional[Dict[str, Any]]:
+        return await PrincipalCache._get(db, "user", user_id)
+
+    @staticmethod
+    async def get_users(db: AsyncIOMotorDatabase, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Users by id, fetching every miss in one query"""
+        scope = _request_scope.get()
+        cache = PrincipalCache._caches["user"]
+        users = {}
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            doc = scope.get(("user", user_id)) if scope is not None else None
+            if doc is None:
+                doc = cache.get(user_id)
+            if doc is None:
+                missing.append(user_id)
+            else:
+                users[user_id] = doc
+
+        if missing:
+            async for doc in db.users.find({"_id": {"$in": missing}}):
+                cache.set(doc["_id"], doc)
+                users[doc["_id"]] = doc
+
+        if scope is not None:
+            for user_id, doc in users.items():
+                scope[("user", user_id)] = doc
+        return users
+
+    @staticmethod
+    async def get_wallet(db: AsyncIOMotorDatabase, wallet_id: str) -> Optional[Dict[str, Any]]:
+        return await PrincipalCache._get(db, "wallet", wallet_id)
+
+    @staticmethod
+    async def get_device(
+        db: AsyncIOMotorDatabase,
+        device_id: str,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Device by id, optionally only if it belongs to user_id"""
+        device = await PrincipalCache._get(db, "device", device_id)
+        if device is not None and user_id is not None and device.get("user_id") != user_id:
+            return None
+        return device
+
+    @staticmethod
+    def _invalidate(kind: str, doc_id: str):
+        PrincipalCache._caches[kind].pop(doc_id)
+        scope = _request_scope.get()
+        if scope is not None:
+            scope.pop((kind, doc_id), None)
+
+    @staticmethod
+    def invalidate_user(user_id: str):
+        PrincipalCache._invalidate("user", user_id)
+
+    @staticmethod
+    def invalidate_wallet(wallet_id: str):
+        PrincipalCache._invalidate("wallet", wallet_id)
+
+    @staticmethod
+    def invalidate_device(device_id: str):
+        PrincipalCache._invalidate("device", device_id)
+
+    @staticmethod
+    def clear():
+        for cache in PrincipalCache._caches.values():
+            cache.clear()
+
+class PrincipalScopeMiddleware:
+    """ASGI middleware giving each HTTP request its own principal scope"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = _request_scope.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_scope.reset(token)
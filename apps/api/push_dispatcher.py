@@ -0,0 +1,286 @@
+"""
+Push Delivery Engine
+Sends queued push notifications in provider batches over one pooled HTTP/2 client
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from config import config
+
+# Notification priority -> dispatch order (lower first)
+PUSH_RANKS = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+# Provider error codes, modelled on FCM's
+PERMANENT_ERRORS = {"UNREGISTERED", "INVALID_ARGUMENT", "SENDER_ID_MISMATCH"}
+TRANSIENT_STATUS = {429, 500, 502, 503, 504}
+
+class PushProviderError(Exception):
+    """A provider batch call failed after all retries"""
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class PushProvider:
+    """
+    FCM-style push provider client
+
+    Each call sends up to MAX_BATCH messages (one per device token) in one
+    request, and the response carries one result per message in order.
+    Throttling, server errors and transport failures are retried with
+    jittered backoff on the same pooled connections, honouring Retry-After
+    unless the wait would run past the caller's deadline.
+    """
+
+    MAX_BATCH = 500
+    RETRIES = 3
+    BACKOFF_BASE = 0.2  # seconds
+    BACKOFF_CAP = 5.0
+
+    def __init__(
+        self,
+        base_url: str = config.PUSH_PROVIDER_URL,
+        api_key: str = config.PUSH_API_KEY,
+        timeout: float = 10.0,
+        max_connections: int = 10,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.timeout = timeout
+        try:
+            import h2  # noqa: F401
+            http2 = transport is None
+        except ImportError:
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=timeout,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            transport=transport
+        )
+
+    async def send_each(self, messages: List[Dict[str, Any]], deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Send a batch; returns {"success": bool, "error": code} per message
+
+        deadline is a time.monotonic() value; no retry is started that could
+        still be running then, and PushProviderError is raised instead.
+        """
+        if len(messages) > self.MAX_BATCH:
+            raise ValueError(f"At most {self.MAX_BATCH} messages per batch")
+
+        for attempt in range(self.RETRIES + 1):
+            retry_after = None
+            try:
+                response = await self._client.post("/v1/messages:sendEach", json={"messages": messages})
+            except httpx.TransportError as e:
+                failure = type(e).__name__
+            else:
+                if response.status_code == 200:
+                    return [
+                        {"success": bool(result.get("success")), "error": (result.get("error") or {}).get("code")}
+                        for result in response.json()["responses"]
+                    ]
+                if response.status_code not in TRANSIENT_STATUS:
+                    raise PushProviderError(f"Push provider returned {response.status_code}")
+                failure = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("retry-after")
+
+            if attempt == self.RETRIES:
+                break
+            delay = _backoff(attempt, self.BACKOFF_BASE, self.BACKOFF_CAP)
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            if deadline is not None and time.monotonic() + delay + self.timeout > deadline:
+                failure += f", no time left to retry after {delay:.1f}s"
+                break
+            await asyncio.sleep(delay)
+
+        raise PushProviderError(f"Push provider unavailable: {failure}")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+def _push_message(token: str, notification: Dict[str, Any]) -> Dict[str, Any]:
+    # FCM data payloads are string maps
+    data = {
+        "type": notification["type"],
+        "priority": notification["priority"],
+        **notification.get("data", {})
+    }
+    return {
+        "token": token,
+        "notification": {"title": notification["title"], "body": notification["message"]},
+        "data": {key: value if isinstance(value, str) else json.dumps(value, default=str) for key, value in data.items()},
+        "android": {"priority": "high" if notification["priority"] in ("critical", "high") else "normal"}
+    }
+
+class PushDispatcher:
+    """
+    Drains notifications whose push_status is "queued"
+
+    Each cycle claims up to CLAIM_LIMIT notifications, most urgent first,
+    resolves every recipient's device tokens in one query and sends the
+    messages in provider batches concurrently. Outcomes are written back
+    with one bulk write, and tokens the provider reports as invalid are
+    removed from devices in one update.
+    """
+
+    CLAIM_LIMIT = 2000
+    MAX_ATTEMPTS = 5
+    LEASE = timedelta(seconds=60)
+    # Sends stop retrying this long before the lease runs out, so the outcome is recorded under it
+    LEASE_MARGIN = timedelta(seconds=10)
+    POLL_INTERVAL = 0.5  # seconds, when the queue is empty
+    RETRY_BASE = 2.0  # seconds
+    RETRY_CAP = 300.0
+
+    def __init__(self, db: AsyncIOMotorDatabase, provider: PushProvider, concurrency: int = 8):
+        self.db = db
+        self.provider = provider
+        self.worker_id = uuid.uuid4().hex
+        self._concurrency = asyncio.Semaphore(concurrency)
+
+    async def _claim(self) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        candidates = await self.db.notifications.find(
+            {"$or": [
+                {"push_status": "queued", "next_push_at": {"$lte": now}},
+                {"push_status": "sending", "push_lease_until": {"$lt": now}}
+            ]},
+            {"_id": 1}
+        ).sort([("push_rank", 1), ("created_at", 1)]).limit(self.CLAIM_LIMIT).to_list(self.CLAIM_LIMIT)
+        if not candidates:
+            return []
+
+        claim_id = f"{self.worker_id}:{uuid.uuid4().hex}"
+        await self.db.notifications.update_many(
+            {
+                "_id": {"$in": [doc["_id"] for doc in candidates]},
+                "$or": [
+                    {"push_status": "queued"},
+                    {"push_status": "sending", "push_lease_until": {"$lt": now}}
+                ]
+            },
+            {"$set": {"push_status": "sending", "push_claim": claim_id, "push_lease_until": now + self.LEASE}}
+        )
+        return await self.db.notifications.find({"push_claim": claim_id}).to_list(None)
+
+    async def _send_batch(self, batch: List[Tuple[int, str, Dict[str, Any]]], deadline: float):
+        async with self._concurrency:
+            if time.monotonic() >= deadline:
+                logging.warning(f"Push batch of {len(batch)} not sent before the claim's lease ran out")
+                return None
+            try:
+                return await self.provider.send_each([message for _, _, message in batch], deadline)
+            except PushProviderError as e:
+                logging.warning(f"Push batch of {len(batch)} failed: {e}")
+                return None
+
+    async def run_once(self) -> int:
+        """Dispatch one claimed set; returns how many notifications were processed"""
+        notifications = await self._claim()
+        if not notifications:
+            return 0
+        deadline = time.monotonic() + (self.LEASE - self.LEASE_MARGIN).total_seconds()
+
+        tokens: Dict[str, List[str]] = {}
+        async for device in self.db.devices.find(
+            {
+                "user_id": {"$in": list({n["user_id"] for n in notifications})},
+                "fcm_token": {"$exists": True, "$ne": None}
+            },
+            {"user_id": 1, "fcm_token": 1}
+        ):
+            tokens.setdefault(device["user_id"], []).append(device["fcm_token"])
+
+        outgoing = [
+            (index, token, _push_message(token, notification))
+            for index, notification in enumerate(notifications)
+            for token in tokens.get(notification["user_id"], [])
+        ]
+        batch_size = self.provider.MAX_BATCH
+        batches = [outgoing[start:start + batch_size] for start in range(0, len(outgoing), batch_size)]
+        results = await asyncio.gather(*[self._send_batch(batch, deadline) for batch in batches])
+
+        delivered, transient, invalid_tokens = set(), set(), set()
+        for batch, batch_results in zip(batches, results):
+            if batch_results is None:
+                transient.update(index for index, _, _ in batch)
+                continue
+            for (index, token, _), result in zip(batch, batch_results):
+                if result["success"]:
+                    delivered.add(index)
+                elif result["error"] in PERMANENT_ERRORS:
+                    invalid_tokens.add(token)
+                else:
+                    transient.add(index)
+
+        await self._record_outcomes(notifications, delivered, transient)
+
+        if invalid_tokens:
+            await self.db.devices.update_many(
+                {"fcm_token": {"$in": list(invalid_tokens)}},
+                {"$unset": {"fcm_token": ""}, "$set": {"fcm_token_pruned_at": datetime.utcnow()}}
+            )
+
+        return len(notifications)
+
+    async def _record_outcomes(self, notifications, delivered, transient):
+        now = datetime.utcnow()
+        operations = []
+        for index, notification in enumerate(notifications):
+            attempts = notification.get("push_attempts", 0) + 1
+            claim = {"_id": notification["_id"], "push_claim": notification["push_claim"]}
+
+            if index in delivered:
+                update = [{"$set": {
+                    "push_status": "delivered",
+                    "push_attempts": attempts,
+                    "pushed_at": now,
+                    "status": "delivered",
+                    "delivered_channels": {"$setUnion": ["$delivered_channels", ["push"]]}
+                }}]
+            elif index in transient and attempts < self.MAX_ATTEMPTS:
+                update = {"$set": {
+                    "push_status": "queued",
+                    "push_attempts": attempts,
+                    "next_push_at": now + timedelta(seconds=_backoff(attempts, self.RETRY_BASE, self.RETRY_CAP))
+                }}
+            else:
+                # No usable tokens, all invalid, or out of attempts
+                update = [{"$set": {
+                    "push_status": "failed",
+                    "push_attempts": attempts,
+                    "status": {"$cond": [
+                        {"$gt": [{"$size": {"$ifNull": ["$delivered_channels", []]}}, 0]}, "delivered", "failed"
+                    ]}
+                }}]
+            operations.append(UpdateOne(claim, update))
+
+        await self.db.notifications.bulk_write(operations, ordered=False)
+
+    async def run(self):
+        """Dispatch until cancelled, sleeping only when the queue is empty"""
+        while True:
+            try:
+                processed = await self.run_once()
+            except Exception as e:
+                logging.error(f"Push dispatch cycle failed: {e}")
+                processed = 0
+            if not processed:
+                await asyncio.sleep(self.POLL_INTERVAL)
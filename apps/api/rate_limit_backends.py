@@ -0,0 +1,381 @@
+"""
+Rate Limit Backends
+Storage strategies behind RateLimiter: MongoDB, in-process or Redis sliding windows
+"""
+
+import asyncio
+import logging
+import secrets
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from redis.exceptions import RedisError
+
+# Attempt scopes counted by RateLimiter
+SCOPE_IDENTIFIER = "identifier"
+SCOPE_IP = "ip_address"
+
+class RateLimitBackend(ABC):
+    """Interface used by RateLimiter; limits are passed in from RateLimiter.LIMITS"""
+
+    name = "base"
+
+    @abstractmethod
+    async def count_attempts(
+        self,
+        db: AsyncIOMotorDatabase,
+        scope: str,
+        key: str,
+        action: str,
+        window: int
+    ) -> int:
+        """Attempts by identifier or IP for an action within the last window seconds"""
+
+    @abstractmethod
+    async def record_attempt(
+        self,
+        db: AsyncIOMotorDatabase,
+        identifier: str,
+        action: str,
+        ip_address: Optional[str],
+        success: bool,
+        metadata: Optional[Dict[str, Any]],
+        limit_config: Optional[Dict[str, int]]
+    ):
+        """Record one attempt"""
+
+    @abstractmethod
+    async def reset(self, db: AsyncIOMotorDatabase, identifier: str, action: str) -> bool:
+        """Forget an identifier's attempts for an action"""
+
+    async def hit(
+        self,
+        db: AsyncIOMotorDatabase,
+        identifier: str,
+        action: str,
+        ip_address: Optional[str],
+        limit_config: Dict[str, int],
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Optional[str], int]:
+        """
+        Check the limit and record the attempt if it is allowed
+
+        Returns:
+            tuple: (limit reason or None, attempts in the deciding window,
+            including this one when allowed)
+        """
+        window, max_attempts = limit_config["window"], limit_config["max_attempts"]
+
+        if ip_address:
+            ip_count = await self.count_attempts(db, SCOPE_IP, ip_address, action, window)
+            if ip_count >= max_attempts:
+                return "ip_rate_limited", ip_count
+
+        attempt_count = await self.count_attempts(db, SCOPE_IDENTIFIER, identifier, action, window)
+        if attempt_count >= max_attempts:
+            return "rate_limited", attempt_count
+
+        await self.record_attempt(db, identifier, action, ip_address, True, metadata, limit_config)
+        return None, attempt_count + 1
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """
+    Sliding-window log per (scope, key, action) in one rate_limit_windows document
+
+    Like the in-process backend, a window holds at most max_attempts recent
+    attempts. hit() checks and records each scope's window with a single
+    atomic pipeline update, running the identifier and IP windows
+    concurrently, so a request costs one round trip. If only one scope
+    turns out to be limited, the attempt recorded in the other is pulled
+    again. Windows expire through a TTL index on expires_at.
+    """
+
+    name = "mongo"
+
+    @staticmethod
+    def _id(scope: str, key: str, action: str) -> str:
+        return f"{action}:{scope}:{key}"
+
+    @staticmethod
+    def _record(now: datetime, window: int, max_attempts: int, marker: str, limit: bool) -> list:
+        """Pipeline that drops attempts older than the window, then appends this one (if under the limit)"""
+        recent = {"$filter": {
+            "input": {"$ifNull": ["$attempts", []]},
+            "cond": {"$gte": ["$$this.t", now - timedelta(seconds=window)]}
+        }}
+        limited = {"$gte": [{"$size": "$attempts"}, max_attempts]} if limit else False
+        appended = {"$slice": [{"$concatArrays": ["$attempts", [{"t": now, "m": marker}]]}, -max_attempts]}
+        return [
+            {"$set": {"attempts": recent}},
+            {"$set": {"limited": limited}},
+            {"$set": {
+                "attempts": {"$cond": ["$limited", "$attempts", appended]},
+                "expires_at": now + timedelta(seconds=window)
+            }}
+        ]
+
+    async def _hit_window(self, db, scope, key, action, now, limit_config, marker, limit=True):
+        doc = await db.rate_limit_windows.find_one_and_update(
+            {"_id": self._id(scope, key, action)},
+            self._record(now, limit_config["window"], limit_config["max_attempts"], marker, limit),
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["limited"], len(doc["attempts"])
+
+    async def count_attempts(self, db, scope, key, action, window):
+        doc = await db.rate_limit_windows.find_one({"_id": self._id(scope, key, action)}, {"attempts": 1})
+        if doc is None:
+            return 0
+        window_start = datetime.utcnow() - timedelta(seconds=window)
+        return sum(1 for attempt in doc["attempts"] if attempt["t"] >= window_start)
+
+    async def record_attempt(self, db, identifier, action, ip_address, success, metadata, limit_config):
+        if not limit_config:
+            return  # unlimited actions are never counted
+        now, marker = datetime.utcnow(), secrets.token_hex(4)
+        scopes = [(SCOPE_IDENTIFIER, identifier)] + ([(SCOPE_IP, ip_address)] if ip_address else [])
+        await asyncio.gather(*[
+            self._hit_window(db, scope, key, action, now, limit_config, marker, limit=False)
+            for scope, key in scopes
+        ])
+
+    async def hit(self, db, identifier, action, ip_address, limit_config, metadata=None):
+        now, marker = datetime.utcnow(), secrets.token_hex(4)
+        scopes = [(SCOPE_IDENTIFIER, identifier)] + ([(SCOPE_IP, ip_address)] if ip_address else [])
+        results = await asyncio.gather(*[
+            self._hit_window(db, scope, key, action, now, limit_config, marker)
+            for scope, key in scopes
+        ])
+
+        if not any(limited for limited, _ in results):
+            return None, results[0][1]
+
+        # Limited in one scope: take back the attempt the other scope recorded
+        for (scope, key), (limited, _) in zip(scopes, results):
+            if not limited:
+                await db.rate_limit_windows.update_one(
+                    {"_id": self._id(scope, key, action)},
+                    {"$pull": {"attempts": {"m": marker}}}
+                )
+        # The IP window is checked first, matching RateLimiter.check_rate_limit
+        if len(results) > 1 and results[1][0]:
+            return "ip_rate_limited", results[1][1]
+        return "rate_limited", results[0][1]
+
+    async def reset(self, db, identifier, action):
+        result = await db.rate_limit_windows.delete_one({"_id": self._id(SCOPE_IDENTIFIER, identifier, action)})
+        return result.deleted_count > 0
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Sliding-window log per (scope, key, action), held in this process
+
+    Each window keeps at most max_attempts timestamps: once that many
+    attempts fall inside the window the caller is limited, and older
+    timestamps can never change the outcome. Memory is therefore bounded
+    by max_attempts per active key, and idle keys are swept periodically.
+    Limits apply per process - use a shared backend for multi-worker
+    deployments.
+    """
+
+    name = "memory"
+    SWEEP_INTERVAL = 60  # seconds
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._windows: Dict[Tuple[str, str, str], Tuple[deque, int]] = {}
+        self._last_sweep = clock()
+
+    async def count_attempts(self, db, scope, key, action, window):
+        return self.count(scope, key, action, window)
+
+    async def record_attempt(self, db, identifier, action, ip_address, success, metadata, limit_config):
+        if not limit_config:
+            return  # unlimited actions are never counted
+        self.record(identifier, action, ip_address, limit_config)
+
+    async def reset(self, db, identifier, action):
+        return self._windows.pop((SCOPE_IDENTIFIER, identifier, action), None) is not None
+
+    def count(self, scope: str, key: str, action: str, window: int) -> int:
+        """Synchronous count for callers outside the event loop"""
+        entry = self._windows.get((scope, key, action))
+        if entry is None:
+            return 0
+
+        timestamps = entry[0]
+        cutoff = self._clock() - window
+        while timestamps and timestamps[0] < cutoff:
+            timestamps.popleft()
+        return len(timestamps)
+
+    def record(self, identifier: str, action: str, ip_address: Optional[str], limit_config: Dict[str, int]):
+        """Synchronous record for callers outside the event loop"""
+        now = self._clock()
+        self._append((SCOPE_IDENTIFIER, identifier, action), now, limit_config)
+        if ip_address:
+            self._append((SCOPE_IP, ip_address, action), now, limit_config)
+
+        if now - self._last_sweep >= self.SWEEP_INTERVAL:
+            self._sweep(now)
+
+    def _append(self, key: Tuple[str, str, str], now: float, limit_config: Dict[str, int]):
+        entry = self._windows.get(key)
+        if entry is None:
+            entry = (deque(maxlen=limit_config["max_attempts"]), limit_config["window"])
+            self._windows[key] = entry
+        entry[0].append(now)
+
+    def _sweep(self, now: float):
+        """Drop keys whose newest attempt has left the window"""
+        self._last_sweep = now
+        idle = [
+            key for key, (timestamps, window) in self._windows.items()
+            if not timestamps or timestamps[-1] < now - window
+        ]
+        for key in idle:
+            del self._windows[key]
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+# Sliding window over one sorted set per key; KEYS[1] is the identifier, KEYS[2] the IP.
+# The IP window is checked first, matching RateLimiter.check_rate_limit.
+# Returns {limited scope index (0 = allowed), attempts in the deciding window}.
+_SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local max_attempts = tonumber(ARGV[3])
+local member = ARGV[4]
+local record = tonumber(ARGV[5])
+
+local counts = {}
+for i = 1, #KEYS do
+    redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', '(' .. (now - window))
+    counts[i] = redis.call('ZCARD', KEYS[i])
+end
+
+for i = #KEYS, 1, -1 do
+    if counts[i] >= max_attempts then
+        return {i, counts[i]}
+    end
+end
+
+if record == 1 then
+    for i = 1, #KEYS do
+        redis.call('ZADD', KEYS[i], now, member)
+        redis.call('PEXPIRE', KEYS[i], window)
+    end
+    return {0, counts[1] + 1}
+end
+return {0, counts[1]}
+"""
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Sliding windows shared by every worker through a Redis-protocol store
+
+    Check and record run as one server-side script, so each request costs
+    a single round trip. While the store is unreachable, calls fall back
+    to an in-process window (limits then apply per process) and the store
+    is retried after RETRY_AFTER seconds.
+    """
+
+    name = "redis"
+    KEY_PREFIX = "rl"
+    RETRY_AFTER = 5  # seconds
+    _NO_LIMIT = 2 ** 31
+
+    def __init__(
+        self,
+        redis_url: Optional[str] = None,
+        client=None,
+        fallback: Optional[InMemoryRateLimitBackend] = None,
+        clock: Callable[[], float] = time.time
+    ):
+        if client is None:
+            import redis.asyncio as redis_asyncio
+            client = redis_asyncio.from_url(
+                redis_url,
+                socket_timeout=0.25,
+                socket_connect_timeout=0.25
+            )
+        self._redis = client
+        self._script = client.register_script(_SLIDING_WINDOW_SCRIPT)
+        self._clock = clock
+        self.fallback = fallback or InMemoryRateLimitBackend()
+        self._unavailable_until = 0.0
+
+    def _key(self, scope: str, key: str, action: str) -> str:
+        return f"{self.KEY_PREFIX}:{action}:{scope}:{key}"
+
+    async def _run(self, keys, window: int, max_attempts: int, record: bool):
+        """Run the window script, or return None when the store is unavailable"""
+        now = self._clock()
+        if now < self._unavailable_until:
+            return None
+
+        now_ms = int(now * 1000)
+        member = f"{now_ms}-{secrets.token_hex(4)}"
+        try:
+            return await self._script(
+                keys=keys,
+                args=[now_ms, window * 1000, max_attempts, member, 1 if record else 0]
+            )
+        except RedisError as e:
+            logging.warning(f"Rate limit store unavailable, limiting locally: {type(e).__name__}")
+            self._unavailable_until = now + self.RETRY_AFTER
+            return None
+
+    async def count_attempts(self, db, scope, key, action, window):
+        result = await self._run([self._key(scope, key, action)], window, self._NO_LIMIT, False)
+        if result is None:
+            return await self.fallback.count_attempts(db, scope, key, action, window)
+        return int(result[1])
+
+    async def record_attempt(self, db, identifier, action, ip_address, success, metadata, limit_config):
+        if not limit_config:
+            return
+        keys = [self._key(SCOPE_IDENTIFIER, identifier, action)]
+        if ip_address:
+            keys.append(self._key(SCOPE_IP, ip_address, action))
+        result = await self._run(keys, limit_config["window"], self._NO_LIMIT, True)
+        if result is None:
+            await self.fallback.record_attempt(db, identifier, action, ip_address, success, metadata, limit_config)
+
+    async def hit(self, db, identifier, action, ip_address, limit_config, metadata=None):
+        keys = [self._key(SCOPE_IDENTIFIER, identifier, action)]
+        if ip_address:
+            keys.append(self._key(SCOPE_IP, ip_address, action))
+
+        result = await self._run(keys, limit_config["window"], limit_config["max_attempts"], True)
+        if result is None:
+            return await self.fallback.hit(db, identifier, action, ip_address, limit_config, metadata)
+
+        scope_index, attempts = int(result[0]), int(result[1])
+        if scope_index == 0:
+            return None, attempts
+        return ("rate_limited" if scope_index == 1 else "ip_rate_limited"), attempts
+
+    async def reset(self, db, identifier, action):
+        local_reset = await self.fallback.reset(db, identifier, action)
+        try:
+            deleted = await self._redis.delete(self._key(SCOPE_IDENTIFIER, identifier, action))
+        except RedisError:
+            return local_reset
+        return deleted > 0 or local_reset
+
+def create_rate_limit_backend(name: str, redis_url: Optional[str] = None) -> RateLimitBackend:
+    """Build a backend from its configured name"""
+    if name == "memory":
+        return InMemoryRateLimitBackend()
+    if name == "mongo":
+        return MongoRateLimitBackend()
+    if name == "redis":
+        return RedisRateLimitBackend(redis_url)
+    raise ValueError(f"Unknown rate limit backend: {name}")
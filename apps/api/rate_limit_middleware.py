@@ -0,0 +1,185 @@
+"""
+Global Rate Limit Middleware
+Per-identity and per-IP api_general limits on every route, enforced before routing
+"""
+
+import math
+import time
+from typing import ClassVar, Dict, List, Optional, Tuple
+import security
+from session_management import RateLimiter
+
+class SlidingWindowCounter:
+    """
+    Two-bucket sliding window counter kept in a plain dict
+
+    Each key holds [bucket index, current count, previous count, window]; the
+    request rate is estimated as current + previous weighted by how much
+    of the previous bucket still overlaps the window. Every operation is
+    O(1) and runs to completion on the event loop thread, so no locks are
+    needed. Rejected requests are not counted. At most max_keys counters are
+    kept; past that, idle ones are swept and then the oldest are dropped.
+    """
+
+    SWEEP_INTERVAL = 60  # seconds
+    MAX_KEYS = 100_000
+
+    def __init__(self, clock=time.monotonic, max_keys: int = MAX_KEYS):
+        self._clock = clock
+        self.max_keys = max_keys
+        self._counters: Dict[tuple, List[int]] = {}
+        self._last_sweep = clock()
+
+    def hit(self, keys: Tuple[tuple, ...], limits: Tuple[int, ...], window: int) -> float:
+        """
+        Count one request against every key if all are under their limit
+
+        Returns:
+            float: 0 when allowed, otherwise seconds until a retry can succeed
+        """
+        now = self._clock()
+        bucket, offset = divmod(now, window)
+        bucket = int(bucket)
+        previous_weight = 1.0 - offset / window
+        counters = self._counters
+
+        entries = []
+        for key, limit in zip(keys, limits):
+            entry = counters.get(key)
+            if entry is None:
+                if len(counters) >= self.max_keys:
+                    self._make_room(now)
+                entry = [bucket, 0, 0, window]
+                counters[key] = entry
+            elif entry[0] != bucket:
+                # Roll the window forward; a gap of more than one bucket clears it
+                entry[2] = entry[1] if entry[0] == bucket - 1 else 0
+                entry[1] = 0
+                entry[0] = bucket
+
+            if entry[1] + entry[2] * previous_weight >= limit:
+                return self._retry_after(entry, limit, offset, window)
+            entries.append(entry)
+
+        for entry in entries:
+            entry[1] += 1
+
+        if now - self._last_sweep >= self.SWEEP_INTERVAL:
+            self._sweep(now)
+        return 0.0
+
+    @staticmethod
+    def _retry_after(entry: List[int], limit: int, offset: float, window: int) -> float:
+        """Seconds until the weighted previous bucket decays below the limit"""
+        current, previous = entry[1], entry[2]
+        if current >= limit:
+            # Wait for the next bucket, then for this one to decay as "previous"
+            return (window - offset) + window * (1.0 - limit / current)
+        # Solve current + previous * (1 - t / window) < limit for t
+        needed = (1.0 - (limit - current) / previous) * window
+        return max(needed - offset, 0.001)
+
+    def _make_room(self, now: float):
+        self._sweep(now)
+        # Dicts keep insertion order, so the first keys are the longest-lived
+        while len(self._counters) >= self.max_keys:
+            del self._counters[next(iter(self._counters))]
+
+    def _sweep(self, now: float):
+        """Drop counters whose both buckets have left their window"""
+        self._last_sweep = now
+        stale = [
+            key for key, entry in self._counters.items()
+            if int(now // entry[3]) - entry[0] > 1
+        ]
+        for key in stale:
+            del self._counters[key]
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+class RateLimitMiddleware:
+    """ASGI middleware applying RateLimiter.LIMITS["api_general"] to every request"""
+
+    # Stricter budgets for expensive routes, matched by longest path prefix
+    ROUTE_OVERRIDES: ClassVar[Dict[str, Dict[str, int]]] = {
+        "/v1/transactions": {"window": 60, "max_attempts": 30},
+    }
+
+    # Routes that are never limited
+    EXEMPT_PATHS = ("/health", "/docs", "/openapi.json", "/redoc")
+
+    # Several users can share one address (NAT, carrier gateways)
+    IP_LIMIT_MULTIPLIER = 5
+
+    def __init__(self, app, limits: Optional[Dict[str, int]] = None, route_overrides=None, clock=time.monotonic):
+        self.app = app
+        self.default_limits = limits or RateLimiter.LIMITS["api_general"]
+        self.route_overrides = sorted(
+            (route_overrides if route_overrides is not None else self.ROUTE_OVERRIDES).items(),
+            key=lambda item: len(item[0]),
+            reverse=True
+        )
+        self.counter = SlidingWindowCounter(clock=clock)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        path = scope["path"]
+        if path.startswith(self.EXEMPT_PATHS):
+            return await self.app(scope, receive, send)
+
+        route, limits = "api_general", self.default_limits
+        for prefix, override in self.route_overrides:
+            if path.startswith(prefix):
+                route, limits = prefix, override
+                break
+
+        max_attempts = limits["max_attempts"]
+        client = scope.get("client")
+        ip_key = ("ip", route, client[0] if client else "")
+
+        identity = _bearer_identity(scope["headers"])
+        if identity is None:
+            keys, budgets = (ip_key,), (max_attempts * self.IP_LIMIT_MULTIPLIER,)
+        else:
+            keys = (("id", route, identity), ip_key)
+            budgets = (max_attempts, max_attempts * self.IP_LIMIT_MULTIPLIER)
+
+        retry_after = self.counter.hit(keys, budgets, limits["window"])
+        if retry_after:
+            return await _send_rate_limited(send, retry_after)
+
+        return await self.app(scope, receive, send)
+
+def _bearer_identity(headers) -> Optional[str]:
+    """
+    Subject of an already verified bearer token, or None (limit by IP only)
+
+    Made-up tokens must not buy a fresh budget each, so only tokens in
+    TokenVerifier's cache are trusted. Verifying here would let a flood of
+    bad signatures cost an RSA check each before any limit applies; a new
+    token is counted by IP until its first request has verified it.
+    """
+    for name, value in headers:
+        if name == b"authorization":
+            if value[:7].lower() != b"bearer ":
+                return None
+            claims = security.token_verifier.cached_claims(value[7:].decode("latin-1"))
+            return claims.get("sub") if claims else None
+    return None
+
+async def _send_rate_limited(send, retry_after: float):
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"retry-after", str(math.ceil(retry_after)).encode()),
+        ],
+    })
+    await send({
+        "type": "http.response.body",
+        "body": b'{"detail":"Rate limited: api_general"}',
+    })
@@ -0,0 +1,149 @@
+"""
+Receipt Rendering
+On-demand transaction receipts, cached by content on local disk and in S3
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from cache_utils import SingleFlight
+from config import config
+from pdf_documents import PdfTableWriter, format_minor
+
+# Bump when the receipt layout changes so cached receipts are re-rendered
+RECEIPT_VERSION = 1
+
+def _s3_client():
+    import boto3
+    return boto3.client(
+        "s3",
+        endpoint_url=config.S3_ENDPOINT or None,
+        aws_access_key_id=config.S3_ACCESS_KEY or None,
+        aws_secret_access_key=config.S3_SECRET_KEY or None
+    )
+
+def receipt_key(txn: Dict[str, Any]) -> str:
+    """Content address of a transaction's receipt"""
+    content = txn.get("hash") or json.dumps(
+        {field: txn.get(field) for field in ("_id", "from_account", "to_account", "amount_minor", "currency", "created_at")},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(f"v{RECEIPT_VERSION}:{content}".encode()).hexdigest()
+
+def render_receipt(txn: Dict[str, Any]) -> bytes:
+    out = io.BytesIO()
+    writer = PdfTableWriter(out, "BiPay Payment Receipt")
+    currency = txn.get("currency", "INR")
+    for label, value in (
+        ("Transaction", str(txn["_id"])),
+        ("Date", f"{txn['created_at']:%Y-%m-%d %H:%M:%S} UTC"),
+        ("Type", txn.get("type", "p2p")),
+        ("From", txn.get("from_account", "")),
+        ("To", txn.get("to_account", "")),
+        ("Amount", format_minor(txn["amount_minor"], currency)),
+        ("Status", txn.get("status", "")),
+        ("Biometric verified", "yes" if txn.get("biometric_verified") else "no"),
+    ):
+        writer.add_line(f"{label}: {value}")
+    if txn.get("hash"):
+        writer.add_line()
+        writer.add_line(f"Integrity hash: {txn['hash']}")
+    writer.close()
+    return out.getvalue()
+
+class ReceiptRenderer:
+    """
+    Renders a receipt the first time it is requested
+
+    Receipts are looked up by content address on local disk, then in S3,
+    and only rendered when neither has them. Concurrent requests for the
+    same receipt share one lookup/render. Renders in other processes are
+    harmless duplicates: they produce the same bytes under the same key.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = config.RECEIPT_CACHE_DIR,
+        bucket: str = config.S3_BUCKET,
+        s3_client=None
+    ):
+        self.cache_dir = cache_dir
+        self.bucket = bucket
+        self._s3 = s3_client
+        self._inflight = SingleFlight()
+
+    @property
+    def s3(self):
+        if self._s3 is None and self.bucket:
+            self._s3 = _s3_client()
+        return self._s3
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.pdf")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, pdf: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf)
+        os.replace(tmp_path, path)
+
+    def _read_s3(self, key: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=f"receipts/{key}.pdf")["Body"].read()
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def _write_s3(self, key: str, pdf: bytes):
+        self.s3.put_object(Bucket=self.bucket, Key=f"receipts/{key}.pdf", Body=pdf, ContentType="application/pdf")
+
+    async def get(self, db: AsyncIOMotorDatabase, txn: Dict[str, Any]) -> Dict[str, Any]:
+        """{"key", "pdf"} for a transaction's receipt"""
+        key = receipt_key(txn)
+        pdf = await asyncio.to_thread(self._read_disk, key)
+        if pdf is None:
+            pdf = await self._inflight.do(key, lambda: self._load(db, txn, key))
+        return {"key": key, "pdf": pdf}
+
+    async def _load(self, db: AsyncIOMotorDatabase, txn: Dict[str, Any], key: str) -> bytes:
+        pdf = await asyncio.to_thread(self._read_s3, key) if self.s3 else None
+        if pdf is None:
+            pdf = await asyncio.to_thread(render_receipt, txn)
+            if self.s3:
+                await asyncio.to_thread(self._write_s3, key, pdf)
+            await db.receipts.update_one(
+                {"txn_id": str(txn["_id"])},
+                {"$set": {
+                    "key": key,
+                    "s3_key": f"receipts/{key}.pdf" if self.s3 else None,
+                    "size": len(pdf),
+                    "rendered_at": datetime.utcnow()
+                }},
+                upsert=True
+            )
+        try:
+            await asyncio.to_thread(self._write_disk, key, pdf)
+        except OSError as e:
+            logging.warning(f"Receipt disk cache write failed: {e}")
+        return pdf
+
+receipt_renderer = ReceiptRenderer()
@@ -0,0 +1,159 @@
+"""
+Refresh Token Rotation
+Opaque single-use refresh tokens, stored hashed, that mint short-lived access tokens
+"""
+
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from config import config
+from security import issue_access_token, revocation_list
+
+class RefreshTokenManager:
+    """
+    Issues access/refresh token pairs and rotates refresh tokens
+
+    Every refresh token belongs to a family started at login. Using a
+    refresh token retires it and issues the next one in the family;
+    presenting a retired token again means it was copied, so the whole
+    family and the access tokens it issued are revoked.
+    """
+
+    REFRESH_TOKEN_TTL = timedelta(days=config.REFRESH_TOKEN_TTL_DAYS)
+
+    @staticmethod
+    def _hash(refresh_token: str) -> str:
+        return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+    @staticmethod
+    async def issue(
+        db: AsyncIOMotorDatabase,
+        user_data: Dict[str, Any],
+        family_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Issue an access token and a refresh token for user_data"""
+
+        access = issue_access_token(user_data)
+        refresh_token = secrets.token_urlsafe(32)
+        now = datetime.utcnow()
+
+        await db.refresh_tokens.insert_one({
+            "_id": RefreshTokenManager._hash(refresh_token),
+            "family_id": family_id or secrets.token_urlsafe(16),
+            "user_id": user_data.get("user_id"),
+            "user_data": {
+                "user_id": user_data.get("user_id"),
+                "mobile": user_data.get("mobile"),
+                "wallet_id": user_data.get("wallet_id")
+            },
+            "access_jti": access["jti"],
+            "access_expires_at": access["expires_at"],
+            "status": "active",
+            "created_at": now,
+            "expires_at": now + RefreshTokenManager.REFRESH_TOKEN_TTL
+        })
+
+        return {
+            "token": access["token"],
+            "refresh_token": refresh_token,
+            "expires_in": config.ACCESS_TOKEN_TTL_MINUTES * 60
+        }
+
+    @staticmethod
+    async def rotate(db: AsyncIOMotorDatabase, refresh_token: str) -> Dict[str, Any]:
+        """Exchange a refresh token for a new pair"""
+
+        token_hash = RefreshTokenManager._hash(refresh_token)
+        now = datetime.utcnow()
+
+        current = await db.refresh_tokens.find_one_and_update(
+            {"_id": token_hash, "status": "active", "expires_at": {"$gt": now}},
+            {"$set": {"status": "rotated", "rotated_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+
+        if current is None:
+            stored = await db.refresh_tokens.find_one({"_id": token_hash})
+            if stored and stored["status"] == "rotated":
+                await RefreshTokenManager.revoke_family(db, stored["family_id"], "refresh_token_reused")
+                return {"rotated": False, "reason": "refresh_token_reused"}
+            return {"rotated": False, "reason": "refresh_token_invalid"}
+
+        tokens = await RefreshTokenManager.issue(db, current["user_data"], current["family_id"])
+        return {"rotated": True, "tokens": tokens}
+
+    @staticmethod
+    async def revoke_family(db: AsyncIOMotorDatabase, family_id: str, reason: str = "logout") -> int:
+        """Revoke every refresh token in a family and the access tokens it issued"""
+
+        now = datetime.utcnow()
+        members = await db.refresh_tokens.find(
+            {"family_id": family_id},
+            {"user_id": 1, "access_jti": 1, "access_expires_at": 1}
+        ).to_list(None)
+        if not members:
+            return 0
+
+        await db.refresh_tokens.update_many(
+            {"family_id": family_id, "status": {"$ne": "revoked"}},
+            {"$set": {"status": "revoked", "revoked_at": now, "revoke_reason": reason}}
+        )
+
+        live = [member for member in members if member["access_expires_at"] > now]
+        if live:
+            await db.revoked_tokens.bulk_write([
+                UpdateOne(
+                    {"_id": member["access_jti"]},
+                    {"$setOnInsert": {
+                        "sub": member["user_id"],
+                        "revoked_at": now,
+                        "expires_at": member["access_expires_at"]
+                    }},
+                    upsert=True
+                )
+                for member in live
+            ], ordered=False)
+            for member in live:
+                revocation_list.add(member["access_jti"], member["access_expires_at"])
+
+        if reason != "logout":
+            logging.warning(f"Refresh token family {family_id} revoked: {reason}")
+            await db.security_logs.insert_one({
+                "user_id": members[0]["user_id"],
+                "event_type": f"token_{reason}",
+                "severity": "high",
+                "details": {"family_id": family_id, "tokens": len(members)},
+                "timestamp": now
+            })
+
+        return len(members)
+
+    @staticmethod
+    async def logout(
+        db: AsyncIOMotorDatabase,
+        claims: Dict[str, Any],
+        refresh_token: Optional[str] = None,
+        all_devices: bool = False
+    ):
+        """End the caller's session, or every session of the user"""
+
+        if all_devices:
+            await revocation_list.revoke_subject(db, claims["sub"])
+            await db.refresh_tokens.update_many(
+                {"user_id": claims["sub"], "status": "active"},
+                {"$set": {"status": "revoked", "revoked_at": datetime.utcnow(), "revoke_reason": "logout_all"}}
+            )
+            return
+
+        await revocation_list.revoke(db, claims)
+        if refresh_token:
+            stored = await db.refresh_tokens.find_one(
+                {"_id": RefreshTokenManager._hash(refresh_token), "user_id": claims["sub"]},
+                {"family_id": 1}
+            )
+            if stored:
+                await RefreshTokenManager.revoke_family(db, stored["family_id"])
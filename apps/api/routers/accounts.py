@@ -2,13 +2,14 @@ from fastapi import APIRouter, HTTPException, Depends
 from db import get_db
 from security import JWTBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from principal_cache import PrincipalCache
 
 router = APIRouter()
 
 @router.get("/{wallet_id}", dependencies=[Depends(JWTBearer())])
 async def get_account(wallet_id: str):
     db: AsyncIOMotorDatabase = get_db()
-    account = await db.accounts.find_one({"_id": wallet_id})
+    account = await PrincipalCache.get_wallet(db, wallet_id)
     if not account:
         raise HTTPException(404, "Account not found")
     
@@ -3,6 +3,7 @@ from db import get_db
 from models import Account
 from security import JWTBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from principal_cache import PrincipalCache
 from datetime import datetime
 
 router = APIRouter()
@@ -19,6 +20,7 @@ async def add_money(request: Request, amount_minor: int, currency: str = "INR"):
         raise HTTPException(404, "Account not found")
     new_balance = account["balance_minor"] + amount_minor
     await db.accounts.update_one({"_id": account["_id"]}, {"$set": {"balance_minor": new_balance}})
+    PrincipalCache.invalidate_wallet(account["_id"])
     # Log history
     from notify_utils import log_history
     await log_history(db, user_id, "add_money", {"amount_minor": amount_minor, "currency": currency})
@@ -1,9 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
 from db import get_db
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from datetime import datetime
-from security import create_jwt_token
+from typing import Optional
+from security import JWTBearer
+from refresh_tokens import RefreshTokenManager
 import secrets
 import hashlib
 
@@ -19,6 +21,13 @@ class LoginRequest(BaseModel):
     mobile: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+    all_devices: bool = False
+
 @router.post("/register")
 async def register(request: RegisterRequest):
     try:
@@ -66,7 +75,7 @@ async def register(request: RegisterRequest):
             "mobile": request.mobile,
             "wallet_id": wallet_id
         }
-        jwt_token = create_jwt_token(token_data)
+        tokens = await RefreshTokenManager.issue(db, token_data)
         
         return {
             "success": True,
@@ -79,7 +88,9 @@ async def register(request: RegisterRequest):
                     "balance": 1000,
                     "wallet_id": wallet_id
                 },
-                "token": jwt_token,
+                "token": tokens["token"],
+                "refresh_token": tokens["refresh_token"],
+                "expires_in": tokens["expires_in"],
                 "device_id": f"web_device_{user_id}"
             }
         }
@@ -110,7 +121,7 @@ async def login(request: LoginRequest):
             "mobile": user["mobile"],
             "wallet_id": user["wallet_id"]
         }
-        jwt_token = create_jwt_token(token_data)
+        tokens = await RefreshTokenManager.issue(db, token_data)
         
         return {
             "success": True,
@@ -123,7 +134,9 @@ async def login(request: LoginRequest):
                     "balance": user.get("balance", 1000),
                     "wallet_id": user["wallet_id"]
                 },
-                "token": jwt_token,
+                "token": tokens["token"],
+                "refresh_token": tokens["refresh_token"],
+                "expires_in": tokens["expires_in"],
                 "device_id": f"web_device_{user['_id']}"
             }
         }
@@ -132,3 +145,18 @@ async def login(request: LoginRequest):
         raise
     except Exception as e:
         raise HTTPException(500, f"Login failed: {str(e)}")
+
+@router.post("/refresh")
+async def refresh(request: RefreshRequest):
+    db: AsyncIOMotorDatabase = get_db()
+    result = await RefreshTokenManager.rotate(db, request.refresh_token)
+    if not result["rotated"]:
+        raise HTTPException(401, f"Refresh failed: {result['reason']}")
+    return {"success": True, "data": result["tokens"]}
+
+@router.post("/logout", dependencies=[Depends(JWTBearer())])
+async def logout(request: Request, body: LogoutRequest):
+    db: AsyncIOMotorDatabase = get_db()
+    user = request.state.user
+    await RefreshTokenManager.logout(db, user, body.refresh_token, body.all_devices)
+    return {"success": True}
@@ -4,7 +4,9 @@ router = APIRouter()
 
 from fastapi import Request, HTTPException, Depends
 from db import get_db
-from biometric import validate_attestation, verify_timestamp
+from biometric import verify_timestamp
+from device_attestation import AttestationVerifier
+from principal_cache import PrincipalCache
 from security import JWTBearer
 from security_audit import SecurityAuditLogger
 from motor.motor_asyncio import AsyncIOMotorDatabase
@@ -32,8 +34,13 @@ async def enroll_device(
     }
     
     try:
-        # Validate attestation with enhanced checks
-        attestation_result = validate_attestation(attestation)
+        # Check if device already exists
+        existing_device = await db.devices.find_one({"_id": device_id})
+        
+        # Validate attestation with enhanced checks (remote verdicts are cached per user, device and key)
+        attestation_result = await AttestationVerifier.verify(
+            user_id, device_id, public_key, attestation, existing_device
+        )
         if not attestation_result["valid"]:
             await SecurityAuditLogger.log_security_event(
                 db, "device_enrollment_failed", "medium", user_id,
@@ -61,8 +68,6 @@ async def enroll_device(
                 )
                 raise HTTPException(403, f"Timestamp invalid: {timestamp_result['reason']}")
         
-        # Check if device already exists
-        existing_device = await db.devices.find_one({"_id": device_id})
         if existing_device:
             # Update existing device
             await db.devices.update_one(
@@ -96,6 +101,7 @@ async def enroll_device(
                 "enrollment_metadata": request_metadata
             })
             operation = "enrolled"
+        PrincipalCache.invalidate_device(device_id)
         
         # Log successful enrollment
         await SecurityAuditLogger.log_security_event(
@@ -185,6 +191,9 @@ async def revoke_device(request: Request, device_id: str):
     if result.modified_count == 0:
         raise HTTPException(404, "Device not found")
     
+    AttestationVerifier.revoke(device_id)
+    PrincipalCache.invalidate_device(device_id)
+    
     # Log device revocation
     await SecurityAuditLogger.log_security_event(
         db, "device_revoked", "medium", user_id,
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends, Request, HTTPException
 from db import get_db
 from security import JWTBearer
+from device_attestation import AttestationVerifier
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from principal_cache import PrincipalCache
 
 router = APIRouter()
 
@@ -17,4 +19,6 @@ async def revoke_device(request: Request, device_id: str):
     db: AsyncIOMotorDatabase = get_db()
     user = request.state.user
     await db.devices.update_one({"_id": device_id, "user_id": user["sub"]}, {"$set": {"status": "revoked"}})
+    AttestationVerifier.revoke(device_id)
+    PrincipalCache.invalidate_device(device_id)
     return {"status": "revoked"}
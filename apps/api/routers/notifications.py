@@ -3,39 +3,51 @@ Notification Router
 Endpoints for managing user notifications
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from db import get_db
 from security import JWTBearer
 from notification_service import NotificationService
+from notification_stream import format_sse, notification_hub
 from typing import Optional
 
 router = APIRouter()
 
+# Comment frames keep idle streams open through proxies
+STREAM_HEARTBEAT = 15  # seconds
+
 @router.get("/notifications", dependencies=[Depends(JWTBearer())])
 async def get_notifications(
-    request,
-    limit: int = Query(50, le=100),
-    unread_only: bool = Query(False)
+    request: Request,
+    limit: int = Query(50, ge=1, le=100),
+    unread_only: bool = Query(False),
+    cursor: Optional[str] = Query(None),
+    include_data: bool = Query(False)
 ):
-    """Get user's notifications"""
+    """Get user's notifications, newest first; pass next_cursor back for the next page"""
     db: AsyncIOMotorDatabase = get_db()
     user = request.state.user
     user_id = user.get("sub") or user.get("user_id") or user.get("id")
     
-    notifications = await NotificationService.get_user_notifications(
-        db, user_id, limit, unread_only
-    )
+    try:
+        notifications, next_cursor = await NotificationService.get_user_notifications(
+            db, user_id, limit, unread_only, cursor, include_data
+        )
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
     
     return {
         "notifications": notifications,
         "count": len(notifications),
-        "unread_only": unread_only
+        "unread_only": unread_only,
+        "next_cursor": next_cursor
     }
 
 @router.post("/notifications/{notification_id}/read", dependencies=[Depends(JWTBearer())])
 async def mark_notification_read(
-    request,
+    request: Request,
     notification_id: str
 ):
     """Mark notification as read"""
@@ -52,16 +64,56 @@ async def mark_notification_read(
     
     return {"success": True, "message": "Notification marked as read"}
 
+@router.post("/notifications/read-all", dependencies=[Depends(JWTBearer())])
+async def mark_all_notifications_read(request: Request):
+    """Mark every notification as read"""
+    db: AsyncIOMotorDatabase = get_db()
+    user = request.state.user
+    user_id = user.get("sub") or user.get("user_id") or user.get("id")
+    
+    updated = await NotificationService.mark_all_notifications_read(db, user_id)
+    
+    return {"success": True, "updated": updated}
+
 @router.get("/notifications/unread/count", dependencies=[Depends(JWTBearer())])
-async def get_unread_count(request):
+async def get_unread_count(request: Request):
     """Get count of unread notifications"""
     db: AsyncIOMotorDatabase = get_db()
     user = request.state.user
     user_id = user.get("sub") or user.get("user_id") or user.get("id")
     
-    count = await db.in_app_notifications.count_documents({
-        "user_id": user_id,
-        "read": False
-    })
+    count = await NotificationService.get_unread_count(db, user_id)
     
     return {"unread_count": count}
+
+@router.get("/notifications/stream", dependencies=[Depends(JWTBearer())])
+async def stream_notifications(request: Request):
+    """Server-sent events for new notifications and balance changes"""
+    db: AsyncIOMotorDatabase = get_db()
+    user = request.state.user
+    user_id = user.get("sub") or user.get("user_id") or user.get("id")
+    
+    subscription = notification_hub.subscribe(user_id, user.get("wallet_id"))
+    
+    async def events():
+        try:
+            # Current state first; everything after arrives from the change stream
+            count = await NotificationService.get_unread_count(db, user_id)
+            yield format_sse({"event": "unread_count", "id": "", "data": {"unread_count": count}})
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["event"] == "close":
+                    break
+                yield format_sse(event)
+        finally:
+            notification_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -5,17 +5,24 @@ router = APIRouter()
 from fastapi import Depends, Request, HTTPException
 from db import get_db
 from security import JWTBearer
-from biometric import verify_biometric_signature
+from biometric import verify_biometric_signature, SIGNATURE_VERSION_JSON
 from nonce_utils import verify_nonce
 from ledger_utils import commit_transaction
 from risk_engine import get_risk_score, risk_decision
-from notify_utils import notify_user, log_history
 from security_audit import SecurityAuditLogger
 from fraud_detection import FraudDetectionEngine
 from notification_service import NotificationService
 from session_management import RateLimiter
+from principal_cache import PrincipalCache
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+def _signature_version(request: Request) -> int:
+    """Payload encoding the client signed; legacy JSON when not specified"""
+    try:
+        return int(request.headers.get("X-Signature-Version", SIGNATURE_VERSION_JSON))
+    except ValueError:
+        return 0  # unknown encodings never verify
+
 @router.post("/p2p", dependencies=[Depends(JWTBearer())])
 async def p2p_payment(request: Request, to_account: str, amount_minor: int, currency: str, memo: str = ""):
     db: AsyncIOMotorDatabase = get_db()
@@ -36,8 +43,8 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
     }
     
     try:
-        # Rate limiting check
-        rate_check = await RateLimiter.check_rate_limit(
+        # Rate limiting check (also counts this attempt)
+        rate_check = await RateLimiter.check_and_record(
             db, user_id, "payment", request_metadata.get("ip_address")
         )
         if not rate_check["allowed"]:
@@ -50,7 +57,6 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
         
         # Verify nonce
         if not await verify_nonce(db, nonce, user_id, device_id):
-            await RateLimiter.record_attempt(db, user_id, "payment", request_metadata.get("ip_address"), False)
             await SecurityAuditLogger.log_authentication_event(
                 db, "nonce_verification_failed", user_id, False,
                 {"nonce": nonce, "device_id": device_id}, request_metadata
@@ -58,7 +64,7 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
             raise HTTPException(403, "BIOMETRIC_INVALID: Nonce invalid or used")
         
         # Get device public key
-        device = await db.devices.find_one({"user_id": user_id, "_id": device_id})
+        device = await PrincipalCache.get_device(db, device_id, user_id)
         if not device:
             await SecurityAuditLogger.log_security_event(
                 db, "device_not_found", "high", user_id,
@@ -67,7 +73,7 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
             raise HTTPException(401, "Device not enrolled")
         
         # Get user's wallet
-        user_doc = await db.users.find_one({"_id": user_id})
+        user_doc = await PrincipalCache.get_user(db, user_id)
         if not user_doc:
             raise HTTPException(404, "User not found")
         
@@ -84,7 +90,9 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
         }
         
         # Verify biometric signature
-        bio_verified = verify_biometric_signature(device["public_key"], payload, signature)
+        bio_verified = verify_biometric_signature(
+            device["public_key"], payload, signature, _signature_version(request)
+        )
         if not bio_verified:
             await SecurityAuditLogger.log_biometric_event(
                 db, "signature_verification_failed", user_id, device_id, False,
@@ -155,7 +163,6 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
         )
         
         if "error" in result:
-            await RateLimiter.record_attempt(db, user_id, "payment", request_metadata.get("ip_address"), False)
             await SecurityAuditLogger.log_payment_event(
                 db, "payment_failed", user_id,
                 {"amount": amount_minor, "to_account": to_account, "error": result["error"]},
@@ -171,24 +178,20 @@ async def p2p_payment(request: Request, to_account: str, amount_minor: int, curr
             raise HTTPException(422, result["error"])
         
         # Log successful payment
-        await RateLimiter.record_attempt(db, user_id, "payment", request_metadata.get("ip_address"), True)
         await SecurityAuditLogger.log_payment_event(
             db, "payment_completed", user_id,
             {"amount": amount_minor, "to_account": to_account, "txn_id": result["txn_id"]},
             request_metadata
         )
         
-        await notify_user(db, user_id, "Payment sent", f"Sent {amount_minor} {currency} to {to_account}", "payment")
-        await log_history(db, user_id, "p2p_payment", result)
-        
-        # Send success notification
+        # One record serves the in-app feed, push and payment history
         await NotificationService.send_transaction_notification(
             db, user_id, "p2p", {
                 "txn_id": result["txn_id"],
                 "amount_minor": amount_minor,
                 "to_account": to_account,
                 "currency": currency
-            }, success=True
+            }, success=True, history={"action": "p2p_payment", "details": result}
         )
         
         return result
@@ -213,7 +216,7 @@ async def merchant_payment(request: Request, merchant_id: str, amount_minor: int
     if not await verify_nonce(db, nonce, user["sub"], device_id):
         raise HTTPException(403, "BIOMETRIC_INVALID: Nonce invalid or used")
     # Get device public key
-    device = await db.devices.find_one({"user_id": user["sub"], "_id": device_id})
+    device = await PrincipalCache.get_device(db, device_id, user["sub"])
     if not device:
         raise HTTPException(401, "Device not enrolled")
     payload = {
@@ -228,7 +231,7 @@ async def merchant_payment(request: Request, merchant_id: str, amount_minor: int
         "order_id": order_id,
         "memo": memo
     }
-    if not verify_biometric_signature(device["public_key"], payload, signature):
+    if not verify_biometric_signature(device["public_key"], payload, signature, _signature_version(request)):
         raise HTTPException(403, "BIOMETRIC_INVALID: Signature failed")
     # Risk scoring
     features = {"amount": amount_minor, "user_id": user["sub"], "device_id": device_id, "merchant_id": merchant_id}
@@ -246,7 +249,9 @@ async def merchant_payment(request: Request, merchant_id: str, amount_minor: int
     result = await commit_transaction(db, user["wallet_id"], merchant["settlement_account"], amount_minor, currency, True, payload)
     if "error" in result:
         raise HTTPException(422, result["error"])
-    await notify_user(db, user["sub"], "Merchant payment sent", f"Sent {amount_minor} {currency} to merchant {merchant_id}", "payment")
-    await log_history(db, user["sub"], "merchant_payment", result)
+    await NotificationService.notify(
+        db, user["sub"], "Merchant payment sent", f"Sent {amount_minor} {currency} to merchant {merchant_id}", "payment",
+        history={"action": "merchant_payment", "details": result}
+    )
     # TODO: Publish webhook event to merchant
     return result
@@ -2,15 +2,25 @@ from fastapi import APIRouter, HTTPException
 
 router = APIRouter()
 
-from fastapi import Request, Depends
+from fastapi import Request, Depends, Response
+from bson import ObjectId
 from db import get_db
 from security import JWTBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from receipt_renderer import receipt_key, receipt_renderer
 
 @router.get("/{txn_id}.pdf", dependencies=[Depends(JWTBearer())])
 async def get_receipt(request: Request, txn_id: str):
     db: AsyncIOMotorDatabase = get_db()
-    receipt = await db.receipts.find_one({"txn_id": txn_id})
-    if not receipt:
-        return {"pdf_url": None}
-    return {"pdf_url": receipt["pdf_url"]}
+    user = request.state.user
+    txn = await db.transactions.find_one({"_id": ObjectId(txn_id) if ObjectId.is_valid(txn_id) else txn_id})
+    # Only the payer and payee may see a receipt
+    if not txn or user.get("wallet_id") not in (txn.get("from_account"), txn.get("to_account")):
+        raise HTTPException(404, "Transaction not found")
+    # Receipts are content-addressed, so the key doubles as a strong ETag
+    etag = f'"{receipt_key(txn)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    receipt = await receipt_renderer.get(db, txn)
+    return Response(content=receipt["pdf"], media_type="application/pdf", headers=headers)
@@ -1,32 +1,61 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 
 router = APIRouter()
 
+from datetime import datetime
 from fastapi import Request, Depends
+from fastapi.responses import StreamingResponse
 from db import get_db
 from security import JWTBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pagination import decode_cursor, fetch_page
+from transaction_history import EXPORT_FORMATS, LEDGER_FIELDS, gzip_export, history_rows, iter_statement
 
 @router.get("", dependencies=[Depends(JWTBearer())])
-async def list_transactions(request: Request, owner_id: str, cursor: str = None):
+async def list_transactions(
+    request: Request,
+    owner_id: str,
+    cursor: str = None,
+    limit: int = Query(50, ge=1, le=100)
+):
     db: AsyncIOMotorDatabase = get_db()
     user = request.state.user
     # Only allow user to view their own transactions
     if user["sub"] != owner_id:
-        return {"transactions": []}
-    txns = db.transactions.find({"$or": [{"from_account": user["wallet_id"]}, {"to_account": user["wallet_id"]}]}, sort=[("created_at", -1)])
-    transactions = []
-    running_balance = None
-    async for txn in txns:
-        direction = "-" if txn["from_account"] == user["wallet_id"] else "+"
-        if running_balance is None:
-            running_balance = txn["from_balance_minor"] if direction == "-" else txn["to_balance_minor"]
-        transactions.append({
-            "txn_id": str(txn["_id"]),
-            "amount_minor": txn["amount_minor"],
-            "currency": txn["currency"],
-            "direction": direction,
-            "running_balance": running_balance,
-            "created_at": txn["created_at"]
-        })
-    return {"transactions": transactions}
+        return {"transactions": [], "next_cursor": None}
+    # The wallet's own ledger entries carry the balance after each posting
+    try:
+        entries, next_cursor = await fetch_page(
+            db.ledger_entries, {"account_id": user["wallet_id"]}, limit, cursor, LEDGER_FIELDS
+        )
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    transactions = await history_rows(db, entries)
+    return {"transactions": transactions, "next_cursor": next_cursor}
+
+@router.get("/export", dependencies=[Depends(JWTBearer())])
+async def export_transactions(
+    request: Request,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: datetime = None,
+    end: datetime = None,
+    cursor: str = None
+):
+    """Full statement as gzip CSV/NDJSON, oldest first; resume with the last row's cursor"""
+    db: AsyncIOMotorDatabase = get_db()
+    user = request.state.user
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(400, "Invalid cursor")
+    batches = iter_statement(db, user["wallet_id"], start, end, cursor)
+    return StreamingResponse(
+        gzip_export(batches, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={
+            "Content-Encoding": "gzip",
+            "Content-Disposition": f'attachment; filename="statement.{format}"',
+            "Cache-Control": "no-store"
+        }
+    )
@@ -1,12 +1,226 @@
 from fastapi import Request, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, JWTError
+from jose import jwk, jwt, JWTError
+from jose.exceptions import JWKError
+from cache_utils import TTLCache
 from config import config
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import logging
+import secrets
+import time
 
 # Use configuration instead of direct os.getenv
 JWT_PUBLIC_KEY = config.JWT_PUBLIC_KEY_PEM
 JWT_ALGORITHM = config.JWT_ALGORITHM
+JWT_ISSUER = "bipay-api"
+JWT_AUDIENCE = "bipay-users"
+
+def _load_public_key(public_key_pem: str, algorithm: str = JWT_ALGORITHM):
+    """Parse the verification key once; None when missing or malformed"""
+    if not public_key_pem:
+        return None
+    try:
+        return jwk.construct(public_key_pem, algorithm)
+    except JWKError as e:
+        logging.error(f"Invalid JWT public key: {e}")
+        return None
+
+def _epoch(moment: datetime) -> float:
+    """Seconds since the epoch for a naive UTC datetime"""
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+def _to_millis(moment: datetime) -> datetime:
+    """moment truncated to the millisecond precision MongoDB stores"""
+    return moment.replace(microsecond=moment.microsecond // 1000 * 1000)
+
+class RevocationList:
+    """
+    Revoked access tokens held in memory and synced from MongoDB
+
+    Tokens are revoked one at a time by jti (revoked_tokens) or per subject
+    for everything issued up to a moment (subject_revocations). Checks are
+    dict lookups on the request path; run() pulls revocations written by
+    other processes every SYNC_INTERVAL seconds. Entries are dropped once
+    the tokens they cover have expired.
+    """
+    
+    SYNC_INTERVAL = config.TOKEN_REVOCATION_SYNC_INTERVAL
+    SYNC_OVERLAP = timedelta(seconds=5)  # re-read recent writes committed out of order
+    
+    def __init__(self):
+        self._jtis: Dict[str, float] = {}  # jti -> token exp
+        self._subjects: Dict[str, float] = {}  # sub -> tokens issued at or before (to the ms) are revoked
+        self._synced_until: Optional[datetime] = None
+    
+    def is_revoked(self, claims: Dict[str, Any]) -> bool:
+        if claims.get("jti") in self._jtis:
+            return True
+        revoked_before = self._subjects.get(claims.get("sub"))
+        return revoked_before is not None and claims.get("iat", 0) <= revoked_before
+    
+    def add(self, jti: str, expires_at: datetime):
+        self._jtis[jti] = _epoch(expires_at)
+    
+    def add_subject(self, sub: str, revoked_before: float):
+        if revoked_before > self._subjects.get(sub, 0):
+            self._subjects[sub] = revoked_before
+    
+    async def revoke(self, db, claims: Dict[str, Any]):
+        """Revoke one access token everywhere; effective here immediately"""
+        jti = claims.get("jti")
+        if not jti:
+            return
+        
+        now = datetime.utcnow()
+        expires_at = datetime.fromtimestamp(claims["exp"], tz=timezone.utc).replace(tzinfo=None)
+        await db.revoked_tokens.update_one(
+            {"_id": jti},
+            {"$setOnInsert": {"sub": claims.get("sub"), "revoked_at": now, "expires_at": expires_at}},
+            upsert=True
+        )
+        self.add(jti, expires_at)
+    
+    async def revoke_subject(self, db, sub: str):
+        """Revoke every access token issued to a subject so far"""
+        # Millisecond precision, like iat, so a login right after this is not caught by it
+        now = _to_millis(datetime.utcnow())
+        await db.subject_revocations.update_one(
+            {"_id": sub},
+            {
+                "$max": {"revoked_before": now},
+                "$set": {
+                    "updated_at": now,
+                    "expires_at": now + timedelta(minutes=config.ACCESS_TOKEN_TTL_MINUTES)
+                }
+            },
+            upsert=True
+        )
+        self.add_subject(sub, _epoch(now))
+    
+    async def sync(self, db):
+        """Pull revocations written since the last sync"""
+        now = datetime.utcnow()
+        token_query, subject_query = {}, {}
+        if self._synced_until is not None:
+            since = self._synced_until - self.SYNC_OVERLAP
+            token_query = {"revoked_at": {"$gte": since}}
+            subject_query = {"updated_at": {"$gte": since}}
+        
+        async for doc in db.revoked_tokens.find(token_query, {"expires_at": 1}):
+            self.add(doc["_id"], doc["expires_at"])
+        async for doc in db.subject_revocations.find(subject_query, {"revoked_before": 1}):
+            self.add_subject(doc["_id"], _epoch(doc["revoked_before"]))
+        
+        self._synced_until = now
+        self._prune(time.time())
+    
+    async def run(self, db, interval: float = SYNC_INTERVAL):
+        """Sync immediately, then periodically until cancelled"""
+        while True:
+            try:
+                await self.sync(db)
+            except Exception as e:
+                logging.error(f"Token revocation sync failed: {e}")
+            await asyncio.sleep(interval)
+    
+    def _prune(self, now: float):
+        """Forget revocations whose tokens have all expired"""
+        self._jtis = {jti: exp for jti, exp in self._jtis.items() if exp > now}
+        horizon = now - config.ACCESS_TOKEN_TTL_MINUTES * 60
+        self._subjects = {sub: before for sub, before in self._subjects.items() if before > horizon}
+    
+    def __len__(self) -> int:
+        return len(self._jtis) + len(self._subjects)
+
+class TokenVerifier:
+    """
+    Verifies access tokens and serves repeats from a cache keyed by token digest
+
+    Decoded claims are kept until the token's exp, so a token is checked
+    with RSA once per process rather than once per request. Denied tokens
+    are rejected before the cache is consulted, and revoked ones (by jti or
+    subject) after it.
+    """
+    
+    CACHE_SIZE = 100_000
+    
+    def __init__(
+        self,
+        public_key_pem: str,
+        algorithm: str = JWT_ALGORITHM,
+        audience: str = JWT_AUDIENCE,
+        issuer: str = JWT_ISSUER,
+        maxsize: int = CACHE_SIZE,
+        revocations: Optional[RevocationList] = None
+    ):
+        self.key = _load_public_key(public_key_pem, algorithm)
+        self.algorithm = algorithm
+        self.audience = audience
+        self.issuer = issuer
+        self._claims = TTLCache(maxsize=maxsize, ttl=0)
+        self._denied = TTLCache(maxsize=maxsize, ttl=0)
+        self.revocations = revocations
+    
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+    
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Return the token's claims, raising JWTError if it is invalid or denied"""
+        digest = self._digest(token)
+        if digest in self._denied:
+            raise JWTError("Token has been revoked")
+        
+        claims = self._claims.get(digest)
+        if claims is None:
+            if self.key is None:
+                raise JWTError("JWT public key is not configured")
+            claims = jwt.decode(
+                token,
+                self.key,
+                algorithms=[self.algorithm],
+                audience=self.audience,
+                issuer=self.issuer
+            )
+            ttl = claims.get("exp", 0) - time.time()
+            if ttl > 0:
+                self._claims.set(digest, claims, ttl)
+        
+        if self.revocations is not None and self.revocations.is_revoked(claims):
+            raise JWTError("Token has been revoked")
+        
+        # Callers get their own copy; the cached claims are shared
+        return dict(claims)
+    
+    def cached_claims(self, token: str) -> Optional[Dict[str, Any]]:
+        """Claims of a token this process has already verified, or None; never runs RSA"""
+        digest = self._digest(token)
+        if digest in self._denied:
+            return None
+        claims = self._claims.get(digest)
+        if claims is None or (self.revocations is not None and self.revocations.is_revoked(claims)):
+            return None
+        return claims
+    
+    def deny(self, token: str, claims: Optional[Dict[str, Any]] = None):
+        """Reject a token from now until it would have expired anyway"""
+        digest = self._digest(token)
+        cached = self._claims.pop(digest)
+        claims = claims or cached or jwt.get_unverified_claims(token)
+        
+        ttl = claims.get("exp", time.time() + config.ACCESS_TOKEN_TTL_MINUTES * 60) - time.time()
+        if ttl > 0:
+            self._denied.set(digest, True, ttl)
+    
+    def clear(self):
+        self._claims.clear()
+
+# Built at startup so the public key is parsed once
+revocation_list = RevocationList()
+token_verifier = TokenVerifier(JWT_PUBLIC_KEY, revocations=revocation_list)
 
 class JWTBearer(HTTPBearer):
     def __init__(self, auto_error: bool = True):
@@ -16,7 +230,7 @@ class JWTBearer(HTTPBearer):
         credentials: HTTPAuthorizationCredentials = await super(JWTBearer, self).__call__(request)
         if credentials:
             try:
-                payload = jwt.decode(credentials.credentials, JWT_PUBLIC_KEY, algorithms=[JWT_ALGORITHM])
+                payload = token_verifier.verify(credentials.credentials)
                 request.state.user = payload
                 return payload
             except JWTError as e:
@@ -30,23 +244,30 @@ class JWTBearer(HTTPBearer):
                 detail="Authorization header missing"
             )
 
-def create_jwt_token(user_data: dict) -> str:
-    """Create JWT token for user authentication"""
-    from jose import jwt
+def issue_access_token(user_data: dict) -> Dict[str, Any]:
+    """Sign a short-lived access token; returns the token with its jti and expiry"""
     
-    # Token expiration
-    expires_at = datetime.utcnow() + timedelta(hours=config.JWT_EXPIRATION_HOURS)
+    issued_at = _to_millis(datetime.utcnow())
+    expires_at = issued_at + timedelta(minutes=config.ACCESS_TOKEN_TTL_MINUTES)
+    jti = secrets.token_urlsafe(16)
     
-    # Create payload
     payload = {
         "sub": user_data.get("user_id"),
+        "mobile": user_data.get("mobile"),
+        "wallet_id": user_data.get("wallet_id"),
         "email": user_data.get("email"),
-        "iat": datetime.utcnow(),
+        "jti": jti,
+        # Fractional, so subject revocations can tell tokens within one second apart
+        "iat": _epoch(issued_at),
         "exp": expires_at,
-        "iss": "bipay-api",
-        "aud": "bipay-users"
+        "iss": JWT_ISSUER,
+        "aud": JWT_AUDIENCE
     }
     
     # Sign with private key
     token = jwt.encode(payload, config.JWT_PRIVATE_KEY_PEM, algorithm=JWT_ALGORITHM)
-    return token
+    return {"token": token, "jti": jti, "expires_at": expires_at}
+
+def create_jwt_token(user_data: dict) -> str:
+    """Create JWT token for user authentication"""
+    return issue_access_token(user_data)["token"]
@@ -9,7 +9,78 @@ import json
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+import logging
 import time
+from cache_utils import TTLCache
+from config import config
+from rate_limit_backends import (
+    RateLimitBackend, create_rate_limit_backend, SCOPE_IDENTIFIER, SCOPE_IP
+)
+
+class SessionActivityBuffer:
+    """Coalesces per-request session activity and writes it to MongoDB in bulk"""
+    
+    FLUSH_INTERVAL = 5  # seconds
+    
+    def __init__(self):
+        # session_id -> [latest activity, requests since last flush]
+        self._pending: Dict[str, list] = {}
+    
+    def touch(self, session_id: str, when: Optional[datetime] = None, count: int = 1):
+        """Record validated requests for a session"""
+        when = when or datetime.utcnow()
+        entry = self._pending.get(session_id)
+        if entry is None:
+            self._pending[session_id] = [when, count]
+        else:
+            if when > entry[0]:
+                entry[0] = when
+            entry[1] += count
+    
+    def discard(self, session_id: str):
+        """Forget pending activity for a session that is no longer active"""
+        self._pending.pop(session_id, None)
+    
+    async def flush(self, db: AsyncIOMotorDatabase) -> int:
+        """Write all pending activity in one bulk operation"""
+        if not self._pending:
+            return 0
+        
+        pending, self._pending = self._pending, {}
+        operations = [
+            UpdateOne(
+                {"_id": session_id, "status": "active"},
+                {
+                    "$max": {"last_activity": last_activity},
+                    "$inc": {"activity_count": count}
+                }
+            )
+            for session_id, (last_activity, count) in pending.items()
+        ]
+        
+        try:
+            await db.user_sessions.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Activity is advisory; keep it for the next flush rather than failing requests
+            logging.error(f"Session activity flush failed: {e}")
+            for session_id, (last_activity, count) in pending.items():
+                self.touch(session_id, last_activity, count)
+            return 0
+        
+        return len(operations)
+    
+    async def run(self, db: AsyncIOMotorDatabase, interval: float = FLUSH_INTERVAL):
+        """Flush periodically until cancelled, then flush what is left"""
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                await self.flush(db)
+        finally:
+            await self.flush(db)
+    
+    def __len__(self) -> int:
+        return len(self._pending)
 
 class SessionManager:
     """Advanced session management with security features"""
@@ -18,6 +89,17 @@ class SessionManager:
     SESSION_TIMEOUT = 30  # minutes
     MAX_SESSIONS_PER_USER = 5
     SESSION_REFRESH_THRESHOLD = 5  # minutes before expiry
+    SESSION_CACHE_TTL = 5  # seconds a validated session is served from memory
+    SWEEP_INTERVAL = 60  # seconds between bulk expiry sweeps
+    SWEEP_BATCH_SIZE = 1000
+    
+    # Write-behind activity tracking and short-lived validation cache
+    activity = SessionActivityBuffer()
+    _session_cache = TTLCache(maxsize=50_000, ttl=SESSION_CACHE_TTL)
+    # user_id -> (monotonic time of invalidate_all_sessions, session kept)
+    _user_invalidations = TTLCache(maxsize=50_000, ttl=SESSION_CACHE_TTL)
+    # session_id -> monotonic time the session was ended or dropped from the cache
+    _session_invalidations = TTLCache(maxsize=50_000, ttl=SESSION_CACHE_TTL)
     
     @staticmethod
     async def create_session(
@@ -29,18 +111,6 @@ class SessionManager:
     ) -> Dict[str, Any]:
         """Create new user session"""
         
-        # Check for existing sessions
-        existing_sessions = await db.user_sessions.count_documents({
-            "user_id": user_id,
-            "status": "active",
-            "expires_at": {"$gt": datetime.utcnow()}
-        })
-        
-        # Cleanup old sessions if limit exceeded
-        if existing_sessions >= SessionManager.MAX_SESSIONS_PER_USER:
-            await SessionManager._cleanup_old_sessions(db, user_id)
-        
-        # Create session
         session_id = hashlib.sha256(f"{user_id}{device_id}{time.time()}".encode()).hexdigest()
         expires_at = datetime.utcnow() + timedelta(minutes=SessionManager.SESSION_TIMEOUT)
         
@@ -59,6 +129,21 @@ class SessionManager:
         
         await db.user_sessions.insert_one(session_data)
         
+        # Per-user active count is maintained in session_counters instead of counted per login
+        counter = await db.session_counters.find_one_and_update(
+            {"_id": user_id},
+            {"$inc": {"active": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        
+        # Replace the oldest sessions if limit exceeded, recounting first in case the count drifted
+        if counter["active"] > SessionManager.MAX_SESSIONS_PER_USER:
+            counts = await SessionManager._recount_sessions(db, [user_id])
+            excess = counts[user_id] - SessionManager.MAX_SESSIONS_PER_USER
+            if excess > 0:
+                await SessionManager._replace_oldest_sessions(db, user_id, excess, keep=session_id)
+        
         return {
             "session_id": session_id,
             "expires_at": expires_at,
@@ -74,21 +159,30 @@ class SessionManager:
     ) -> Dict[str, Any]:
         """Validate and update session"""
         
-        session = await db.user_sessions.find_one({
-            "_id": session_id,
-            "user_id": user_id,
-            "status": "active"
-        })
+        session = SessionManager._cached_session(session_id)
+        if session is None:
+            # Stamp before reading so an invalidation during the read still applies
+            fetched_at = time.monotonic()
+            session = await db.user_sessions.find_one({
+                "_id": session_id,
+                "status": "active"
+            })
+            if session and not SessionManager._invalidated_since(session, fetched_at):
+                SessionManager._session_cache.set(session_id, (session, fetched_at))
         
-        if not session:
+        if not session or session["user_id"] != user_id:
             return {"valid": False, "reason": "session_not_found"}
         
         # Check expiration
         if session["expires_at"] < datetime.utcnow():
-            await db.user_sessions.update_one(
-                {"_id": session_id},
-                {"$set": {"status": "expired"}}
+            SessionManager._forget_session(session_id)
+            now = datetime.utcnow()
+            result = await db.user_sessions.update_one(
+                {"_id": session_id, "status": "active"},
+                {"$set": {"status": "expired", "expired_at": now, "ended_at": now}}
             )
+            if result.modified_count > 0:
+                await SessionManager._adjust_session_count(db, user_id, -1)
             return {"valid": False, "reason": "session_expired"}
         
         # Check IP address (optional security check)
@@ -102,14 +196,8 @@ class SessionManager:
                 }
             )
         
-        # Update last activity
-        await db.user_sessions.update_one(
-            {"_id": session_id},
-            {
-                "$set": {"last_activity": datetime.utcnow()},
-                "$inc": {"activity_count": 1}
-            }
-        )
+        # Update last activity (flushed in bulk by SessionActivityBuffer)
+        SessionManager.activity.touch(session_id)
         
         # Check if session needs refresh
         time_until_expiry = session["expires_at"] - datetime.utcnow()
@@ -137,6 +225,7 @@ class SessionManager:
         )
         
         if result.modified_count > 0:
+            SessionManager._session_cache.pop(session_id)
             return {"refreshed": True, "expires_at": new_expires_at}
         
         return {"refreshed": False, "reason": "session_not_found"}
@@ -149,12 +238,18 @@ class SessionManager:
     ) -> bool:
         """Invalidate specific session"""
         
+        SessionManager._forget_session(session_id)
+        
+        now = datetime.utcnow()
         result = await db.user_sessions.update_one(
-            {"_id": session_id, "user_id": user_id},
-            {"$set": {"status": "invalidated", "invalidated_at": datetime.utcnow()}}
+            {"_id": session_id, "user_id": user_id, "status": "active"},
+            {"$set": {"status": "invalidated", "invalidated_at": now, "ended_at": now}}
         )
         
-        return result.modified_count > 0
+        if result.modified_count > 0:
+            await SessionManager._adjust_session_count(db, user_id, -1)
+            return True
+        return False
     
     @staticmethod
     async def invalidate_all_sessions(
@@ -164,35 +259,153 @@ class SessionManager:
     ) -> int:
         """Invalidate all user sessions except specified one"""
         
+        SessionManager._user_invalidations.set(user_id, (time.monotonic(), except_session))
+        
         query = {"user_id": user_id, "status": "active"}
         if except_session:
             query["_id"] = {"$ne": except_session}
         
+        now = datetime.utcnow()
         result = await db.user_sessions.update_many(
             query,
-            {"$set": {"status": "invalidated", "invalidated_at": datetime.utcnow()}}
+            {"$set": {"status": "invalidated", "invalidated_at": now, "ended_at": now}}
         )
         
+        await SessionManager._adjust_session_count(db, user_id, -result.modified_count)
         return result.modified_count
     
     @staticmethod
-    async def _cleanup_old_sessions(
+    async def sweep_expired_sessions(
         db: AsyncIOMotorDatabase,
-        user_id: str
+        batch_size: int = SWEEP_BATCH_SIZE
+    ) -> int:
+        """Mark every active session past its expiry as expired, in bulk"""
+        
+        now = datetime.utcnow()
+        swept = 0
+        
+        while True:
+            expired = await db.user_sessions.find(
+                {"status": "active", "expires_at": {"$lt": now}},
+                {"user_id": 1}
+            ).limit(batch_size).to_list(batch_size)
+            if not expired:
+                break
+            
+            session_ids = [session["_id"] for session in expired]
+            result = await db.user_sessions.update_many(
+                {"_id": {"$in": session_ids}, "status": "active"},
+                {"$set": {"status": "expired", "expired_at": now, "ended_at": now}}
+            )
+            swept += result.modified_count
+            
+            for session_id in session_ids:
+                SessionManager._forget_session(session_id)
+            await SessionManager._recount_sessions(db, {session["user_id"] for session in expired})
+            
+            if len(expired) < batch_size:
+                break
+        
+        return swept
+    
+    @staticmethod
+    async def run_sweeper(db: AsyncIOMotorDatabase, interval: float = SWEEP_INTERVAL):
+        """Sweep expired sessions periodically until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                swept = await SessionManager.sweep_expired_sessions(db)
+                if swept:
+                    logging.info(f"Expired {swept} sessions")
+            except Exception as e:
+                logging.error(f"Session sweep failed: {e}")
+    
+    @staticmethod
+    def _cached_session(session_id: str) -> Optional[Dict[str, Any]]:
+        """Cached active session, unless its user was invalidated since it was cached"""
+        cached = SessionManager._session_cache.get(session_id)
+        if cached is None:
+            return None
+        
+        session, cached_at = cached
+        if SessionManager._invalidated_since(session, cached_at):
+            SessionManager._forget_session(session_id)
+            return None
+        return session
+    
+    @staticmethod
+    def _invalidated_since(session: Dict[str, Any], fetched_at: float) -> bool:
+        """Whether the session or its user was invalidated after fetched_at"""
+        invalidated_at = SessionManager._session_invalidations.get(session["_id"])
+        if invalidated_at is not None and fetched_at <= invalidated_at:
+            return True
+        invalidation = SessionManager._user_invalidations.get(session["user_id"])
+        return bool(invalidation and fetched_at <= invalidation[0] and session["_id"] != invalidation[1])
+    
+    @staticmethod
+    def _forget_session(session_id: str):
+        # Marked so a read already in flight cannot cache the session again
+        SessionManager._session_invalidations.set(session_id, time.monotonic())
+        SessionManager._session_cache.pop(session_id)
+        SessionManager.activity.discard(session_id)
+    
+    @staticmethod
+    async def _replace_oldest_sessions(
+        db: AsyncIOMotorDatabase,
+        user_id: str,
+        count: int,
+        keep: Optional[str] = None
     ):
-        """Remove oldest sessions when limit exceeded"""
+        """Replace the least recently active sessions (other than keep) when limit exceeded"""
         
-        # Get oldest active session
-        oldest_session = await db.user_sessions.find_one(
-            {"user_id": user_id, "status": "active"},
-            sort=[("last_activity", 1)]
+        query = {"user_id": user_id, "status": "active"}
+        if keep:
+            query["_id"] = {"$ne": keep}
+        oldest_sessions = await db.user_sessions.find(
+            query,
+            {"_id": 1}
+        ).sort("last_activity", 1).limit(count).to_list(count)
+        
+        session_ids = [session["_id"] for session in oldest_sessions]
+        if not session_ids:
+            return
+        
+        now = datetime.utcnow()
+        result = await db.user_sessions.update_many(
+            {"_id": {"$in": session_ids}, "status": "active"},
+            {"$set": {"status": "replaced", "replaced_at": now, "ended_at": now}}
         )
         
-        if oldest_session:
-            await db.user_sessions.update_one(
-                {"_id": oldest_session["_id"]},
-                {"$set": {"status": "replaced", "replaced_at": datetime.utcnow()}}
-            )
+        for session_id in session_ids:
+            SessionManager._forget_session(session_id)
+        await SessionManager._adjust_session_count(db, user_id, -result.modified_count)
+    
+    @staticmethod
+    async def _adjust_session_count(db: AsyncIOMotorDatabase, user_id: str, delta: int):
+        """Apply a change in a user's active session count"""
+        if delta:
+            await db.session_counters.update_one({"_id": user_id}, {"$inc": {"active": delta}})
+    
+    @staticmethod
+    async def _recount_sessions(db: AsyncIOMotorDatabase, user_ids) -> Dict[str, int]:
+        """Reset users' active session counts from the sessions themselves"""
+        
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        
+        counts = {
+            row["_id"]: row["active"]
+            async for row in db.user_sessions.aggregate([
+                {"$match": {"user_id": {"$in": user_ids}, "status": "active"}},
+                {"$group": {"_id": "$user_id", "active": {"$sum": 1}}}
+            ])
+        }
+        await db.session_counters.bulk_write([
+            UpdateOne({"_id": user_id}, {"$set": {"active": counts.get(user_id, 0)}}, upsert=True)
+            for user_id in user_ids
+        ], ordered=False)
+        return {user_id: counts.get(user_id, 0) for user_id in user_ids}
     
     @staticmethod
     async def _log_security_event(
@@ -225,6 +438,14 @@ class RateLimiter:
         "password_reset": {"window": 3600, "max_attempts": 3}  # 3 resets per hour
     }
     
+    # Attempt storage (see rate_limit_backends)
+    backend: RateLimitBackend = create_rate_limit_backend(config.RATE_LIMIT_BACKEND, config.REDIS_URL)
+    
+    @staticmethod
+    def set_backend(backend: RateLimitBackend):
+        """Swap the attempt storage backend"""
+        RateLimiter.backend = backend
+    
     @staticmethod
     async def check_rate_limit(
         db: AsyncIOMotorDatabase,
@@ -240,22 +461,11 @@ class RateLimiter:
         limit_config = RateLimiter.LIMITS[action]
         window_start = datetime.utcnow() - timedelta(seconds=limit_config["window"])
         
-        # Count recent attempts
-        query = {
-            "identifier": identifier,
-            "action": action,
-            "timestamp": {"$gte": window_start}
-        }
-        
         if ip_address:
             # Also check IP-based limits
-            ip_query = {
-                "ip_address": ip_address,
-                "action": action,
-                "timestamp": {"$gte": window_start}
-            }
-            
-            ip_count = await db.rate_limits.count_documents(ip_query)
+            ip_count = await RateLimiter.backend.count_attempts(
+                db, SCOPE_IP, ip_address, action, limit_config["window"]
+            )
             if ip_count >= limit_config["max_attempts"]:
                 return {
                     "allowed": False,
@@ -265,7 +475,10 @@ class RateLimiter:
                     "max_attempts": limit_config["max_attempts"]
                 }
         
-        attempt_count = await db.rate_limits.count_documents(query)
+        # Count recent attempts
+        attempt_count = await RateLimiter.backend.count_attempts(
+            db, SCOPE_IDENTIFIER, identifier, action, limit_config["window"]
+        )
         
         if attempt_count >= limit_config["max_attempts"]:
             return {
@@ -283,6 +496,40 @@ class RateLimiter:
             "remaining": limit_config["max_attempts"] - attempt_count
         }
     
+    @staticmethod
+    async def check_and_record(
+        db: AsyncIOMotorDatabase,
+        identifier: str,
+        action: str,
+        ip_address: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Check the limit and count this attempt in one backend operation"""
+        
+        if action not in RateLimiter.LIMITS:
+            return {"allowed": True, "reason": "no_limit_configured"}
+        
+        limit_config = RateLimiter.LIMITS[action]
+        reason, attempts = await RateLimiter.backend.hit(
+            db, identifier, action, ip_address, limit_config, metadata
+        )
+        
+        if reason:
+            return {
+                "allowed": False,
+                "reason": reason,
+                "reset_at": datetime.utcnow(),
+                "attempts": attempts,
+                "max_attempts": limit_config["max_attempts"]
+            }
+        
+        return {
+            "allowed": True,
+            "attempts": attempts,
+            "max_attempts": limit_config["max_attempts"],
+            "remaining": limit_config["max_attempts"] - attempts
+        }
+    
     @staticmethod
     async def record_attempt(
         db: AsyncIOMotorDatabase,
@@ -294,27 +541,10 @@ class RateLimiter:
     ):
         """Record an attempt for rate limiting"""
         
-        attempt_record = {
-            "identifier": identifier,
-            "action": action,
-            "ip_address": ip_address,
-            "success": success,
-            "metadata": metadata or {},
-            "timestamp": datetime.utcnow()
-        }
-        
-        await db.rate_limits.insert_one(attempt_record)
-        
-        # Clean up old records periodically
-        if action in RateLimiter.LIMITS:
-            cleanup_before = datetime.utcnow() - timedelta(
-                seconds=RateLimiter.LIMITS[action]["window"] * 2
-            )
-            
-            await db.rate_limits.delete_many({
-                "action": action,
-                "timestamp": {"$lt": cleanup_before}
-            })
+        await RateLimiter.backend.record_attempt(
+            db, identifier, action, ip_address, success, metadata,
+            RateLimiter.LIMITS.get(action)
+        )
     
     @staticmethod
     async def get_rate_limit_status(
@@ -325,21 +555,17 @@ class RateLimiter:
         
         status = {}
         
-        for action, config in RateLimiter.LIMITS.items():
-            window_start = datetime.utcnow() - timedelta(seconds=config["window"])
-            
-            attempt_count = await db.rate_limits.count_documents({
-                "identifier": identifier,
-                "action": action,
-                "timestamp": {"$gte": window_start}
-            })
+        for action, limit_config in RateLimiter.LIMITS.items():
+            attempt_count = await RateLimiter.backend.count_attempts(
+                db, SCOPE_IDENTIFIER, identifier, action, limit_config["window"]
+            )
             
             status[action] = {
                 "attempts": attempt_count,
-                "max_attempts": config["max_attempts"],
-                "remaining": max(0, config["max_attempts"] - attempt_count),
-                "window_seconds": config["window"],
-                "is_limited": attempt_count >= config["max_attempts"]
+                "max_attempts": limit_config["max_attempts"],
+                "remaining": max(0, limit_config["max_attempts"] - attempt_count),
+                "window_seconds": limit_config["window"],
+                "is_limited": attempt_count >= limit_config["max_attempts"]
             }
         
         return status
@@ -352,9 +578,4 @@ class RateLimiter:
     ) -> bool:
         """Reset rate limit for specific action (admin function)"""
         
-        result = await db.rate_limits.delete_many({
-            "identifier": identifier,
-            "action": action
-        })
-        
-        return result.deleted_count > 0
+        return await RateLimiter.backend.reset(db, identifier, action)
@@ -0,0 +1,67 @@
+"""
+Batch biometric verification tests
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import biometric
+from biometric import (
+    generate_device_keypair, shutdown_batch_pool, sign_payload,
+    verify_biometric_signatures_batch, verify_biometric_signatures_batch_async
+)
+
+def _build_items(count_per_key: int = 40):
+    keys = [generate_device_keypair() for _ in range(2)]
+    items = []
+    expected = []
+    for i in range(count_per_key):
+        for k, keypair in enumerate(keys):
+            payload = {"intent": "p2p", "amount": i, "device": k}
+            signature = sign_payload(keypair["private_key"], payload)
+            if i % 7 == 0:
+                # Tamper with the payload after signing
+                payload = {**payload, "amount": i + 1}
+                expected.append(False)
+            else:
+                expected.append(True)
+            items.append((keypair["public_key"], payload, signature))
+    return keys, items, expected
+
+def test_batch_results_match_input_order():
+    _, items, expected = _build_items()
+    assert verify_biometric_signatures_batch(items) == expected
+
+def test_batches_share_one_process_pool():
+    _, items, expected = _build_items()
+    try:
+        assert verify_biometric_signatures_batch(items, max_workers=2) == expected
+        pool = biometric._batch_pool
+        assert pool is not None
+        assert verify_biometric_signatures_batch(items) == expected
+        assert biometric._batch_pool is pool
+    finally:
+        shutdown_batch_pool()
+    assert biometric._batch_pool is None
+
+def test_batch_with_process_pool():
+    _, items, expected = _build_items()
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        assert verify_biometric_signatures_batch(items, executor=pool) == expected
+
+def test_batch_rejects_bad_keys_and_signatures():
+    keypair = generate_device_keypair()
+    payload = {"intent": "p2p", "amount": 100}
+    signature = sign_payload(keypair["private_key"], payload)
+    items = [
+        (keypair["public_key"], payload, signature),
+        ("not a pem", payload, signature),
+        (keypair["public_key"], payload, "!!not-base64!!"),
+        (keypair["public_key"], {}, signature),
+    ]
+    assert verify_biometric_signatures_batch(items) == [True, False, False, False]
+
+def test_batch_async_wrapper():
+    _, items, expected = _build_items(count_per_key=5)
+    assert asyncio.run(verify_biometric_signatures_batch_async(items)) == expected
+    assert verify_biometric_signatures_batch([]) == []
@@ -0,0 +1,67 @@
+"""
+Compact payment intent encoding tests
+"""
+
+import pytest
+
+from biometric import (
+    canonical_json, canonical_payload_bytes, encode_payment_intent,
+    generate_device_keypair, sign_payload, verify_biometric_signature,
+    verify_biometric_signatures_batch, SIGNATURE_VERSION_JSON, SIGNATURE_VERSION_COMPACT
+)
+
+P2P_PAYLOAD = {
+    "user_id": "user1",
+    "device_id": "device1",
+    "nonce": "abc123",
+    "ts": 1760000000,
+    "intent": "p2p",
+    "amount": 2500,
+    "currency": "INR",
+    "to_account": "wallet_user2",
+    "memo": "chai ☕"
+}
+
+def test_compact_encoding_is_deterministic_and_smaller():
+    reordered = dict(reversed(list(P2P_PAYLOAD.items())))
+    assert encode_payment_intent(P2P_PAYLOAD) == encode_payment_intent(reordered)
+    assert encode_payment_intent(P2P_PAYLOAD)[:2] == bytes((SIGNATURE_VERSION_COMPACT, 1))
+    assert len(encode_payment_intent(P2P_PAYLOAD)) < len(canonical_json(P2P_PAYLOAD).encode())
+
+def test_compact_encoding_rejects_layout_mismatch():
+    with pytest.raises(ValueError):
+        encode_payment_intent({**P2P_PAYLOAD, "extra": "field"})
+    with pytest.raises(ValueError):
+        encode_payment_intent({k: v for k, v in P2P_PAYLOAD.items() if k != "memo"})
+    with pytest.raises(ValueError):
+        encode_payment_intent({**P2P_PAYLOAD, "amount": "2500"})
+    with pytest.raises(ValueError):
+        encode_payment_intent({**P2P_PAYLOAD, "intent": "unknown"})
+
+def test_compact_encoding_rejects_non_string_values():
+    # None must not encode like the string "None"
+    with pytest.raises(ValueError):
+        encode_payment_intent({**P2P_PAYLOAD, "memo": None})
+    with pytest.raises(ValueError):
+        encode_payment_intent({**P2P_PAYLOAD, "to_account": 42})
+    assert encode_payment_intent({**P2P_PAYLOAD, "memo": ""}) != encode_payment_intent({**P2P_PAYLOAD, "memo": "None"})
+
+def test_both_versions_verify_and_do_not_cross():
+    keypair = generate_device_keypair()
+    legacy = sign_payload(keypair["private_key"], P2P_PAYLOAD)
+    compact = sign_payload(keypair["private_key"], P2P_PAYLOAD, SIGNATURE_VERSION_COMPACT)
+    
+    assert verify_biometric_signature(keypair["public_key"], P2P_PAYLOAD, legacy)
+    assert verify_biometric_signature(keypair["public_key"], P2P_PAYLOAD, compact, SIGNATURE_VERSION_COMPACT)
+    assert not verify_biometric_signature(keypair["public_key"], P2P_PAYLOAD, compact, SIGNATURE_VERSION_JSON)
+    assert not verify_biometric_signature(keypair["public_key"], P2P_PAYLOAD, legacy, 99)
+    
+    items = [
+        (keypair["public_key"], P2P_PAYLOAD, legacy),
+        (keypair["public_key"], P2P_PAYLOAD, compact, SIGNATURE_VERSION_COMPACT),
+    ]
+    assert verify_biometric_signatures_batch(items) == [True, True]
+
+def test_unknown_version_raises():
+    with pytest.raises(ValueError):
+        canonical_payload_bytes(P2P_PAYLOAD, 3)
@@ -381,7 +381,7 @@ class BiPayTestSuite:
             await self.db.security_logs.delete_many({"user_id": {"$regex": "^test_"}})
             await self.db.notifications.delete_many({"user_id": {"$regex": "^test_"}})
             await self.db.user_sessions.delete_many({"user_id": {"$regex": "^test_"}})
-            await self.db.rate_limits.delete_many({"identifier": {"$regex": "^test_"}})
+            await self.db.rate_limit_windows.delete_many({"_id": {"$regex": ":identifier:test_"}})
             
             print("🧹 Test data cleanup completed")
         except Exception as e:
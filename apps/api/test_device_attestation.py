@@ -0,0 +1,120 @@
+"""
+Attestation verdict cache tests
+"""
+
+import asyncio
+import base64
+import time
+from datetime import datetime, timedelta
+
+from device_attestation import AttestationVerifier
+from integrity_client import LocalIntegrityStub, set_integrity_client
+
+PUBLIC_KEY = "-----BEGIN PUBLIC KEY-----\nMIIBIjANBgkqhkiG9w0BAQEFAAOCAQ8AMIIBCgKCAQEAtest\n-----END PUBLIC KEY-----"
+
+def _attestation(token: str = "integrity-token"):
+    return {
+        "nonce": base64.b64encode(b"n" * 32).decode(),
+        "package_name": "com.bipay.app",
+        "apk_digest": "a" * 64,
+        "tee_enforced": True,
+        "timestamp": int(time.time()),
+        "integrity_token": token
+    }
+
+def _fresh_stub():
+    AttestationVerifier._verdicts.clear()
+    stub = LocalIntegrityStub()
+    set_integrity_client(stub)
+    return stub
+
+def test_reenrollment_storm_makes_one_remote_call():
+    stub = _fresh_stub()
+    
+    async def storm():
+        return await asyncio.gather(*[
+            AttestationVerifier.verify("user1", "device1", PUBLIC_KEY, _attestation()) for _ in range(50)
+        ])
+    
+    results = asyncio.run(storm())
+    assert all(r["valid"] for r in results)
+    assert stub.calls == 1
+    
+    # Later enrollments are served from the cache
+    again = asyncio.run(AttestationVerifier.verify("user1", "device1", PUBLIC_KEY, _attestation()))
+    assert again["checks"]["integrity_cached"] is True
+    assert stub.calls == 1
+
+def test_key_change_and_revocation_bypass_cache():
+    stub = _fresh_stub()
+    asyncio.run(AttestationVerifier.verify("user1", "device2", PUBLIC_KEY, _attestation()))
+    asyncio.run(AttestationVerifier.verify("user1", "device2", PUBLIC_KEY.replace("test", "other"), _attestation()))
+    assert stub.calls == 2
+    
+    AttestationVerifier.revoke("device2")
+    asyncio.run(AttestationVerifier.verify("user1", "device2", PUBLIC_KEY, _attestation()))
+    assert stub.calls == 3
+
+def test_failing_verdict_rejects_enrollment():
+    _fresh_stub()
+    result = asyncio.run(AttestationVerifier.verify("user1", "device3", PUBLIC_KEY, _attestation("fail-token")))
+    assert result["valid"] is False
+    assert result["checks"]["play_integrity"] is False
+
+def test_stored_verdict_is_reused():
+    stub = _fresh_stub()
+    stored_device = {
+        "user_id": "user1",
+        "status": "active",
+        "attestation_result": {
+            "integrity_verdict": {
+                "passed": True,
+                "reason": "Integrity verdict passed",
+                "fingerprint": AttestationVerifier.key_fingerprint(PUBLIC_KEY),
+                "verified_at": datetime.utcnow() - timedelta(minutes=5)
+            }
+        }
+    }
+    result = asyncio.run(AttestationVerifier.verify("user1", "device4", PUBLIC_KEY, _attestation(), stored_device))
+    assert result["valid"] and result["checks"]["integrity_cached"]
+    assert stub.calls == 0
+    
+    stored_device["status"] = "revoked"
+    AttestationVerifier.revoke("device4")
+    asyncio.run(AttestationVerifier.verify("user1", "device4", PUBLIC_KEY, _attestation(), stored_device))
+    assert stub.calls == 1
+
+def test_token_is_required_once_the_service_is_configured():
+    stub = _fresh_stub()
+    attestation = _attestation()
+    del attestation["integrity_token"]
+    result = asyncio.run(AttestationVerifier.verify("user1", "device5", PUBLIC_KEY, attestation))
+    assert result["valid"] is False
+    assert result["reason"] == "Integrity token required"
+    assert stub.calls == 0
+    
+    # Without a configured service only local checks apply
+    set_integrity_client(None)
+    assert asyncio.run(AttestationVerifier.verify("user1", "device5", PUBLIC_KEY, attestation))["valid"]
+
+def test_cached_verdict_is_not_shared_across_users():
+    stub = _fresh_stub()
+    asyncio.run(AttestationVerifier.verify("user1", "device6", PUBLIC_KEY, _attestation()))
+    stored_device = {"_id": "device6", "user_id": "user1", "status": "active", "attestation_result": {}}
+    
+    other = asyncio.run(AttestationVerifier.verify("user2", "device6", PUBLIC_KEY, _attestation(), stored_device))
+    assert other["checks"]["integrity_cached"] is False
+    assert stub.calls == 2
+
+def test_revocation_by_another_worker_is_honored():
+    stub = _fresh_stub()
+    asyncio.run(AttestationVerifier.verify("user1", "device7", PUBLIC_KEY, _attestation()))
+    
+    # Revoked elsewhere: this process still has the verdict cached, but the document says revoked
+    revoked = {"_id": "device7", "user_id": "user1", "status": "revoked", "attestation_result": {}}
+    result = asyncio.run(AttestationVerifier.verify("user1", "device7", PUBLIC_KEY, _attestation(), revoked))
+    assert result["checks"]["integrity_cached"] is False
+    assert stub.calls == 2
+
+def teardown_module():
+    set_integrity_client(None)
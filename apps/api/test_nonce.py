@@ -0,0 +1,96 @@
+"""
+Stateless and stored nonce tests
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+from unittest import mock
+
+import pytest
+
+import nonce_utils
+from config import config
+from nonce_utils import issue_stateless_nonce, open_stateless_nonce, verify_nonce
+
+@pytest.fixture(autouse=True)
+def nonce_secret(monkeypatch):
+    monkeypatch.setattr(config, "NONCE_HMAC_SECRET", "n" * 64)
+
+def test_stateless_nonce_is_bound_to_user_and_device():
+    nonce = issue_stateless_nonce("user1", "device1")
+    assert open_stateless_nonce(nonce, "user1", "device1") is not None
+    assert open_stateless_nonce(nonce, "user2", "device1") is None
+    assert open_stateless_nonce(nonce, "user1", "device2") is None
+    assert open_stateless_nonce(nonce[:-2] + "AA", "user1", "device1") is None
+    assert open_stateless_nonce("s1.???", "user1", "device1") is None
+
+def test_expired_stateless_nonce_is_rejected():
+    nonce = issue_stateless_nonce("user1", "device1", ttl=-1)
+    assert open_stateless_nonce(nonce, "user1", "device1") is None
+
+def test_stateless_nonce_is_single_use_without_issue_writes(fake_db):
+    db = fake_db()
+    with mock.patch.object(nonce_utils.config, "NONCE_MODE", "stateless"):
+        nonce = asyncio.run(nonce_utils.issue_nonce(db, "user1", "device1"))
+    assert db.consumed_nonces.docs == {}
+    assert db.nonces.docs == {}
+    
+    async def race():
+        return await asyncio.gather(*[verify_nonce(db, nonce, "user1", "device1") for _ in range(10)])
+    
+    assert sum(asyncio.run(race())) == 1
+    assert len(db.consumed_nonces.docs) == 1
+
+def test_stored_nonce_is_consumed_exactly_once_under_concurrency(fake_db, monkeypatch):
+    monkeypatch.setattr(config, "NONCE_MODE", "stored")
+    db = fake_db()
+    
+    async def scenario():
+        nonce = await nonce_utils.issue_nonce(db, "user1", "device1")
+        other = await nonce_utils.issue_nonce(db, "user1", "device1")
+        reused = await asyncio.gather(*[verify_nonce(db, nonce, "user1", "device1") for _ in range(20)])
+        wrong_owner = [
+            await verify_nonce(db, other, "user2", "device1"),
+            await verify_nonce(db, other, "user1", "device2")
+        ]
+        return reused, wrong_owner
+    
+    reused, wrong_owner = asyncio.run(scenario())
+    assert sum(reused) == 1
+    assert wrong_owner == [False, False]
+    assert [doc["used"] for doc in db.nonces.docs.values()] == [True, False]
+    # One conditional update per attempt, no read-then-write
+    assert db.nonces.count("find_one_and_update") == 22
+    assert db.nonces.count("find_one") == db.nonces.count("update_one") == 0
+
+def test_expired_stored_nonce_is_rejected(fake_db, monkeypatch):
+    monkeypatch.setattr(config, "NONCE_MODE", "stored")
+    db = fake_db()
+    nonce = asyncio.run(nonce_utils.issue_nonce(db, "user1", "device1"))
+    for doc in db.nonces.docs.values():
+        doc["expires_at"] = doc["expires_at"].replace(year=2000)
+    assert asyncio.run(verify_nonce(db, nonce, "user1", "device1")) is False
+
+def test_stateless_mode_requires_a_dedicated_secret(monkeypatch):
+    monkeypatch.setattr(config, "NONCE_MODE", "stateless")
+    for secret in ("", "short", config.WEBHOOK_HMAC_SECRET):
+        monkeypatch.setattr(config, "NONCE_HMAC_SECRET", secret)
+        with pytest.raises(RuntimeError):
+            config.validate_nonce_config()
+    
+    monkeypatch.setattr(config, "NONCE_HMAC_SECRET", "")
+    with pytest.raises(RuntimeError):
+        issue_stateless_nonce("user1", "device1")
+    
+    monkeypatch.setattr(config, "NONCE_MODE", "stored")
+    config.validate_nonce_config()
+
+def test_default_mode_starts_without_a_nonce_secret():
+    # A deployment that has never heard of NONCE_MODE keeps stored nonces and still starts
+    env = {key: value for key, value in os.environ.items() if key not in ("NONCE_MODE", "NONCE_HMAC_SECRET")}
+    subprocess.run(
+        [sys.executable, "-c", "from config import config; assert config.NONCE_MODE == 'stored'; config.validate_nonce_config()"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True, capture_output=True
+    )
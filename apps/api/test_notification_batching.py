@@ -0,0 +1,109 @@
+"""
+Batched notification delivery and unified notification record tests
+"""
+
+import asyncio
+
+from notification_service import NotificationBatcher, NotificationService
+from notify_utils import log_history
+from principal_cache import PrincipalCache
+
+def _db(fake_db, users=200):
+    return fake_db(
+        devices=[{"_id": f"device{i}", "user_id": f"user{i}", "fcm_token": f"token{i}"} for i in range(0, users, 2)],
+        users=[{"_id": f"user{i}", "email": f"user{i}@bipay.test"} for i in range(users)]
+    )
+
+def test_concurrent_notifications_share_round_trips(fake_db):
+    db = _db(fake_db)
+    
+    async def burst():
+        await asyncio.gather(*[
+            NotificationService.send_transaction_notification(
+                db, f"user{i}", "p2p", {"amount_minor": 100 * i}, success=True
+            )
+            for i in range(50)
+        ])
+    
+    asyncio.run(burst())
+    assert db.notifications.calls == [("insert_many", 50), ("bulk_write", 50)]
+    assert db.in_app_notifications.calls == []
+    # Push is left to the dispatcher worker
+    assert db.devices.calls == []
+    
+    records = {doc["user_id"]: doc for doc in db.notifications.docs.values()}
+    assert records["user0"]["delivered_channels"] == ["in_app"]
+    assert records["user0"]["push_status"] == "queued"
+    assert records["user0"]["status"] == "delivered"
+    assert db.notification_counters.calls == [("bulk_write", 50)]
+
+def test_compliance_broadcast_is_chunked(fake_db):
+    PrincipalCache.clear()
+    db = _db(fake_db, users=1200)
+    user_ids = [f"user{i}" for i in range(1200)]
+    
+    sent = asyncio.run(NotificationService.send_compliance_broadcast(db, user_ids, "kyc_expired", {}))
+    assert sent == 1200
+    inserts = [count for call, count in db.notifications.calls if call == "insert_many"]
+    assert inserts == [500, 500, 200]
+    assert len(db.users.calls) == 3
+    assert all(doc["status"] == "delivered" for doc in db.notifications.docs.values())
+    assert all("email" in doc["delivered_channels"] for doc in db.notifications.docs.values())
+
+def test_failed_batch_reaches_every_submitter(fake_db):
+    db = _db(fake_db)
+    
+    async def broken(*args, **kwargs):
+        raise RuntimeError("database unavailable")
+    db.notifications.insert_many = broken
+    
+    async def burst():
+        return await asyncio.gather(*[
+            NotificationService.send_fraud_alert(db, f"user{i}", {}, {"amount_minor": 1}) for i in range(3)
+        ], return_exceptions=True)
+    
+    results = asyncio.run(burst())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+def test_close_waits_for_full_batch_flushes_and_delivers_the_rest(fake_db):
+    db = _db(fake_db)
+    
+    async def scenario():
+        batcher = NotificationBatcher(max_batch=3, max_delay=60)
+        notification = {"user_id": "user1", "type": "info", "title": "t", "message": "m", "channels": ["in_app"]}
+        submitters = [asyncio.create_task(batcher.submit(db, dict(notification))) for _ in range(3)]
+        await asyncio.sleep(0)
+        in_flight = len(batcher._flushes)
+        await asyncio.sleep(0)
+        # The full batch is flushing in the background; this one waits on the timer
+        submitters.append(asyncio.create_task(batcher.submit(db, dict(notification))))
+        await asyncio.sleep(0)
+        assert len(batcher) == 1
+        await batcher.close()
+        ids = await asyncio.wait_for(asyncio.gather(*submitters), 1)
+        return in_flight, batcher._flushes, ids
+    
+    in_flight, flushes, ids = asyncio.run(scenario())
+    assert in_flight == 1 and not flushes
+    assert len(set(ids)) == 4
+    assert len(db.notifications.docs) == 4
+
+def test_payment_event_is_written_once(fake_db):
+    db = _db(fake_db)
+    result = {"status": "success", "txn_id": "txn1"}
+    
+    async def payment():
+        await NotificationService.send_transaction_notification(
+            db, "user0", "p2p", {"txn_id": "txn1", "amount_minor": 500}, success=True,
+            history={"action": "p2p_payment", "details": result}
+        )
+        await log_history(db, "user0", "add_money", {"amount_minor": 100})
+    
+    asyncio.run(payment())
+    assert [call for call, _ in db.notifications.calls] == ["insert_many", "bulk_write", "insert_many"]
+    payment_record, history_record = db.notifications.docs.values()
+    assert payment_record["in_app"] is True and payment_record["read"] is False
+    assert payment_record["history"]["details"] == result
+    assert payment_record["delivered_channels"] == ["in_app"]
+    assert payment_record["push_status"] == "queued"
+    assert history_record["in_app"] is False and history_record["status"] == "recorded"
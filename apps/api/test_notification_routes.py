@@ -0,0 +1,113 @@
+"""
+Notification endpoints over HTTP
+"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from notification_service import NotificationService
+from notification_stream import NotificationStreamHub
+from routers import notifications
+
+def _in_app(user_id, title="t"):
+    return {"user_id": user_id, "type": "info", "priority": "low", "title": title, "message": "m", "channels": ["in_app"]}
+
+@pytest.fixture
+def db(monkeypatch, fake_db):
+    db = fake_db()
+    monkeypatch.setattr(notifications, "get_db", lambda: db)
+    return db
+
+@pytest.fixture
+def app():
+    app = FastAPI()
+    app.include_router(notifications.router, prefix="/v1")
+    return app
+
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+def test_unread_count_and_read_all(db, client, auth_headers):
+    asyncio.run(NotificationService.deliver_many(db, [_in_app("alice")] * 3 + [_in_app("bob")]))
+    alice = auth_headers("alice")
+    
+    assert client.get("/v1/notifications/unread/count", headers=alice).json() == {"unread_count": 3}
+    assert client.post("/v1/notifications/read-all", headers=alice).json() == {"success": True, "updated": 3}
+    assert client.get("/v1/notifications/unread/count", headers=alice).json() == {"unread_count": 0}
+    assert client.get("/v1/notifications/unread/count", headers=auth_headers("bob")).json() == {"unread_count": 1}
+
+def test_mark_one_read(db, client, auth_headers):
+    (notification_id,) = asyncio.run(NotificationService.deliver_many(db, [_in_app("alice")]))
+    
+    response = client.post(f"/v1/notifications/{notification_id}/read", headers=auth_headers("alice"))
+    assert response.status_code == 200
+    assert client.post(f"/v1/notifications/{notification_id}/read", headers=auth_headers("bob")).status_code == 404
+    assert client.get("/v1/notifications/unread/count", headers=auth_headers("alice")).json() == {"unread_count": 0}
+
+def test_list_pages_with_cursor(db, client, auth_headers):
+    asyncio.run(NotificationService.deliver_many(db, [_in_app("alice", f"n{i}") for i in range(7)] + [_in_app("bob")]))
+    alice = auth_headers("alice")
+    
+    titles, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/v1/notifications", params=params, headers=alice).json()
+        titles.extend(n["title"] for n in page["notifications"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert sorted(titles) == [f"n{i}" for i in range(7)]
+    
+    assert client.get("/v1/notifications", params={"cursor": "garbage"}, headers=alice).status_code == 400
+
+def _inserted(user_id, title):
+    return {
+        "ns": {"db": "bipay", "coll": "notifications"},
+        "operationType": "insert",
+        "fullDocument": {"_id": ObjectId(), "user_id": user_id, "title": title, "read": False}
+    }
+
+def _frames(body):
+    return [
+        dict(line.split(": ", 1) for line in frame.splitlines())
+        for frame in body.split("\n\n") if frame and not frame.startswith(":")
+    ]
+
+def test_stream_sends_count_then_the_users_events(db, app, auth_headers, monkeypatch):
+    hub = NotificationStreamHub()
+    monkeypatch.setattr(notifications, "notification_hub", hub)
+    asyncio.run(NotificationService.deliver_many(db, [_in_app("alice")] * 2))
+    alice = auth_headers("alice")
+    
+    async def scenario():
+        # TestClient buffers whole bodies, so the stream is read through httpx's ASGI transport
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://api.test") as http:
+            response = asyncio.create_task(http.get("/v1/notifications/stream", headers=alice))
+            while not len(hub) and not response.done():
+                await asyncio.sleep(0.001)
+            hub.dispatch(_inserted("bob", "not yours"))
+            hub.dispatch(_inserted("alice", "paid"))
+            hub.close()
+            return await asyncio.wait_for(response, 5)
+    
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = _frames(response.text)
+    assert [frame["event"] for frame in frames] == ["unread_count", "notification"]
+    assert json.loads(frames[0]["data"]) == {"unread_count": 2}
+    assert json.loads(frames[1]["data"])["title"] == "paid"
+    assert len(hub) == 0
+
+def test_routes_require_a_token(db, client):
+    assert client.get("/v1/notifications/unread/count").status_code in (401, 403)
+    assert client.post("/v1/notifications/read-all").status_code in (401, 403)
+    assert client.get("/v1/notifications").status_code in (401, 403)
+    assert client.get("/v1/notifications/stream").status_code in (401, 403)
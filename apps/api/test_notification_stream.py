@@ -0,0 +1,166 @@
+"""
+Notification stream hub tests against a stand-in change stream
+"""
+
+import asyncio
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from notification_stream import CHANGE_STREAM_HISTORY_LOST, NotificationStreamHub, format_sse
+
+class FakeChangeStream:
+    def __init__(self, oplog, start, fail_after):
+        self.oplog = oplog
+        self.position = start
+        self.fail_after = fail_after
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        return False
+    
+    def __aiter__(self):
+        return self
+    
+    async def __anext__(self):
+        while self.position >= len(self.oplog):
+            await asyncio.sleep(0.001)
+        if self.fail_after is not None:
+            if self.fail_after == 0:
+                raise ConnectionError("primary stepped down")
+            self.fail_after -= 1
+        change = self.oplog[self.position]
+        self.position += 1
+        return change
+
+class FakeReplicaSet:
+    """Database whose watch() replays an in-memory oplog from a resume token"""
+    
+    def __init__(self, fail_after=None, history_lost=False):
+        self.oplog = []
+        self.watches = []
+        self.fail_after = fail_after
+        self.history_lost = history_lost
+    
+    def watch(self, pipeline, resume_after=None):
+        self.watches.append(resume_after)
+        if resume_after is not None and self.history_lost:
+            self.history_lost = False
+            raise OperationFailure("resume point lost", code=CHANGE_STREAM_HISTORY_LOST)
+        start = 0 if resume_after is None else resume_after["seq"] + 1
+        fail_after, self.fail_after = self.fail_after, None
+        return FakeChangeStream(self.oplog, start, fail_after)
+    
+    def notify(self, user_id, title):
+        self.oplog.append({
+            "_id": {"seq": len(self.oplog)},
+            "ns": {"db": "bipay", "coll": "notifications"},
+            "operationType": "insert",
+            "fullDocument": {"_id": ObjectId(), "user_id": user_id, "title": title, "read": False}
+        })
+    
+    def balance(self, wallet_id, balance_minor):
+        self.oplog.append({
+            "_id": {"seq": len(self.oplog)},
+            "ns": {"db": "bipay", "coll": "accounts"},
+            "operationType": "update",
+            "documentKey": {"_id": wallet_id},
+            "updateDescription": {"updatedFields": {"balance_minor": balance_minor}}
+        })
+
+def _drain(subscription):
+    events = []
+    while not subscription._queue.empty():
+        events.append(subscription._queue.get_nowait())
+    return events
+
+async def _run_until_read(hub, db, count):
+    task = asyncio.create_task(hub.run(db))
+    while hub.resume_token is None or hub.resume_token["seq"] < count - 1:
+        await asyncio.sleep(0.001)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+def test_changes_fan_out_by_user_and_wallet():
+    db = FakeReplicaSet()
+    hub = NotificationStreamHub()
+    
+    async def scenario():
+        phone, laptop = hub.subscribe("alice", "w_alice"), hub.subscribe("alice", "w_alice")
+        bob = hub.subscribe("bob", "w_bob")
+        db.notify("alice", "Payment received")
+        db.balance("w_alice", 1500)
+        db.notify("carol", "Nobody listening")
+        await _run_until_read(hub, db, 3)
+        return phone, laptop, bob
+    
+    phone, laptop, bob = asyncio.run(scenario())
+    alice_events = _drain(phone)
+    assert [event["event"] for event in alice_events] == ["notification", "balance"]
+    assert alice_events[0]["data"]["title"] == "Payment received"
+    assert "user_id" not in alice_events[0]["data"]
+    assert alice_events[1]["data"] == {"wallet_id": "w_alice", "balance_minor": 1500}
+    assert [event["event"] for event in _drain(laptop)] == ["notification", "balance"]
+    assert _drain(bob) == []
+    
+    hub.unsubscribe(phone)
+    hub.unsubscribe(laptop)
+    hub.unsubscribe(bob)
+    assert len(hub) == 0 and hub._routes == {}
+
+def test_slow_client_gets_resync_without_blocking_reader():
+    db = FakeReplicaSet()
+    hub = NotificationStreamHub(queue_size=3)
+    
+    async def scenario():
+        slow, fast = hub.subscribe("alice"), hub.subscribe("bob")
+        for i in range(9):
+            db.notify("alice", f"n{i}")
+        db.notify("bob", "hello")
+        await _run_until_read(hub, db, 10)
+        return slow, fast
+    
+    slow, fast = asyncio.run(scenario())
+    events = _drain(slow)
+    assert events[0]["event"] == "resync"
+    assert [event["data"]["title"] for event in events[1:]] == ["n7", "n8"]
+    assert slow.dropped == 7
+    assert [event["data"]["title"] for event in _drain(fast)] == ["hello"]
+
+def test_reader_resumes_after_interruption_without_gaps():
+    db = FakeReplicaSet(fail_after=2)
+    hub = NotificationStreamHub()
+    hub.RECONNECT_BASE = 0.001
+    
+    async def scenario():
+        subscription = hub.subscribe("alice")
+        for i in range(5):
+            db.notify("alice", f"n{i}")
+        await _run_until_read(hub, db, 5)
+        return subscription
+    
+    subscription = asyncio.run(scenario())
+    assert [event["data"]["title"] for event in _drain(subscription)] == ["n0", "n1", "n2", "n3", "n4"]
+    assert db.watches == [None, {"seq": 1}]
+
+def test_lost_resume_point_tells_clients_to_resync():
+    db = FakeReplicaSet(fail_after=1, history_lost=True)
+    hub = NotificationStreamHub()
+    hub.RECONNECT_BASE = 0.001
+    
+    async def scenario():
+        subscription = hub.subscribe("alice")
+        db.notify("alice", "n0")
+        db.notify("alice", "n1")
+        await _run_until_read(hub, db, 2)
+        return subscription
+    
+    subscription = asyncio.run(scenario())
+    assert [event["event"] for event in _drain(subscription)][:2] == ["notification", "resync"]
+    assert db.watches[:3] == [None, {"seq": 0}, None]
+
+def test_sse_frame():
+    frame = format_sse({"event": "balance", "id": "w1:1", "data": {"balance_minor": 5}})
+    assert frame == 'id: w1:1\nevent: balance\ndata: {"balance_minor":5}\n\n'
@@ -0,0 +1,95 @@
+"""
+Keyset pagination and notification list view tests
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from notification_service import NotificationService
+from pagination import decode_cursor, encode_cursor, fetch_page
+
+def _feed(count, user_id="alice"):
+    # Several notifications share a timestamp so _id has to break ties
+    start = datetime(2026, 1, 1)
+    return [
+        {
+            "_id": ObjectId(), "user_id": user_id, "in_app": True, "read": i % 3 == 0,
+            "type": "info", "priority": "low", "title": f"n{i}", "message": "m",
+            "data": {"blob": "x" * 100}, "created_at": start + timedelta(seconds=i // 4)
+        }
+        for i in range(count)
+    ]
+
+def test_cursor_round_trip_and_rejects_garbage():
+    doc = {"_id": ObjectId(), "created_at": datetime(2026, 3, 1, 12, 30, 0, 123000)}
+    assert decode_cursor(encode_cursor(doc)) == (doc["created_at"], doc["_id"])
+    
+    txn = {"_id": "txn_42", "created_at": datetime(2026, 3, 1)}
+    assert decode_cursor(encode_cursor(txn)) == (txn["created_at"], "txn_42")
+    
+    for bad in ("not-a-cursor", "", "eyJ0IjoxfQ"):
+        try:
+            decode_cursor(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {bad!r}")
+
+def test_pages_cover_every_document_once(fake_db):
+    docs = _feed(23)
+    collection = fake_db(notifications=docs).notifications
+    
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page, cursor = await fetch_page(collection, {"user_id": "alice"}, 5, cursor)
+            seen.extend(page)
+            if cursor is None:
+                return seen
+    
+    seen = asyncio.run(walk())
+    expected = sorted(docs, key=lambda doc: (doc["created_at"], doc["_id"]), reverse=True)
+    assert [doc["_id"] for doc in seen] == [doc["_id"] for doc in expected]
+    assert collection.count("find") == 5
+
+def test_notification_list_is_projected_and_paged(fake_db):
+    db = fake_db(notifications=_feed(12) + _feed(3, user_id="bob"))
+    
+    async def pages():
+        first, cursor = await NotificationService.get_user_notifications(db, "alice", limit=5, unread_only=True)
+        second, end = await NotificationService.get_user_notifications(
+            db, "alice", limit=5, unread_only=True, cursor=cursor, include_data=True
+        )
+        return first, second, end
+    
+    first, second, end = asyncio.run(pages())
+    assert len(first) == 5 and len(second) == 3 and end is None
+    assert all(not n["read"] for n in first + second)
+    assert set(first[0]) == {"id", "type", "priority", "title", "message", "read", "created_at"}
+    assert isinstance(first[0]["id"], str)
+    assert second[0]["data"] == {"blob": "x" * 100}
+
+def test_wallet_history_pages_across_both_directions(fake_db):
+    start = datetime(2026, 1, 1)
+    txns = [
+        {
+            "_id": f"txn{i:02d}", "from_account": "w1" if i % 2 else "w2", "to_account": "w2" if i % 2 else "w1",
+            "amount_minor": i, "created_at": start + timedelta(minutes=i // 2)
+        }
+        for i in range(15)
+    ] + [{"_id": "other", "from_account": "w3", "to_account": "w4", "amount_minor": 0, "created_at": start}]
+    collection = fake_db(transactions=txns).transactions
+    query = {"$or": [{"from_account": "w1"}, {"to_account": "w1"}]}
+    
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page, cursor = await fetch_page(collection, query, 4, cursor, {"amount_minor": 1})
+            seen.extend(page)
+            if cursor is None:
+                return seen
+    
+    seen = asyncio.run(walk())
+    assert [txn["amount_minor"] for txn in seen] == list(range(14, -1, -1))
+    assert set(seen[0]) == {"_id", "amount_minor", "created_at"}
@@ -0,0 +1,51 @@
+"""
+Streaming PDF writer tests
+"""
+
+import io
+import re
+import zlib
+
+from pdf_documents import PdfTableWriter, format_minor
+
+def _render(rows):
+    out = io.BytesIO()
+    writer = PdfTableWriter(out, "BiPay Statement", [("Date", 0), ("Details", 90), ("Amount", 300)])
+    writer.add_line("Wallet w1 (Smith & Sons)", bold=True)
+    for i in range(rows):
+        writer.add_row([f"2026-09-{i % 30 + 1:02d}", f"Payment (ref {i})", format_minor(i * 101)])
+    writer.close()
+    return writer, out.getvalue()
+
+def test_cross_reference_table_points_at_objects():
+    writer, pdf = _render(130)
+    assert pdf.startswith(b"%PDF-1.4") and pdf.endswith(b"%%EOF\n")
+    
+    xref_offset = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    assert pdf[xref_offset:].startswith(b"xref\n")
+    count = int(re.match(rb"xref\n0 (\d+)", pdf[xref_offset:]).group(1))
+    offsets = re.findall(rb"(\d{10}) 00000 n ", pdf[xref_offset:])
+    assert len(offsets) == count - 1
+    for number, offset in enumerate(offsets, start=1):
+        assert pdf[int(offset):].startswith(b"%d 0 obj" % number)
+    
+    assert writer.page_count == 3
+    assert b"/Count 3" in pdf
+
+def test_page_text_is_compressed_and_escaped():
+    _, pdf = _render(5)
+    streams = re.findall(rb"stream\n(.*?)\nendstream", pdf, re.S)
+    text = b"".join(zlib.decompress(stream) for stream in streams)
+    assert b"(Payment \\(ref 4\\)) Tj" in text
+    assert b"(INR 4.04) Tj" in text
+    assert b"(Smith & Sons\\)" in text
+
+def test_empty_document_has_one_page():
+    out = io.BytesIO()
+    writer = PdfTableWriter(out, "Empty")
+    writer.close()
+    assert writer.page_count == 1
+
+def test_format_minor():
+    assert format_minor(123456789) == "INR 1,234,567.89"
+    assert format_minor(-5, "USD") == "-USD 0.05"
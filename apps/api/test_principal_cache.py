@@ -0,0 +1,80 @@
+"""
+Principal cache tests
+"""
+
+import asyncio
+
+from principal_cache import PrincipalCache, PrincipalScopeMiddleware
+
+class CountingCollection:
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+        self.reads = 0
+    
+    async def find_one(self, query):
+        self.reads += 1
+        await asyncio.sleep(0)
+        return self.docs.get(query["_id"])
+
+class FakeDb:
+    def __init__(self):
+        self.users = CountingCollection([{"_id": "user1", "wallet_id": "wallet1", "email": "a@b.c"}])
+        self.devices = CountingCollection([{"_id": "device1", "user_id": "user1", "public_key": "pem"}])
+        self.accounts = CountingCollection([{"_id": "wallet1", "balance_minor": 100}])
+    
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+def test_payment_reads_each_principal_once():
+    PrincipalCache.clear()
+    db = FakeDb()
+    
+    async def payment():
+        # Router, compliance (KYC + AML) and notifications, two of them concurrently
+        await PrincipalCache.get_user(db, "user1")
+        await asyncio.gather(PrincipalCache.get_user(db, "user1"), PrincipalCache.get_user(db, "user1"))
+        await PrincipalCache.get_user(db, "user1")
+        return await PrincipalCache.get_device(db, "device1", "user1")
+    
+    assert asyncio.run(payment())["public_key"] == "pem"
+    assert db.users.reads == 1
+    assert db.devices.reads == 1
+
+def test_device_owner_is_checked():
+    PrincipalCache.clear()
+    db = FakeDb()
+    assert asyncio.run(PrincipalCache.get_device(db, "device1", "intruder")) is None
+    assert asyncio.run(PrincipalCache.get_device(db, "missing")) is None
+
+def test_invalidation_reaches_process_and_request_scope():
+    PrincipalCache.clear()
+    db = FakeDb()
+    seen = []
+    
+    async def app(scope, receive, send):
+        before = await PrincipalCache.get_wallet(db, "wallet1")
+        db.accounts.docs["wallet1"] = {"_id": "wallet1", "balance_minor": 50}
+        PrincipalCache.invalidate_wallet("wallet1")
+        after = await PrincipalCache.get_wallet(db, "wallet1")
+        seen.append((before["balance_minor"], after["balance_minor"]))
+    
+    asyncio.run(PrincipalScopeMiddleware(app)({"type": "http"}, None, None))
+    assert seen == [(100, 50)]
+    assert db.accounts.reads == 2
+
+def test_request_scope_is_stable_and_isolated():
+    PrincipalCache.clear()
+    db = FakeDb()
+    
+    async def app(scope, receive, send):
+        await PrincipalCache.get_user(db, "user1")
+        # Process cache expiry mid-request does not cause a second read
+        PrincipalCache._caches["user"].clear()
+        await PrincipalCache.get_user(db, "user1")
+    
+    middleware = PrincipalScopeMiddleware(app)
+    asyncio.run(middleware({"type": "http"}, None, None))
+    assert db.users.reads == 1
+    PrincipalCache.clear()
+    asyncio.run(middleware({"type": "http"}, None, None))
+    assert db.users.reads == 2
@@ -0,0 +1,160 @@
+"""
+Push dispatcher tests against a local fake push server
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+import push_dispatcher
+from push_dispatcher import PushDispatcher, PushProvider, PushProviderError
+
+def fake_push_server(unavailable_first: int = 0, retry_after: int = None):
+    """FCM-style sendEach endpoint; tokens starting with "dead" are unregistered"""
+    app = FastAPI()
+    app.state.batches = []
+    app.state.remaining_failures = unavailable_first
+    
+    @app.post("/v1/messages:sendEach")
+    async def send_each(request: Request):
+        if app.state.remaining_failures:
+            app.state.remaining_failures -= 1
+            if retry_after is not None:
+                return JSONResponse({"error": "throttled"}, status_code=429, headers={"Retry-After": str(retry_after)})
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        
+        messages = (await request.json())["messages"]
+        app.state.batches.append(messages)
+        return {"responses": [
+            {"success": False, "error": {"code": "UNREGISTERED"}} if m["token"].startswith("dead")
+            else {"success": True, "message_id": f"m{i}"}
+            for i, m in enumerate(messages)
+        ]}
+    
+    return app
+
+def _provider(app) -> PushProvider:
+    provider = PushProvider(base_url="http://push.test", api_key="key", transport=httpx.ASGITransport(app=app))
+    provider.BACKOFF_BASE = 0.001
+    return provider
+
+def _notification(i, priority="low", user_id=None):
+    return {
+        "_id": i,
+        "user_id": user_id or f"user{i}",
+        "type": "compliance_kyc_expired",
+        "priority": priority,
+        "title": "Verification Expired",
+        "message": "Your identity verification has expired",
+        "data": {"amount": i},
+        "channels": ["push", "in_app"],
+        "delivered_channels": ["in_app"],
+        "status": "delivered",
+        "created_at": datetime.utcnow(),
+        "push_status": "queued",
+        "push_rank": push_dispatcher.PUSH_RANKS[priority],
+        "push_attempts": 0,
+        "next_push_at": datetime.utcnow() - timedelta(seconds=1)
+    }
+
+def test_campaign_is_sent_in_provider_batches_and_prunes_tokens(fake_db):
+    app = fake_push_server()
+    notifications = [_notification(i) for i in range(1200)]
+    devices = [
+        {"_id": f"d{i}", "user_id": f"user{i}", "fcm_token": ("dead" if i % 100 == 0 else "tok") + str(i)}
+        for i in range(1200)
+    ]
+    db = fake_db(notifications=notifications, devices=devices)
+    
+    async def scenario():
+        provider = _provider(app)
+        try:
+            return await PushDispatcher(db, provider).run_once()
+        finally:
+            await provider.aclose()
+    
+    assert asyncio.run(scenario()) == 1200
+    assert [len(batch) for batch in app.state.batches] == [500, 500, 200]
+    assert all(isinstance(value, str) for value in app.state.batches[0][0]["data"].values())
+    
+    docs = db.notifications.docs
+    assert docs[1]["push_status"] == "delivered" and docs[1]["delivered_channels"] == ["in_app", "push"]
+    assert docs[100]["push_status"] == "failed" and docs[100]["status"] == "delivered"
+    assert "fcm_token" not in db.devices.docs["d100"]
+    assert db.devices.docs["d101"]["fcm_token"] == "tok101"
+
+def test_critical_alerts_are_claimed_first(fake_db):
+    app = fake_push_server()
+    notifications = [_notification(i) for i in range(5)] + [_notification(99, "critical")]
+    devices = [{"_id": f"d{i}", "user_id": f"user{i}", "fcm_token": f"tok{i}"} for i in (0, 1, 2, 3, 4, 99)]
+    db = fake_db(notifications=notifications, devices=devices)
+    
+    async def scenario():
+        provider = _provider(app)
+        dispatcher = PushDispatcher(db, provider)
+        dispatcher.CLAIM_LIMIT = 1
+        try:
+            await dispatcher.run_once()
+        finally:
+            await provider.aclose()
+    
+    asyncio.run(scenario())
+    assert [m["token"] for m in app.state.batches[0]] == ["tok99"]
+    assert app.state.batches[0][0]["android"]["priority"] == "high"
+
+def test_provider_retries_then_requeues(fake_db):
+    # Two 503s are absorbed by the provider's jittered retries
+    app = fake_push_server(unavailable_first=2)
+    db = fake_db(notifications=[_notification(1)], devices=[{"_id": "d1", "user_id": "user1", "fcm_token": "tok1"}])
+    
+    async def scenario(dispatcher_app):
+        provider = _provider(dispatcher_app)
+        try:
+            await PushDispatcher(db, provider).run_once()
+        finally:
+            await provider.aclose()
+    
+    asyncio.run(scenario(app))
+    assert db.notifications.docs[1]["push_status"] == "delivered"
+    
+    # A provider that stays down leaves the notification queued for a later attempt
+    down = fake_push_server(unavailable_first=100)
+    db = fake_db(notifications=[_notification(1)], devices=[{"_id": "d1", "user_id": "user1", "fcm_token": "tok1"}])
+    asyncio.run(scenario(down))
+    doc = db.notifications.docs[1]
+    assert doc["push_status"] == "queued" and doc["push_attempts"] == 1
+    assert doc["next_push_at"] > datetime.utcnow() - timedelta(seconds=1)
+
+def test_retry_after_past_the_lease_is_not_waited_out(fake_db):
+    app = fake_push_server(unavailable_first=1, retry_after=120)
+    db = fake_db(notifications=[_notification(1)], devices=[{"_id": "d1", "user_id": "user1", "fcm_token": "tok1"}])
+    
+    async def scenario():
+        provider = _provider(app)
+        try:
+            started = time.monotonic()
+            await PushDispatcher(db, provider).run_once()
+            return time.monotonic() - started
+        finally:
+            await provider.aclose()
+    
+    assert asyncio.run(scenario()) < 5
+    doc = db.notifications.docs[1]
+    assert doc["push_status"] == "queued" and doc["push_attempts"] == 1
+    assert app.state.batches == []
+
+def test_provider_rejects_oversized_batches():
+    provider = _provider(fake_push_server())
+    try:
+        asyncio.run(provider.send_each([{"token": "t"}] * 501))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError")
+    finally:
+        asyncio.run(provider.aclose())
+    assert issubclass(PushProviderError, Exception)
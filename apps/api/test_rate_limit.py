@@ -0,0 +1,154 @@
+"""
+Rate limiter backend tests
+"""
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from rate_limit_backends import InMemoryRateLimitBackend, MongoRateLimitBackend, RateLimitBackend
+from session_management import RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+def _use_memory_backend():
+    clock = FakeClock()
+    RateLimiter.set_backend(InMemoryRateLimitBackend(clock=clock))
+    return clock
+
+def test_memory_backend_limits_identifier():
+    _use_memory_backend()
+    max_attempts = RateLimiter.LIMITS["payment"]["max_attempts"]
+    
+    async def scenario():
+        for _ in range(max_attempts):
+            check = await RateLimiter.check_rate_limit(None, "user1", "payment")
+            assert check["allowed"]
+            await RateLimiter.record_attempt(None, "user1", "payment")
+        return await RateLimiter.check_rate_limit(None, "user1", "payment")
+    
+    check = asyncio.run(scenario())
+    assert check["allowed"] is False
+    assert check["reason"] == "rate_limited"
+    assert check["attempts"] == max_attempts
+    assert set(check) == {"allowed", "reason", "reset_at", "attempts", "max_attempts"}
+
+def test_memory_backend_limits_ip_across_identifiers():
+    _use_memory_backend()
+    max_attempts = RateLimiter.LIMITS["login"]["max_attempts"]
+    
+    async def scenario():
+        for i in range(max_attempts):
+            await RateLimiter.record_attempt(None, f"user{i}", "login", "10.0.0.1", False)
+        return await RateLimiter.check_rate_limit(None, "fresh_user", "login", "10.0.0.1")
+    
+    check = asyncio.run(scenario())
+    assert check["allowed"] is False
+    assert check["reason"] == "ip_rate_limited"
+
+def test_memory_backend_window_slides():
+    clock = _use_memory_backend()
+    window = RateLimiter.LIMITS["biometric"]["window"]
+    
+    async def record(count):
+        for _ in range(count):
+            await RateLimiter.record_attempt(None, "user1", "biometric")
+    
+    asyncio.run(record(3))
+    assert not asyncio.run(RateLimiter.check_rate_limit(None, "user1", "biometric"))["allowed"]
+    
+    clock.now += window + 1
+    check = asyncio.run(RateLimiter.check_rate_limit(None, "user1", "biometric"))
+    assert check["allowed"] and check["remaining"] == 3
+
+def test_memory_backend_status_reset_and_sweep():
+    clock = _use_memory_backend()
+    asyncio.run(RateLimiter.record_attempt(None, "user1", "password_reset", "10.0.0.2"))
+    asyncio.run(RateLimiter.record_attempt(None, "user1", "unlimited_action"))
+    
+    status = asyncio.run(RateLimiter.get_rate_limit_status(None, "user1"))
+    assert status["password_reset"]["attempts"] == 1
+    assert status["login"]["attempts"] == 0
+    
+    assert asyncio.run(RateLimiter.reset_rate_limit(None, "user1", "password_reset"))
+    assert not asyncio.run(RateLimiter.reset_rate_limit(None, "user1", "password_reset"))
+    
+    # Only the IP window remains, and it is swept once idle
+    backend = RateLimiter.backend
+    assert len(backend) == 1
+    clock.now += 3600 + InMemoryRateLimitBackend.SWEEP_INTERVAL + 1
+    backend.record("user2", "login", None, RateLimiter.LIMITS["login"])
+    assert len(backend) == 1
+
+def test_mongo_backend_checks_and_records_in_one_update_per_scope(fake_db):
+    RateLimiter.set_backend(MongoRateLimitBackend())
+    db = fake_db()
+    max_attempts = RateLimiter.LIMITS["biometric"]["max_attempts"]
+    
+    async def scenario():
+        return await asyncio.gather(*[
+            RateLimiter.check_and_record(db, "user1", "biometric", f"10.0.0.{i}") for i in range(max_attempts + 2)
+        ])
+    
+    results = asyncio.run(scenario())
+    assert sum(r["allowed"] for r in results) == max_attempts
+    assert {r["reason"] for r in results if not r["allowed"]} == {"rate_limited"}
+    assert db.rate_limit_windows.count("find_one_and_update") == 2 * (max_attempts + 2)
+    assert [method for method, _ in db.rate_limit_windows.calls if method != "find_one_and_update"] == ["update_one"] * 2
+    
+    # The rejected attempts were taken back out of their IP windows
+    ip_attempts = sum(len(doc["attempts"]) for _id, doc in db.rate_limit_windows.docs.items() if ":ip_address:" in _id)
+    assert ip_attempts == max_attempts
+
+def test_mongo_backend_limits_ip_and_slides(fake_db):
+    RateLimiter.set_backend(MongoRateLimitBackend())
+    db = fake_db()
+    max_attempts = RateLimiter.LIMITS["login"]["max_attempts"]
+    
+    async def scenario():
+        for i in range(max_attempts):
+            await RateLimiter.record_attempt(db, f"user{i}", "login", "10.0.0.1", False)
+        return await RateLimiter.check_and_record(db, "fresh_user", "login", "10.0.0.1")
+    
+    check = asyncio.run(scenario())
+    assert check["allowed"] is False and check["reason"] == "ip_rate_limited"
+    assert db.rate_limit_windows.docs["login:identifier:fresh_user"]["attempts"] == []
+    
+    # Once the attempts age out of the window the address is allowed again
+    window = timedelta(seconds=RateLimiter.LIMITS["login"]["window"] + 1)
+    for attempt in db.rate_limit_windows.docs["login:ip_address:10.0.0.1"]["attempts"]:
+        attempt["t"] -= window
+    assert asyncio.run(RateLimiter.check_and_record(db, "fresh_user", "login", "10.0.0.1"))["allowed"]
+    assert asyncio.run(RateLimiter.get_rate_limit_status(db, "fresh_user"))["login"]["attempts"] == 1
+    assert asyncio.run(RateLimiter.reset_rate_limit(db, "fresh_user", "login"))
+
+def teardown_module():
+    from rate_limit_backends import create_rate_limit_backend
+    from config import config
+    RateLimiter.set_backend(create_rate_limit_backend(config.RATE_LIMIT_BACKEND))
+
+def test_check_and_record_counts_in_one_call():
+    _use_memory_backend()
+    max_attempts = RateLimiter.LIMITS["biometric"]["max_attempts"]
+    
+    async def scenario():
+        return [await RateLimiter.check_and_record(None, "user1", "biometric") for _ in range(max_attempts + 1)]
+    
+    results = asyncio.run(scenario())
+    assert [r["allowed"] for r in results] == [True] * max_attempts + [False]
+    assert results[0]["remaining"] == max_attempts - 1
+    assert results[-1]["reason"] == "rate_limited"
+
+def test_backend_must_implement_storage_methods():
+    class CountOnlyBackend(RateLimitBackend):
+        async def count_attempts(self, db, scope, key, action, window):
+            return 0
+    
+    with pytest.raises(TypeError):
+        CountOnlyBackend()
@@ -0,0 +1,117 @@
+"""
+Global api_general rate limit middleware tests
+"""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import security
+from rate_limit_middleware import RateLimitMiddleware, SlidingWindowCounter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 6000.0
+    
+    def __call__(self):
+        return self.now
+
+def _client(clock):
+    app = FastAPI()
+    app.add_middleware(
+        RateLimitMiddleware,
+        limits={"window": 60, "max_attempts": 3},
+        route_overrides={"/v1/transactions": {"window": 60, "max_attempts": 1}},
+        clock=clock
+    )
+    
+    @app.get("/health")
+    def health():
+        return {"status": "ok"}
+    
+    @app.get("/v1/things")
+    def things():
+        return {"ok": True}
+    
+    @app.get("/v1/transactions")
+    def transactions():
+        return {"transactions": []}
+    
+    return TestClient(app)
+
+def _verified(headers):
+    # As the route's JWTBearer would on the token's first request
+    security.token_verifier.verify(headers["Authorization"][7:])
+    return headers
+
+def test_identity_limit_returns_429_with_retry_after(auth_headers):
+    client = _client(FakeClock())
+    alice = _verified(auth_headers("alice"))
+    bob = _verified(auth_headers("bob"))
+    
+    assert [client.get("/v1/things", headers=alice).status_code for _ in range(4)] == [200, 200, 200, 429]
+    limited = client.get("/v1/things", headers=alice)
+    assert limited.status_code == 429
+    assert int(limited.headers["retry-after"]) > 0
+    
+    # Another identity on the same address keeps its own budget
+    assert client.get("/v1/things", headers=bob).status_code == 200
+    assert client.get("/health", headers=alice).status_code == 200
+    
+    # A second token for the same user shares the user's budget
+    assert client.get("/v1/things", headers=_verified(auth_headers("alice"))).status_code == 429
+
+def test_unverified_tokens_share_the_ip_budget(auth_headers):
+    client = _client(FakeClock())
+    budget = 3 * RateLimitMiddleware.IP_LIMIT_MULTIPLIER
+    
+    # Each made-up signature would otherwise start a fresh identity budget
+    forged = [{"Authorization": f"Bearer header.payload.forged-{i}"} for i in range(budget + 1)]
+    statuses = [client.get("/v1/things", headers=headers).status_code for headers in forged]
+    assert statuses == [200] * budget + [429]
+    
+    # Including real tokens this process has not verified yet
+    assert client.get("/v1/things", headers=auth_headers("carol")).status_code == 429
+
+def test_route_override_and_ip_limit(auth_headers):
+    clock = FakeClock()
+    client = _client(clock)
+    token = _verified(auth_headers())
+    
+    assert client.get("/v1/transactions", headers=token).status_code == 200
+    assert client.get("/v1/transactions", headers=token).status_code == 429
+    assert client.get("/v1/things", headers=token).status_code == 200
+    
+    # Anonymous callers share the (multiplied) per-IP budget
+    statuses = [client.get("/v1/things").status_code for _ in range(3 * RateLimitMiddleware.IP_LIMIT_MULTIPLIER)]
+    assert statuses.count(429) > 0
+    
+    # Two windows later everything is allowed again
+    clock.now += 120
+    assert client.get("/v1/transactions", headers=token).status_code == 200
+
+def test_sliding_window_weights_previous_bucket():
+    clock = FakeClock()
+    counter = SlidingWindowCounter(clock=clock)
+    keys, limits = (("id", "r", b"k"),), (10,)
+    
+    for _ in range(10):
+        assert counter.hit(keys, limits, 60) == 0
+    assert counter.hit(keys, limits, 60) > 0
+    
+    # Halfway through the next bucket half of the previous bucket still counts
+    clock.now += 90
+    allowed = sum(1 for _ in range(10) if counter.hit(keys, limits, 60) == 0)
+    assert allowed == 5
+    
+    # Idle counters are swept
+    clock.now += 600
+    counter.hit((("id", "r", b"other"),), limits, 60)
+    assert len(counter) == 1
+
+def test_counter_keeps_at_most_max_keys():
+    counter = SlidingWindowCounter(clock=FakeClock(), max_keys=100)
+    for i in range(250):
+        assert counter.hit((("ip", "r", str(i)),), (1,), 60) == 0
+    assert len(counter) == 100
+    # The newest keys are the ones kept
+    assert counter.hit((("ip", "r", "249"),), (1,), 60) > 0
@@ -0,0 +1,73 @@
+"""
+Shared (Redis protocol) rate limit backend tests, run against a local fakeredis server
+"""
+
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from rate_limit_backends import RedisRateLimitBackend, InMemoryRateLimitBackend
+from session_management import RateLimiter
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+    
+    def __call__(self):
+        return self.now
+
+def _backend(server=None, clock=None):
+    client = fakeredis.FakeAsyncRedis(server=server or fakeredis.FakeServer())
+    return RedisRateLimitBackend(client=client, clock=clock or FakeClock())
+
+def test_limits_are_shared_between_workers():
+    server = fakeredis.FakeServer()
+    clock = FakeClock()
+    workers = [_backend(server, clock), _backend(server, clock)]
+    limit = RateLimiter.LIMITS["payment"]
+    
+    async def scenario():
+        outcomes = []
+        for i in range(limit["max_attempts"] + 2):
+            worker = workers[i % 2]
+            outcomes.append(await worker.hit(None, "user1", "payment", "10.0.0.1", limit))
+        return outcomes
+    
+    outcomes = asyncio.run(scenario())
+    assert [reason for reason, _ in outcomes[:limit["max_attempts"]]] == [None] * limit["max_attempts"]
+    assert outcomes[-1][0] == "ip_rate_limited"
+    assert outcomes[limit["max_attempts"] - 1][1] == limit["max_attempts"]
+
+def test_window_slides_and_reset():
+    clock = FakeClock()
+    backend = _backend(clock=clock)
+    limit = RateLimiter.LIMITS["biometric"]
+    
+    async def scenario():
+        for _ in range(limit["max_attempts"]):
+            await backend.record_attempt(None, "user1", "biometric", None, False, None, limit)
+        limited = await backend.hit(None, "user1", "biometric", None, limit)
+        clock.now += limit["window"] + 1
+        after_window = await backend.count_attempts(None, "identifier", "user1", "biometric", limit["window"])
+        await backend.record_attempt(None, "user1", "biometric", None, False, None, limit)
+        reset = await backend.reset(None, "user1", "biometric")
+        after_reset = await backend.count_attempts(None, "identifier", "user1", "biometric", limit["window"])
+        return limited, after_window, reset, after_reset
+    
+    limited, after_window, reset, after_reset = asyncio.run(scenario())
+    assert limited == ("rate_limited", limit["max_attempts"])
+    assert after_window == 0
+    assert reset and after_reset == 0
+
+def test_unreachable_store_falls_back_to_local_limits():
+    backend = RedisRateLimitBackend("redis://127.0.0.1:1/0")
+    assert isinstance(backend.fallback, InMemoryRateLimitBackend)
+    limit = RateLimiter.LIMITS["biometric"]
+    
+    async def scenario():
+        return [await backend.hit(None, "user1", "biometric", None, limit) for _ in range(limit["max_attempts"] + 1)]
+    
+    outcomes = asyncio.run(scenario())
+    assert [reason for reason, _ in outcomes] == [None] * limit["max_attempts"] + ["rate_limited"]
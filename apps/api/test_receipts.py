@@ -0,0 +1,106 @@
+"""
+On-demand receipt rendering and cache tier tests
+"""
+
+import asyncio
+import io
+import os
+from datetime import datetime
+
+from bson import ObjectId
+from botocore.exceptions import ClientError
+
+import receipt_renderer as receipts
+from receipt_renderer import ReceiptRenderer, receipt_key
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+    
+    def get_object(self, Bucket, Key):
+        self.calls.append(("get", Key))
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(self.objects[Key])}
+    
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.calls.append(("put", Key))
+        self.objects[Key] = Body
+
+class FakeReceipts:
+    def __init__(self):
+        self.docs = {}
+    
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query["txn_id"]] = update["$set"]
+
+class FakeDb:
+    def __init__(self):
+        self.receipts = FakeReceipts()
+
+def _txn():
+    return {
+        "_id": ObjectId(), "type": "p2p", "from_account": "w1", "to_account": "w2", "amount_minor": 12345,
+        "currency": "INR", "status": "success", "biometric_verified": True,
+        "created_at": datetime(2026, 9, 1, 12, 0), "hash": "ab" * 32
+    }
+
+def _count_renders(monkeypatch):
+    renders = []
+    real = receipts.render_receipt
+    
+    def counting(txn):
+        renders.append(txn["_id"])
+        return real(txn)
+    monkeypatch.setattr(receipts, "render_receipt", counting)
+    return renders
+
+def test_first_request_renders_once_for_concurrent_callers(tmp_path, monkeypatch):
+    renders = _count_renders(monkeypatch)
+    s3 = FakeS3()
+    renderer = ReceiptRenderer(str(tmp_path), "bucket", s3)
+    db, txn = FakeDb(), _txn()
+    
+    async def burst():
+        return await asyncio.gather(*[renderer.get(db, txn) for _ in range(20)])
+    
+    results = asyncio.run(burst())
+    key = receipt_key(txn)
+    assert len(renders) == 1
+    assert all(result["pdf"] == results[0]["pdf"] for result in results)
+    assert results[0]["pdf"].startswith(b"%PDF-")
+    assert s3.calls == [("get", f"receipts/{key}.pdf"), ("put", f"receipts/{key}.pdf")]
+    assert os.path.exists(tmp_path / key[:2] / f"{key}.pdf")
+    assert db.receipts.docs[str(txn["_id"])]["key"] == key
+    
+    # Served from disk afterwards
+    asyncio.run(renderer.get(db, txn))
+    assert len(renders) == 1 and len(s3.calls) == 2
+
+def test_other_instance_is_served_from_s3(tmp_path, monkeypatch):
+    renders = _count_renders(monkeypatch)
+    s3 = FakeS3()
+    db, txn = FakeDb(), _txn()
+    first = asyncio.run(ReceiptRenderer(str(tmp_path / "a"), "bucket", s3).get(db, txn))
+    second = asyncio.run(ReceiptRenderer(str(tmp_path / "b"), "bucket", s3).get(db, txn))
+    
+    assert len(renders) == 1
+    assert second["pdf"] == first["pdf"]
+    assert [call for call, _ in s3.calls] == ["get", "put", "get"]
+
+def test_disk_only_without_bucket(tmp_path, monkeypatch):
+    renders = _count_renders(monkeypatch)
+    renderer = ReceiptRenderer(str(tmp_path), "", None)
+    db, txn = FakeDb(), _txn()
+    asyncio.run(renderer.get(db, txn))
+    asyncio.run(renderer.get(db, txn))
+    assert len(renders) == 1
+    assert db.receipts.docs[str(txn["_id"])]["s3_key"] is None
+
+def test_key_follows_transaction_content():
+    txn = _txn()
+    assert receipt_key(txn) == receipt_key(dict(txn))
+    assert receipt_key(txn) != receipt_key({**txn, "hash": "cd" * 32})
+    unhashed = {key: value for key, value in txn.items() if key != "hash"}
+    assert receipt_key(unhashed) != receipt_key({**unhashed, "amount_minor": 1})
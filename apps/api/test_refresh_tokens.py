@@ -0,0 +1,134 @@
+"""
+Refresh token rotation and revocation list tests
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError
+
+import security
+from config import config
+from refresh_tokens import RefreshTokenManager
+from security import RevocationList, TokenVerifier
+
+def _keys():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+PRIVATE_PEM, PUBLIC_PEM = _keys()
+USER = {"user_id": "user1", "mobile": "9999999999", "wallet_id": "wallet1"}
+
+@pytest.fixture
+def verifier(monkeypatch):
+    monkeypatch.setattr(config, "JWT_PRIVATE_KEY_PEM", PRIVATE_PEM)
+    revocations = RevocationList()
+    monkeypatch.setattr(security, "revocation_list", revocations)
+    monkeypatch.setattr("refresh_tokens.revocation_list", revocations)
+    return TokenVerifier(PUBLIC_PEM, revocations=revocations)
+
+def test_rotation_issues_new_pair_and_carries_claims(verifier, fake_db):
+    db = fake_db()
+    
+    async def scenario():
+        first = await RefreshTokenManager.issue(db, USER)
+        second = await RefreshTokenManager.rotate(db, first["refresh_token"])
+        return first, second
+    
+    first, second = asyncio.run(scenario())
+    assert second["rotated"]
+    assert second["tokens"]["refresh_token"] != first["refresh_token"]
+    claims = verifier.verify(second["tokens"]["token"])
+    assert claims["sub"] == "user1" and claims["wallet_id"] == "wallet1" and claims["jti"]
+    # exp is whole seconds, iat carries milliseconds
+    assert claims["exp"] - claims["iat"] == pytest.approx(config.ACCESS_TOKEN_TTL_MINUTES * 60, abs=1)
+
+def test_reused_refresh_token_revokes_family(verifier, fake_db):
+    db = fake_db()
+    
+    async def scenario():
+        first = await RefreshTokenManager.issue(db, USER)
+        second = await RefreshTokenManager.rotate(db, first["refresh_token"])
+        reuse = await RefreshTokenManager.rotate(db, first["refresh_token"])
+        after = await RefreshTokenManager.rotate(db, second["tokens"]["refresh_token"])
+        return first, second, reuse, after
+    
+    first, second, reuse, after = asyncio.run(scenario())
+    assert reuse == {"rotated": False, "reason": "refresh_token_reused"}
+    assert after == {"rotated": False, "reason": "refresh_token_invalid"}
+    for token in (first["token"], second["tokens"]["token"]):
+        with pytest.raises(JWTError):
+            verifier.verify(token)
+    assert len(db.security_logs.docs) == 1
+
+def test_revocations_reach_other_processes_on_sync(verifier, fake_db):
+    db = fake_db()
+    
+    async def scenario():
+        kept = await RefreshTokenManager.issue(db, USER)
+        other = await RefreshTokenManager.issue(db, {**USER, "user_id": "user2"})
+        # Validated (and cached) before the logout
+        verifier.verify(kept["token"])
+        await RefreshTokenManager.logout(db, verifier.verify(kept["token"]), kept["refresh_token"])
+        
+        remote = RevocationList()
+        await remote.sync(db)
+        return kept, other, remote
+    
+    kept, other, remote = asyncio.run(scenario())
+    with pytest.raises(JWTError):
+        verifier.verify(kept["token"])
+    remote_verifier = TokenVerifier(PUBLIC_PEM, revocations=remote)
+    with pytest.raises(JWTError):
+        remote_verifier.verify(kept["token"])
+    assert remote_verifier.verify(other["token"])["sub"] == "user2"
+
+def test_subject_revocation_spares_tokens_issued_after_it_in_the_same_second(verifier, fake_db):
+    db = fake_db()
+    
+    async def scenario():
+        before = security.issue_access_token(USER)
+        await asyncio.sleep(0.002)
+        await security.revocation_list.revoke_subject(db, "user1")
+        await asyncio.sleep(0.002)
+        return before, security.issue_access_token(USER)
+    
+    before, after = asyncio.run(scenario())
+    with pytest.raises(JWTError):
+        verifier.verify(before["token"])
+    assert verifier.verify(after["token"])["sub"] == "user1"
+    
+    # Other processes compare against the stored moment, which keeps its milliseconds
+    synced = RevocationList()
+    asyncio.run(synced.sync(db))
+    claims = verifier.verify(after["token"])
+    assert not synced.is_revoked(claims)
+    assert synced.is_revoked({**claims, "iat": claims["iat"] - 0.004})
+
+def test_subject_revocation_and_pruning():
+    revocations = RevocationList()
+    now = datetime.utcnow()
+    revocations.add("expired", now - timedelta(seconds=1))
+    revocations.add("live", now + timedelta(minutes=5))
+    revocations.add_subject("user1", time.time() - 3600 * 24)
+    revocations.add_subject("user2", time.time())
+    
+    assert revocations.is_revoked({"sub": "user2", "iat": int(time.time()) - 60})
+    revocations._prune(time.time())
+    assert revocations.is_revoked({"jti": "live"})
+    assert not revocations.is_revoked({"jti": "expired"})
+    assert not revocations.is_revoked({"sub": "user1", "iat": 0})
+    assert len(revocations) == 2
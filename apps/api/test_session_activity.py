@@ -0,0 +1,125 @@
+"""
+Write-behind session activity, session cache and session expiry tests
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from session_management import SessionManager, SessionActivityBuffer
+
+def _session(session_id, user_id="user1"):
+    return {
+        "_id": session_id,
+        "user_id": user_id,
+        "ip_address": "10.0.0.1",
+        "expires_at": datetime.utcnow() + timedelta(minutes=30),
+        "status": "active",
+        "activity_count": 1
+    }
+
+def _reset():
+    SessionManager._session_cache.clear()
+    SessionManager._user_invalidations.clear()
+    SessionManager._session_invalidations.clear()
+    SessionManager.activity = SessionActivityBuffer()
+
+def test_repeated_validation_reads_once_and_writes_once(fake_db):
+    _reset()
+    db = fake_db(user_sessions=[_session("s1")])
+    
+    async def scenario():
+        for _ in range(20):
+            result = await SessionManager.validate_session(db, "s1", "user1", "10.0.0.1")
+            assert result["valid"]
+        return await SessionManager.activity.flush(db)
+    
+    assert asyncio.run(scenario()) == 1
+    assert db.user_sessions.count("find_one") == 1
+    assert db.user_sessions.count("update_one") == 0
+    assert db.user_sessions.count("bulk_write") == 1
+    assert db.user_sessions.docs["s1"]["activity_count"] == 21
+
+def test_invalidation_is_immediate(fake_db):
+    _reset()
+    db = fake_db(user_sessions=[_session("s1"), _session("s2"), _session("s3")])
+    
+    async def scenario():
+        for session_id in ("s1", "s2", "s3"):
+            await SessionManager.validate_session(db, session_id, "user1", "10.0.0.1")
+        
+        await SessionManager.invalidate_session(db, "s1", "user1")
+        single = await SessionManager.validate_session(db, "s1", "user1", "10.0.0.1")
+        
+        await SessionManager.invalidate_all_sessions(db, "user1", except_session="s3")
+        others = await SessionManager.validate_session(db, "s2", "user1", "10.0.0.1")
+        kept = await SessionManager.validate_session(db, "s3", "user1", "10.0.0.1")
+        return single, others, kept
+    
+    single, others, kept = asyncio.run(scenario())
+    assert single["valid"] is False
+    assert others["valid"] is False
+    assert kept["valid"] is True
+    assert "s1" not in SessionManager.activity._pending
+
+def test_invalidation_during_a_read_is_not_cached_over(fake_db):
+    _reset()
+    db = fake_db(user_sessions=[_session("s1")])
+    
+    async def scenario():
+        # The read starts first and returns the session as it was before the invalidation
+        in_flight = asyncio.create_task(SessionManager.validate_session(db, "s1", "user1", "10.0.0.1"))
+        await asyncio.sleep(0)
+        await SessionManager.invalidate_session(db, "s1", "user1")
+        await in_flight
+        return await SessionManager.validate_session(db, "s1", "user1", "10.0.0.1")
+    
+    assert asyncio.run(scenario())["valid"] is False
+
+def test_cached_session_still_checks_owner(fake_db):
+    _reset()
+    db = fake_db(user_sessions=[_session("s1")])
+    asyncio.run(SessionManager.validate_session(db, "s1", "user1", "10.0.0.1"))
+    result = asyncio.run(SessionManager.validate_session(db, "s1", "intruder", "10.0.0.1"))
+    assert result == {"valid": False, "reason": "session_not_found"}
+
+def test_session_cap_uses_maintained_count(fake_db):
+    _reset()
+    db = fake_db(user_sessions=[])
+    
+    async def scenario():
+        created = []
+        for i in range(7):
+            session = await SessionManager.create_session(db, "user1", f"device{i}", "10.0.0.1", "ua")
+            created.append(session["session_id"])
+        return created
+    
+    created = asyncio.run(scenario())
+    statuses = [db.user_sessions.docs[session_id]["status"] for session_id in created]
+    assert statuses == ["replaced"] * 2 + ["active"] * 5
+    assert db.session_counters.docs["user1"]["active"] == SessionManager.MAX_SESSIONS_PER_USER
+
+def test_drifted_count_is_recounted_instead_of_replacing(fake_db):
+    _reset()
+    # Sessions removed without a decrement left the counter too high
+    db = fake_db(user_sessions=[_session("s1"), _session("s2")], session_counters=[{"_id": "user1", "active": 9}])
+    
+    session = asyncio.run(SessionManager.create_session(db, "user1", "device", "10.0.0.1", "ua"))
+    
+    assert all(doc["status"] == "active" for doc in db.user_sessions.docs.values())
+    assert session["session_id"] in db.user_sessions.docs
+    assert db.session_counters.docs["user1"]["active"] == 3
+
+def test_sweep_expires_in_batches_and_recounts(fake_db):
+    _reset()
+    past = datetime.utcnow() - timedelta(minutes=1)
+    docs = [_session(f"e{i}", user_id=f"user{i % 2}") for i in range(5)] + [_session("live")]
+    for doc in docs[:5]:
+        doc["expires_at"] = past
+    db = fake_db(user_sessions=docs, session_counters=[{"_id": "user0", "active": 4}, {"_id": "user1", "active": 2}])
+    
+    swept = asyncio.run(SessionManager.sweep_expired_sessions(db, batch_size=2))
+    assert swept == 5
+    assert all(db.user_sessions.docs[f"e{i}"]["status"] == "expired" for i in range(5))
+    assert all("ended_at" in db.user_sessions.docs[f"e{i}"] for i in range(5))
+    assert db.user_sessions.docs["live"]["status"] == "active"
+    assert {doc["_id"]: doc["active"] for doc in db.session_counters.docs.values()} == {"user0": 0, "user1": 1}
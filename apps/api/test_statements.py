@@ -0,0 +1,156 @@
+"""
+Monthly statement worker tests
+"""
+
+import asyncio
+import hashlib
+import inspect
+import io
+import os
+import re
+import sys
+import zlib
+from datetime import datetime
+
+from bson import ObjectId
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "workers"))
+
+import statements
+
+class SyncCursor:
+    """pymongo-style cursor over a FakeCursor: chainable and iterable"""
+    
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self._iter = None
+    
+    def sort(self, key, direction=None):
+        self.cursor.sort(key, direction)
+        return self
+    
+    def batch_size(self, size):
+        return self
+    
+    def __iter__(self):
+        # Single pass, like a pymongo cursor
+        if self._iter is None:
+            self._iter = iter(self.cursor._results())
+        return self._iter
+
+class SyncCollection:
+    """Blocking view of a FakeCollection, as the worker uses pymongo"""
+    
+    def __init__(self, collection):
+        self.collection = collection
+    
+    def find(self, *args, **kwargs):
+        return SyncCursor(self.collection.find(*args, **kwargs))
+    
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+        if not inspect.iscoroutinefunction(method):
+            return method
+        return lambda *args, **kwargs: asyncio.run(method(*args, **kwargs))
+
+class SyncDatabase:
+    def __init__(self, db):
+        self.db = db
+    
+    def __getattr__(self, name):
+        return SyncCollection(getattr(self.db, name))
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+    
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        self.calls.append(("upload", Key))
+        self.objects[Key] = Fileobj.read()
+
+def _text(pdf):
+    streams = re.findall(rb"stream\n(.*?)\nendstream", pdf, re.S)
+    return b"".join(zlib.decompress(stream) for stream in streams)
+
+def _entry(account_id, txn, direction, amount, balance, created_at):
+    return {
+        "account_id": account_id,
+        "txn_id": str(txn["_id"]),
+        "direction": direction,
+        "amount_minor": amount,
+        "balance_after": balance,
+        "created_at": created_at
+    }
+
+def _wallet_db(fake_db, wallets=1):
+    accounts = [{"_id": ObjectId(), "currency": "INR", "balance_minor": 0, "user_id": f"user{n}"} for n in range(wallets)]
+    txns = [
+        {"_id": ObjectId(), "from_account": "payer1", "to_account": "shop1"},
+        {"_id": ObjectId(), "from_account": "payer2", "to_account": "shop2"},
+        {"_id": ObjectId(), "from_account": "payer3", "to_account": "shop3"}
+    ]
+    entries = []
+    for account in accounts:
+        entries += [
+            _entry(account["_id"], txns[0], "credit", 10000, 10000, datetime(2026, 8, 20)),
+            _entry(account["_id"], txns[1], "credit", 2550, 12550, datetime(2026, 9, 3, 10, 15)),
+            _entry(account["_id"], txns[2], "debit", 1200, 11350, datetime(2026, 9, 18, 9, 30)),
+            _entry(account["_id"], txns[0], "debit", 50, 11300, datetime(2026, 10, 1))
+        ]
+    return fake_db(accounts=accounts, transactions=txns, ledger_entries=entries), accounts
+
+def test_statement_has_opening_balance_and_the_months_rows(fake_db):
+    db, (account,) = _wallet_db(fake_db)
+    out = io.BytesIO()
+    
+    assert statements.render_statement(SyncDatabase(db), account, "2026-09", out) == 2
+    text = _text(out.getvalue())
+    assert b"(Opening balance INR 100.00) Tj" in text
+    assert b"(2026-09-03 10:15) Tj" in text and b"(payer2) Tj" in text and b"(INR 25.50) Tj" in text
+    assert b"(2026-09-18 09:30) Tj" in text and b"(shop3) Tj" in text and b"(-INR 12.00) Tj" in text
+    assert b"(Closing balance INR 113.50) Tj" in text
+    # Entries outside the month are not listed
+    assert b"(2026-08-20" not in text and b"(2026-10-01" not in text
+
+def test_opening_balance_without_earlier_entries_comes_from_first_entry(fake_db):
+    db, (account,) = _wallet_db(fake_db)
+    for entry_id, entry in list(db.ledger_entries.docs.items()):
+        if entry["created_at"] < datetime(2026, 9, 1):
+            del db.ledger_entries.docs[entry_id]
+    
+    assert statements._opening_balance(SyncDatabase(db), account, datetime(2026, 9, 1), None) == 10000
+
+def test_partition_uploads_each_statement_once_and_checkpoints_it(fake_db, monkeypatch):
+    db, accounts = _wallet_db(fake_db, wallets=3)
+    s3 = FakeS3()
+    monkeypatch.setattr(statements, "_db", SyncDatabase(db))
+    monkeypatch.setattr(statements, "_s3", s3)
+    ids = sorted(account["_id"] for account in accounts)
+    
+    assert statements.generate_partition("2026-09", ids[0], ids[-1]) == {"generated": 3, "skipped": 0}
+    assert sorted(key for _, key in s3.calls) == sorted(f"statements/2026-09/{wallet_id}.pdf" for wallet_id in ids)
+    assert db.statements.count("bulk_write") == 1
+    for wallet_id in ids:
+        checkpoint = db.statements.docs[f"{wallet_id}:2026-09"]
+        pdf = s3.objects[checkpoint["s3_key"]]
+        assert checkpoint["status"] == "uploaded" and checkpoint["entries"] == 2
+        assert checkpoint["size"] == len(pdf)
+        assert checkpoint["sha256"] == hashlib.sha256(pdf).hexdigest()
+
+def test_resumed_partition_skips_checkpointed_wallets(fake_db, monkeypatch):
+    db, accounts = _wallet_db(fake_db, wallets=3)
+    s3 = FakeS3()
+    monkeypatch.setattr(statements, "_db", SyncDatabase(db))
+    monkeypatch.setattr(statements, "_s3", s3)
+    ids = sorted(account["_id"] for account in accounts)
+    db.statements.docs[f"{ids[0]}:2026-09"] = {
+        "_id": f"{ids[0]}:2026-09", "wallet_id": ids[0], "month": "2026-09", "status": "uploaded"
+    }
+    
+    assert statements.generate_partition("2026-09", ids[0], ids[-1]) == {"generated": 2, "skipped": 1}
+    assert [key for _, key in s3.calls] == [f"statements/2026-09/{wallet_id}.pdf" for wallet_id in ids[1:]]
+    
+    # A second resume has nothing left to do
+    assert statements.generate_partition("2026-09", ids[0], ids[-1]) == {"generated": 0, "skipped": 3}
+    assert len(s3.calls) == 2
@@ -0,0 +1,73 @@
+"""
+Verified-JWT cache tests
+"""
+
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwt, JWTError
+
+from security import TokenVerifier, JWT_AUDIENCE, JWT_ISSUER
+
+def _keypair():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode()
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    return private_pem, public_pem
+
+PRIVATE_PEM, PUBLIC_PEM = _keypair()
+
+def _token(exp_in: float = 600, **claims):
+    now = int(time.time())
+    payload = {"sub": "user1", "iat": now, "exp": now + exp_in, "iss": JWT_ISSUER, "aud": JWT_AUDIENCE, **claims}
+    return jwt.encode(payload, PRIVATE_PEM, algorithm="RS256")
+
+def test_repeat_tokens_are_decoded_once(monkeypatch):
+    verifier = TokenVerifier(PUBLIC_PEM)
+    token = _token()
+    decodes = []
+    real_decode = jwt.decode
+    monkeypatch.setattr(jwt, "decode", lambda *a, **k: decodes.append(1) or real_decode(*a, **k))
+    
+    for _ in range(10):
+        claims = verifier.verify(token)
+        assert claims["sub"] == "user1"
+    assert len(decodes) == 1
+    
+    # Callers cannot corrupt the cached claims
+    claims["sub"] = "someone-else"
+    assert verifier.verify(token)["sub"] == "user1"
+
+def test_invalid_tokens_are_not_cached():
+    verifier = TokenVerifier(PUBLIC_PEM)
+    _, other_public = _keypair()
+    with pytest.raises(JWTError):
+        TokenVerifier(other_public).verify(_token())
+    with pytest.raises(JWTError):
+        verifier.verify(_token(exp_in=-10))
+    with pytest.raises(JWTError):
+        verifier.verify(_token(aud="someone-else"))
+    assert len(verifier._claims) == 0
+
+def test_denied_token_is_rejected_even_when_cached():
+    verifier = TokenVerifier(PUBLIC_PEM)
+    token, other = _token(), _token(jti="other")
+    verifier.verify(token)
+    verifier.deny(token)
+    with pytest.raises(JWTError):
+        verifier.verify(token)
+    assert verifier.verify(other)["jti"] == "other"
+
+def test_missing_public_key_rejects_everything():
+    verifier = TokenVerifier("")
+    with pytest.raises(JWTError):
+        verifier.verify(_token())
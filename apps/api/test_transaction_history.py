@@ -0,0 +1,92 @@
+"""
+Wallet history and statement exports served from ledger entries
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from routers import transactions
+from transaction_history import gzip_export, iter_statement
+
+def _wallets(fake_db, count):
+    start = datetime(2026, 1, 1)
+    txns, entries = [], []
+    balance = {"w1": 10_000, "w2": 10_000}
+    for i in range(count):
+        sender, receiver = ("w1", "w2") if i % 3 else ("w2", "w1")
+        txn_id = ObjectId()
+        txns.append({"_id": txn_id, "from_account": sender, "to_account": receiver, "currency": "INR"})
+        balance[sender] -= 100 * (i + 1)
+        balance[receiver] += 100 * (i + 1)
+        for account, direction in ((sender, "debit"), (receiver, "credit")):
+            entries.append({
+                "_id": ObjectId(), "txn_id": str(txn_id), "account_id": account, "direction": direction,
+                "amount_minor": 100 * (i + 1), "balance_after": balance[account],
+                "created_at": start + timedelta(minutes=i)
+            })
+    return fake_db(ledger_entries=entries, transactions=txns), balance
+
+def test_history_uses_ledger_balances_and_pages(monkeypatch, fake_db):
+    db, balance = _wallets(fake_db, 7)
+    monkeypatch.setattr(transactions, "get_db", lambda: db)
+    request = SimpleNamespace(state=SimpleNamespace(user={"sub": "u1", "wallet_id": "w1"}))
+    
+    async def walk():
+        rows, cursor = [], None
+        while True:
+            page = await transactions.list_transactions(request, "u1", cursor, limit=3)
+            rows.extend(page["transactions"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return rows
+    
+    rows = asyncio.run(walk())
+    assert len(rows) == 7 and db.transactions.count("find") == 3
+    assert rows[0]["running_balance"] == balance["w1"]
+    # Each row's balance follows from the next (older) one
+    for newer, older in zip(rows, rows[1:]):
+        signed = newer["amount_minor"] if newer["direction"] == "+" else -newer["amount_minor"]
+        assert newer["running_balance"] == older["running_balance"] + signed
+    assert rows[-1]["direction"] == "+" and rows[-1]["counterparty"] == "w2"
+    assert rows[-1]["currency"] == "INR"
+
+def _export(db, export_format, **kwargs):
+    async def collect():
+        return [chunk async for chunk in gzip_export(iter_statement(db, "w1", batch_size=10, **kwargs), export_format)]
+    return asyncio.run(collect())
+
+def test_csv_export_streams_in_batches_and_resumes(fake_db):
+    db, balance = _wallets(fake_db, 45)
+    chunks = _export(db, "csv")
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(b"".join(chunks)).decode())))
+    
+    assert len(rows) == 45 and db.ledger_entries.count("find") == 5
+    assert rows == sorted(rows, key=lambda row: row["created_at"])
+    assert int(rows[-1]["running_balance"]) == balance["w1"]
+    
+    # A download cut off mid-stream still decodes up to the last flushed batch
+    partial = zlib.decompressobj(wbits=31).decompress(b"".join(chunks[:3]))
+    received = list(csv.DictReader(io.StringIO(partial.decode())))
+    assert len(received) == 20
+    
+    rest = _export(db, "csv", cursor=received[-1]["cursor"])
+    resumed = list(csv.DictReader(io.StringIO(gzip.decompress(b"".join(rest)).decode())))
+    assert [row["txn_id"] for row in received + resumed] == [row["txn_id"] for row in rows]
+
+def test_ndjson_export_honours_date_range(fake_db):
+    db, _ = _wallets(fake_db, 30)
+    start, end = datetime(2026, 1, 1, 0, 10), datetime(2026, 1, 1, 0, 20)
+    chunks = _export(db, "ndjson", start=start, end=end)
+    lines = [json.loads(line) for line in gzip.decompress(b"".join(chunks)).decode().splitlines()]
+    
+    assert len(lines) == 10
+    assert all(start.isoformat() <= line["created_at"].replace(" ", "T") < end.isoformat() for line in lines)
+    assert set(lines[0]) == {"txn_id", "amount_minor", "currency", "direction", "counterparty", "running_balance", "created_at", "cursor"}
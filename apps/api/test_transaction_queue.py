@@ -0,0 +1,178 @@
+"""
+Claim-based transaction queue tests with several workers
+"""
+
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+import ledger_utils
+from transaction_queue import TransactionQueue
+
+def _fake_commits(monkeypatch, db, fail=(), stall=None):
+    commits = []
+    
+    async def commit_transaction(db_, from_account, to_account, amount_minor, currency, *args):
+        metadata = args[-1]
+        await asyncio.sleep(0.001)
+        if metadata["queue_id"] in fail:
+            return {"error": "INSUFFICIENT_FUNDS"}
+        if stall is not None and not stall.is_set():
+            await stall.wait()
+        txn_id = f"txn-{uuid.uuid4().hex[:8]}"
+        await db.transactions.insert_one({"_id": txn_id, "metadata": metadata, "hash": "h"})
+        commits.append(metadata["queue_id"])
+        return {"status": "success", "txn_id": txn_id}
+    
+    monkeypatch.setattr(ledger_utils, "commit_transaction", commit_transaction)
+    return commits
+
+def _transfer(i):
+    return {"from_account": "w1", "to_account": "w2", "amount_minor": i + 1, "currency": "INR"}
+
+def test_concurrent_workers_process_each_item_once(monkeypatch, fake_db):
+    db = fake_db()
+    commits = _fake_commits(monkeypatch, db)
+    
+    async def scenario():
+        seed = TransactionQueue(db)
+        ids = [await seed.enqueue_transaction(_transfer(i), priority=1 + i % 3) for i in range(60)]
+        workers = [TransactionQueue(db, worker_id=f"w{n}") for n in range(4)]
+        for worker in workers:
+            worker.processing_limit = 10
+        while any(item["status"] != "completed" for item in db.transaction_queue.docs.values()):
+            await asyncio.gather(*[worker.process_queue() for worker in workers])
+        return ids
+    
+    ids = asyncio.run(scenario())
+    assert sorted(commits) == sorted(ids)
+    assert {item["worker_id"] for item in db.transaction_queue.docs.values()} == {"w0", "w1", "w2", "w3"}
+    assert all(item["attempts"] == 1 for item in db.transaction_queue.docs.values())
+
+def test_expired_lease_is_reclaimed_without_paying_twice(monkeypatch, fake_db):
+    db = fake_db()
+    commits = _fake_commits(monkeypatch, db)
+    past = datetime.utcnow() - timedelta(minutes=5)
+    
+    def stranded(queue_id):
+        return {
+            "_id": queue_id, "transaction_data": _transfer(0), "status": "processing", "priority": 5,
+            "created_at": past, "scheduled_at": past, "attempts": 1, "last_attempt_at": past,
+            "worker_id": "crashed", "lease_expires_at": past + timedelta(seconds=60), "error_log": []
+        }
+    
+    # q1 was committed before its worker died; q2 was not
+    db.transaction_queue.docs = {"q1": stranded("q1"), "q2": stranded("q2")}
+    db.transactions.docs["txn-q1"] = {"_id": "txn-q1", "metadata": {"queue_id": "q1"}, "hash": "h"}
+    
+    asyncio.run(TransactionQueue(db, worker_id="rescuer").process_queue())
+    
+    assert commits == ["q2"]
+    q1, q2 = db.transaction_queue.docs["q1"], db.transaction_queue.docs["q2"]
+    assert q1["status"] == q2["status"] == "completed"
+    assert q1["result"]["recovered"] is True and q1["result"]["txn_id"] == "txn-q1"
+    assert q2["worker_id"] == "rescuer" and q2["attempts"] == 2
+    assert "lease_expires_at" not in q2
+
+def test_worker_that_lost_its_lease_cannot_overwrite(monkeypatch, fake_db):
+    db = fake_db()
+    _fake_commits(monkeypatch, db, fail={"q1"})
+    
+    async def scenario():
+        slow = TransactionQueue(db, worker_id="slow")
+        await slow.enqueue_transaction(_transfer(0))
+        queue_id = next(iter(db.transaction_queue.docs))
+        claimed = await slow.claim_next()
+        
+        # The lease runs out and another worker takes the item over
+        db.transaction_queue.docs[queue_id]["lease_expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        await asyncio.sleep(0.002)
+        fast = TransactionQueue(db, worker_id="fast")
+        retaken = await fast.claim_next()
+        
+        await slow._handle_transaction_failure(claimed, "timed out")
+        return queue_id, retaken
+    
+    queue_id, retaken = asyncio.run(scenario())
+    item = db.transaction_queue.docs[queue_id]
+    assert retaken["worker_id"] == "fast"
+    assert item["status"] == "processing" and item["worker_id"] == "fast"
+    assert item["error_log"] == []
+
+def _unique_queue_ids(db):
+    return db.transactions.create_index(
+        "metadata.queue_id", unique=True, partialFilterExpression={"metadata.queue_id": {"$exists": True}}
+    )
+
+def test_worker_that_lost_its_lease_does_not_commit(monkeypatch, fake_db):
+    db = fake_db()
+    commits = _fake_commits(monkeypatch, db)
+    
+    async def scenario():
+        slow = TransactionQueue(db, worker_id="slow")
+        queue_id = await slow.enqueue_transaction(_transfer(0))
+        claimed = await slow.claim_next()
+        
+        # The slow worker's renewals stalled and its lease ran out before it got to commit
+        db.transaction_queue.docs[queue_id]["lease_expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        await asyncio.sleep(0.002)
+        await TransactionQueue(db, worker_id="fast").claim_next()
+        
+        await slow._process_single_transaction(claimed)
+        return queue_id
+    
+    queue_id = asyncio.run(scenario())
+    item = db.transaction_queue.docs[queue_id]
+    assert commits == []
+    assert item["status"] == "processing" and item["worker_id"] == "fast"
+    assert item["error_log"] == []
+
+def test_commit_racing_a_reclaim_is_rolled_back(monkeypatch, fake_db):
+    db = fake_db()
+    stall = asyncio.Event()
+    commits = _fake_commits(monkeypatch, db, stall=stall)
+    
+    async def scenario():
+        await _unique_queue_ids(db)
+        slow = TransactionQueue(db, worker_id="slow")
+        queue_id = await slow.enqueue_transaction(_transfer(0))
+        claimed = await slow.claim_next()
+        
+        # The slow worker passes its lease check, then stalls inside the commit
+        stuck = asyncio.create_task(slow._process_single_transaction(claimed))
+        while not db.transaction_queue.count("update_one"):
+            await asyncio.sleep(0.001)
+        db.transaction_queue.docs[queue_id]["lease_expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        await asyncio.sleep(0.002)
+        fast = TransactionQueue(db, worker_id="fast")
+        stall.set()
+        await fast.process_queue()
+        await stuck
+        return queue_id
+    
+    queue_id = asyncio.run(scenario())
+    item = db.transaction_queue.docs[queue_id]
+    assert commits == [queue_id]
+    assert len(db.transactions.docs) == 1
+    assert item["status"] == "completed" and item["worker_id"] == "fast"
+    assert item["error_log"] == []
+
+def test_failures_are_retried_then_failed(monkeypatch, fake_db):
+    db = fake_db()
+    _fake_commits(monkeypatch, db, fail={"always"})
+    
+    async def scenario():
+        queue = TransactionQueue(db, worker_id="w")
+        queue.retry_delay = 0
+        db.transaction_queue.docs["always"] = {
+            "_id": "always", "transaction_data": _transfer(0), "status": "pending", "priority": 5,
+            "created_at": datetime.utcnow(), "scheduled_at": datetime.utcnow(), "attempts": 0,
+            "last_attempt_at": None, "error_log": []
+        }
+        for _ in range(5):
+            await queue.process_queue()
+    
+    asyncio.run(scenario())
+    item = db.transaction_queue.docs["always"]
+    assert item["status"] == "failed" and item["attempts"] == 3
+    assert [entry["attempt"] for entry in item["error_log"]] == [1, 2, 3]
@@ -0,0 +1,88 @@
+"""
+Materialized unread notification counter tests
+"""
+
+import asyncio
+
+from notification_service import NotificationService
+
+def _in_app(user_id):
+    return {"user_id": user_id, "type": "info", "priority": "low", "title": "t", "message": "m", "channels": ["in_app"]}
+
+def test_counter_follows_create_read_and_read_all(fake_db):
+    db = fake_db()
+    
+    async def scenario():
+        ids = await NotificationService.deliver_many(db, [_in_app("alice")] * 3 + [_in_app("bob")])
+        counts = [await NotificationService.get_unread_count(db, "alice")]
+        
+        assert await NotificationService.mark_notification_read(db, str(ids[0]), "alice")
+        # Marking the same notification again does not decrement twice
+        assert await NotificationService.mark_notification_read(db, str(ids[0]), "alice")
+        assert not await NotificationService.mark_notification_read(db, str(ids[3]), "alice")
+        counts.append(await NotificationService.get_unread_count(db, "alice"))
+        
+        assert await NotificationService.mark_all_notifications_read(db, "alice") == 2
+        counts.append(await NotificationService.get_unread_count(db, "alice"))
+        counts.append(await NotificationService.get_unread_count(db, "bob"))
+        return counts
+    
+    assert asyncio.run(scenario()) == [3, 2, 0, 1]
+    # Reading the count is a point lookup on the counter
+    assert db.notification_counters.count("find_one") == 4
+    assert db.notifications.count("aggregate") == 0
+    assert asyncio.run(NotificationService.get_unread_count(db, "carol")) == 0
+
+def test_repair_recomputes_drifted_counters(fake_db):
+    db = fake_db()
+    
+    async def scenario():
+        await NotificationService.deliver_many(db, [_in_app("alice")] * 2 + [_in_app("bob")])
+        db.notification_counters.docs["alice"]["unread"] = 7
+        db.notification_counters.docs["bob"]["unread"] = -1
+        db.notification_counters.docs["carol"] = {"_id": "carol", "unread": 4}
+        for doc in db.notifications.docs.values():
+            if doc["user_id"] == "bob":
+                doc["read"] = True
+        
+        repaired = await NotificationService.repair_unread_counters(db)
+        return repaired, {user_id: doc["unread"] for user_id, doc in db.notification_counters.docs.items()}
+    
+    repaired, counters = asyncio.run(scenario())
+    assert repaired == 3
+    assert counters == {"alice": 2, "bob": 0, "carol": 0}
+
+def test_repair_runs_in_batches_and_keeps_concurrent_increments(fake_db, monkeypatch):
+    monkeypatch.setattr(NotificationService, "COUNTER_REPAIR_BATCH", 2)
+    db = fake_db()
+    
+    async def scenario():
+        await NotificationService.deliver_many(db, [_in_app(f"user{i}") for i in range(5)] + [_in_app("user0")])
+        for doc in db.notification_counters.docs.values():
+            doc["unread"] = 9
+        
+        # A delivery to user0 lands between the recount and the corrected write
+        recount = db.notifications.aggregate
+        
+        def recount_then_deliver(pipeline):
+            cursor = recount(pipeline)
+            if "user0" in pipeline[0]["$match"]["user_id"]["$in"]:
+                db.notifications.docs["late"] = {"_id": "late", **_in_app("user0"), "in_app": True, "read": False}
+                db.notification_counters.docs["user0"]["unread"] += 1
+            return cursor
+        
+        db.notifications.aggregate = recount_then_deliver
+        first = await NotificationService.repair_unread_counters(db)
+        first_counts = {user_id: doc["unread"] for user_id, doc in db.notification_counters.docs.items()}
+        
+        db.notifications.aggregate = recount
+        second = await NotificationService.repair_unread_counters(db)
+        return first, first_counts, second
+    
+    first, first_counts, second = asyncio.run(scenario())
+    assert db.notifications.count("aggregate") == 3 + 3
+    # user0's counter changed under the repair, so it was left alone
+    assert first == 4 and first_counts["user0"] == 10
+    assert all(first_counts[f"user{i}"] == 1 for i in range(1, 5))
+    assert second == 1
+    assert db.notification_counters.docs["user0"]["unread"] == 3
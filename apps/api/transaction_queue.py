@@ -5,9 +5,13 @@ Handles high-volume transaction processing with retry logic
 
 import asyncio
 import json
+import logging
+import socket
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from enum import Enum
 import uuid
 
@@ -20,13 +24,27 @@ class TransactionStatus(Enum):
     CANCELLED = "cancelled"
 
 class TransactionQueue:
-    """High-performance transaction queue with retry logic"""
+    """
+    High-performance transaction queue with retry logic
     
-    def __init__(self, db: AsyncIOMotorDatabase):
+    Any number of workers can run process_queue against the same queue.
+    Each item is claimed atomically by one worker for a lease that the
+    worker renews while it runs; items whose lease expires (the worker
+    died) are claimed again. The lease is re-checked right before the
+    payment is committed and status updates only apply while the caller
+    still holds it. A reclaimed item whose transaction was already
+    committed is completed instead of being paid twice, and the unique
+    metadata.queue_id index on transactions rolls back a second commit
+    that races the first.
+    """
+    
+    def __init__(self, db: AsyncIOMotorDatabase, worker_id: Optional[str] = None, lease_seconds: int = 60):
         self.db = db
         self.processing_limit = 100  # Max concurrent transactions
         self.retry_limit = 3
         self.retry_delay = 5  # seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+        self.lease = timedelta(seconds=lease_seconds)
     
     async def enqueue_transaction(
         self,
@@ -52,83 +70,141 @@ class TransactionQueue:
         await self.db.transaction_queue.insert_one(queue_item)
         return queue_item["_id"]
     
-    async def process_queue(self):
-        """Process pending transactions from queue"""
+    async def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Atomically claim the most urgent due item, or one whose lease expired"""
         
-        # Get pending transactions ordered by priority and created_at
-        pending_transactions = await self.db.transaction_queue.find({
-            "status": {"$in": [TransactionStatus.PENDING.value, TransactionStatus.RETRY.value]},
-            "scheduled_at": {"$lte": datetime.utcnow()}
-        }).sort([("priority", 1), ("created_at", 1)]).limit(self.processing_limit).to_list(None)
-        
-        if not pending_transactions:
-            return
+        now = datetime.utcnow()
+        return await self.db.transaction_queue.find_one_and_update(
+            {"$or": [
+                {
+                    "status": {"$in": [TransactionStatus.PENDING.value, TransactionStatus.RETRY.value]},
+                    "scheduled_at": {"$lte": now}
+                },
+                {"status": TransactionStatus.PROCESSING.value, "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": TransactionStatus.PROCESSING.value,
+                    "worker_id": self.worker_id,
+                    "lease_expires_at": now + self.lease,
+                    "last_attempt_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    def _leased(self, queue_item: Dict[str, Any]) -> Dict[str, Any]:
+        # Matches the item only while this claim still holds it
+        return {
+            "_id": queue_item["_id"],
+            "status": TransactionStatus.PROCESSING.value,
+            "worker_id": self.worker_id,
+            "last_attempt_at": queue_item["last_attempt_at"]
+        }
+    
+    async def _extend_lease(self, queue_item: Dict[str, Any]) -> bool:
+        """Push the lease out again; False once another worker has reclaimed the item"""
+        result = await self.db.transaction_queue.update_one(
+            self._leased(queue_item),
+            {"$set": {"lease_expires_at": datetime.utcnow() + self.lease}}
+        )
+        if not result.modified_count:
+            logging.warning(f"Lost lease on queue item {queue_item['_id']}")
+            return False
+        return True
+    
+    async def _renew_lease(self, queue_item: Dict[str, Any]):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            if not await self._extend_lease(queue_item):
+                return
+    
+    async def _committed(self, queue_id: str) -> Optional[Dict[str, Any]]:
+        committed = await self.db.transactions.find_one({"metadata.queue_id": queue_id}, {"hash": 1})
+        if committed is None:
+            return None
+        return {"status": "success", "txn_id": str(committed["_id"]), "hash": committed.get("hash"), "recovered": True}
+    
+    async def process_queue(self):
+        """Claim and process up to processing_limit due transactions"""
         
-        # Process transactions concurrently
         tasks = []
-        for txn in pending_transactions:
-            tasks.append(self._process_single_transaction(txn))
+        while len(tasks) < self.processing_limit:
+            queue_item = await self.claim_next()
+            if queue_item is None:
+                break
+            # Start each item as soon as it is claimed
+            tasks.append(asyncio.create_task(self._process_single_transaction(queue_item)))
         
-        await asyncio.gather(*tasks, return_exceptions=True)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
     
     async def _process_single_transaction(self, queue_item: Dict[str, Any]):
-        """Process a single transaction from queue"""
+        """Process a single claimed transaction"""
         
         queue_id = queue_item["_id"]
+        renewal = asyncio.create_task(self._renew_lease(queue_item))
         
         try:
-            # Mark as processing
-            await self.db.transaction_queue.update_one(
-                {"_id": queue_id},
-                {
-                    "$set": {
-                        "status": TransactionStatus.PROCESSING.value,
-                        "last_attempt_at": datetime.utcnow()
-                    },
-                    "$inc": {"attempts": 1}
-                }
-            )
+            # A reclaimed item may already have been committed by a worker that died afterwards
+            result = None
+            if queue_item["attempts"] > 1:
+                result = await self._committed(queue_id)
             
-            # Process the transaction
-            from ledger_utils import commit_transaction
-            transaction_data = queue_item["transaction_data"]
-            
-            result = await commit_transaction(
-                self.db,
-                transaction_data["from_account"],
-                transaction_data["to_account"],
-                transaction_data["amount_minor"],
-                transaction_data["currency"],
-                transaction_data.get("biometric_verified", False),
-                transaction_data.get("hash_payload", {}),
-                transaction_data.get("user_id"),
-                transaction_data.get("request_metadata", {})
-            )
+            if result is None:
+                # The renewal may have stalled; never commit an item another worker has reclaimed
+                if not await self._extend_lease(queue_item):
+                    return
+                
+                from ledger_utils import commit_transaction
+                transaction_data = queue_item["transaction_data"]
+                
+                try:
+                    result = await commit_transaction(
+                        self.db,
+                        transaction_data["from_account"],
+                        transaction_data["to_account"],
+                        transaction_data["amount_minor"],
+                        transaction_data["currency"],
+                        transaction_data.get("biometric_verified", False),
+                        transaction_data.get("hash_payload", {}),
+                        transaction_data.get("user_id"),
+                        {**transaction_data.get("request_metadata", {}), "queue_id": queue_id}
+                    )
+                except DuplicateKeyError:
+                    # The unique metadata.queue_id index rolled back a second commit of the same item
+                    result = await self._committed(queue_id)
+                    if result is None:
+                        raise
             
             if "error" in result:
                 raise Exception(result["error"])
             
             # Mark as completed
             await self.db.transaction_queue.update_one(
-                {"_id": queue_id},
+                self._leased(queue_item),
                 {
                     "$set": {
                         "status": TransactionStatus.COMPLETED.value,
                         "completed_at": datetime.utcnow(),
                         "result": result
-                    }
+                    },
+                    "$unset": {"lease_expires_at": ""}
                 }
             )
             
         except Exception as e:
             # Handle failure
             await self._handle_transaction_failure(queue_item, str(e))
+        finally:
+            renewal.cancel()
     
     async def _handle_transaction_failure(self, queue_item: Dict[str, Any], error_message: str):
         """Handle transaction processing failure"""
         
-        queue_id = queue_item["_id"]
-        attempts = queue_item["attempts"] + 1
+        attempts = queue_item["attempts"]
         
         # Add error to log
         error_entry = {
@@ -140,12 +216,13 @@ class TransactionQueue:
         if attempts >= self.retry_limit:
             # Max retries reached, mark as failed
             await self.db.transaction_queue.update_one(
-                {"_id": queue_id},
+                self._leased(queue_item),
                 {
                     "$set": {
                         "status": TransactionStatus.FAILED.value,
                         "completed_at": datetime.utcnow()
                     },
+                    "$unset": {"lease_expires_at": ""},
                     "$push": {"error_log": error_entry}
                 }
             )
@@ -154,12 +231,13 @@ class TransactionQueue:
             retry_at = datetime.utcnow() + timedelta(seconds=self.retry_delay * attempts)
             
             await self.db.transaction_queue.update_one(
-                {"_id": queue_id},
+                self._leased(queue_item),
                 {
                     "$set": {
                         "status": TransactionStatus.RETRY.value,
                         "scheduled_at": retry_at
                     },
+                    "$unset": {"lease_expires_at": ""},
                     "$push": {"error_log": error_entry}
                 }
             )
@@ -176,7 +254,7 @@ class TransactionQueue:
             }
         ]).to_list(None)
         
-        status_dict = {status.count: 0 for status in TransactionStatus}
+        status_dict = {status.value: 0 for status in TransactionStatus}
         for item in status_counts:
             if item["_id"] in [status.value for status in TransactionStatus]:
                 status_dict[item["_id"]] = item["count"]
@@ -1,6 +1,32 @@
 # BiPay Worker Entrypoint
 
-# TODO: Implement Kafka/RabbitMQ consumers for ledger commit, notifications, receipts, webhooks
+# TODO: Implement Kafka/RabbitMQ consumers for ledger commit, receipts, webhooks
+
+import asyncio
+import logging
+import os
+import sys
+
+# Workers share the API's modules (config, db, delivery engines)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+from db import get_db
+from notification_service import NotificationService
+from push_dispatcher import PushDispatcher, PushProvider
+
+async def run_workers():
+    db = get_db()
+    provider = PushProvider()
+    dispatcher = PushDispatcher(db, provider)
+    try:
+        await asyncio.gather(
+            dispatcher.run(),
+            NotificationService.run_counter_repair(db)
+        )
+    finally:
+        await provider.aclose()
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
     print("BiPay worker started.")
+    asyncio.run(run_workers())
@@ -0,0 +1,260 @@
+# BiPay Monthly Statements
+#
+# Generates a PDF statement per wallet for one calendar month and uploads it to S3:
+#
+#     python statements.py 2026-09 --processes 16
+#
+# Wallets are split into _id ranges that a process pool renders in parallel.
+# Each uploaded statement is checkpointed in `statements` and each finished
+# range in `statement_runs`, so re-running the same month resumes where a
+# previous run stopped.
+
+import argparse
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from itertools import chain, islice
+
+# Workers share the API's modules (config, PDF writer)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from bson import ObjectId
+from pymongo import MongoClient, ReturnDocument, UpdateOne
+from config import config
+from pdf_documents import PdfTableWriter, format_minor
+
+PARTITION_SIZE = 2000  # wallets per pool task
+LEDGER_BATCH = 1000
+CHECKPOINT_EVERY = 100  # statements per checkpoint write
+
+# Small statements stay in memory and upload in one request; large ones spill
+# to disk and go up as a multipart upload
+SPOOL_SIZE = 8 * 1024 * 1024
+TRANSFER = TransferConfig(multipart_threshold=SPOOL_SIZE, multipart_chunksize=SPOOL_SIZE)
+
+COLUMNS = [("Date", 0), ("Transaction", 95), ("Counterparty", 215), ("Amount", 335), ("Balance", 420)]
+
+# Per-process clients, created by _init_process
+_db = None
+_s3 = None
+
+def _connect():
+    return MongoClient(config.MONGO_URI).bipay
+
+def _init_process():
+    global _db, _s3
+    _db = _connect()
+    _s3 = boto3.client(
+        "s3",
+        endpoint_url=config.S3_ENDPOINT or None,
+        aws_access_key_id=config.S3_ACCESS_KEY or None,
+        aws_secret_access_key=config.S3_SECRET_KEY or None
+    )
+
+def month_range(month: str):
+    start = datetime.strptime(month, "%Y-%m")
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return start, end
+
+def _eligible(end: datetime):
+    # Wallets that existed by the end of the month
+    return {"created_at": {"$not": {"$gte": end}}}
+
+def partitions(db, end: datetime, size: int = PARTITION_SIZE):
+    """(first_id, last_id) ranges of about size wallets, in _id order"""
+    ids = (doc["_id"] for doc in db.accounts.find(_eligible(end), {"_id": 1}).sort("_id", 1).batch_size(10_000))
+    while True:
+        chunk = list(islice(ids, size))
+        if not chunk:
+            return
+        yield chunk[0], chunk[-1]
+
+def _signed(entry) -> int:
+    return -entry["amount_minor"] if entry["direction"] == "debit" else entry["amount_minor"]
+
+def _opening_balance(db, account, start: datetime, first_entry):
+    before = db.ledger_entries.find_one(
+        {"account_id": account["_id"], "created_at": {"$lt": start}},
+        {"balance_after": 1},
+        sort=[("created_at", -1), ("_id", -1)]
+    )
+    if before:
+        return before["balance_after"]
+    if first_entry is None:
+        first_entry = db.ledger_entries.find_one(
+            {"account_id": account["_id"], "created_at": {"$gte": start}},
+            {"balance_after": 1, "amount_minor": 1, "direction": 1},
+            sort=[("created_at", 1), ("_id", 1)]
+        )
+    if first_entry:
+        return first_entry["balance_after"] - _signed(first_entry)
+    return account.get("balance_minor", 0)
+
+def _ledger_batches(db, account_id, start: datetime, end: datetime):
+    """The month's ledger entries in batches, each with its transactions' counterparties"""
+    cursor = db.ledger_entries.find(
+        {"account_id": account_id, "created_at": {"$gte": start, "$lt": end}},
+        {"txn_id": 1, "direction": 1, "amount_minor": 1, "balance_after": 1, "created_at": 1}
+    ).sort([("created_at", 1), ("_id", 1)]).batch_size(LEDGER_BATCH)
+
+    while True:
+        entries = list(islice(cursor, LEDGER_BATCH))
+        if not entries:
+            return
+        txn_ids = [ObjectId(e["txn_id"]) if ObjectId.is_valid(e["txn_id"]) else e["txn_id"] for e in entries]
+        txns = {
+            str(txn["_id"]): txn
+            for txn in db.transactions.find({"_id": {"$in": txn_ids}}, {"from_account": 1, "to_account": 1})
+        }
+        yield entries, txns
+
+def render_statement(db, account, month: str, out) -> int:
+    """Write one wallet's statement to out; returns the number of entries"""
+    start, end = month_range(month)
+    currency = account.get("currency", "INR")
+    batches = _ledger_batches(db, account["_id"], start, end)
+    first = next(batches, None)
+
+    balance = _opening_balance(db, account, start, first[0][0] if first else None)
+    writer = PdfTableWriter(out, f"BiPay Statement - {start:%B %Y}", COLUMNS)
+    writer.add_line(f"Wallet {account['_id']}", bold=True)
+    writer.add_line(f"Opening balance {format_minor(balance, currency)}")
+    writer.add_line()
+
+    count = 0
+    if first:
+        for entries, txns in chain([first], batches):
+            for entry in entries:
+                txn = txns.get(entry["txn_id"], {})
+                debit = entry["direction"] == "debit"
+                writer.add_row([
+                    f"{entry['created_at']:%Y-%m-%d %H:%M}",
+                    entry["txn_id"][-12:],
+                    txn.get("to_account" if debit else "from_account") or "",
+                    format_minor(_signed(entry), currency),
+                    format_minor(entry["balance_after"], currency)
+                ])
+                balance = entry["balance_after"]
+                count += 1
+
+    writer.add_line()
+    writer.add_line(f"Closing balance {format_minor(balance, currency)}", bold=True)
+    writer.add_line(f"{count} transactions")
+    writer.close()
+    return count
+
+class _HashingWriter:
+    """File wrapper that hashes and counts what is written through it"""
+
+    def __init__(self, out):
+        self.out = out
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.out.write(data)
+
+def generate_partition(month: str, first_id, last_id) -> dict:
+    """Render and upload statements for wallets first_id..last_id, skipping checkpointed ones"""
+    _, end = month_range(month)
+    accounts = list(_db.accounts.find(
+        {"_id": {"$gte": first_id, "$lte": last_id}, **_eligible(end)},
+        {"currency": 1, "balance_minor": 1, "user_id": 1}
+    ))
+    done = {
+        doc["wallet_id"] for doc in _db.statements.find(
+            {"month": month, "wallet_id": {"$in": [account["_id"] for account in accounts]}, "status": "uploaded"},
+            {"wallet_id": 1}
+        )
+    }
+
+    generated = 0
+    checkpoints = []
+    for account in accounts:
+        if account["_id"] in done:
+            continue
+        key = f"statements/{month}/{account['_id']}.pdf"
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as spool:
+            hashing = _HashingWriter(spool)
+            entries = render_statement(_db, account, month, hashing)
+            spool.seek(0)
+            _s3.upload_fileobj(spool, config.S3_BUCKET, key, ExtraArgs={"ContentType": "application/pdf"}, Config=TRANSFER)
+
+        checkpoints.append(UpdateOne(
+            {"_id": f"{account['_id']}:{month}"},
+            {"$set": {
+                "wallet_id": account["_id"],
+                "user_id": account.get("user_id"),
+                "month": month,
+                "s3_key": key,
+                "size": hashing.size,
+                "sha256": hashing.sha256.hexdigest(),
+                "entries": entries,
+                "status": "uploaded",
+                "generated_at": datetime.utcnow()
+            }},
+            upsert=True
+        ))
+        generated += 1
+        if len(checkpoints) == CHECKPOINT_EVERY:
+            _db.statements.bulk_write(checkpoints, ordered=False)
+            checkpoints = []
+    if checkpoints:
+        _db.statements.bulk_write(checkpoints, ordered=False)
+
+    return {"generated": generated, "skipped": len(done)}
+
+def run(month: str, processes: int):
+    db = _connect()
+    _, end = month_range(month)
+    run_doc = db.statement_runs.find_one_and_update(
+        {"_id": month},
+        {"$setOnInsert": {"started_at": datetime.utcnow(), "done_partitions": []}, "$set": {"status": "running"}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    done_partitions = set(run_doc.get("done_partitions", []))
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_process) as pool:
+        futures = {}
+        for first_id, last_id in partitions(db, end):
+            partition = f"{first_id}..{last_id}"
+            if partition not in done_partitions:
+                futures[pool.submit(generate_partition, month, first_id, last_id)] = partition
+
+        logging.info(f"Statements {month}: {len(futures)} partitions to process ({len(done_partitions)} already done)")
+        for future in as_completed(futures):
+            partition = futures[future]
+            try:
+                counts = future.result()
+            except Exception as e:
+                failed += 1
+                logging.error(f"Statements {month}: partition {partition} failed: {e}")
+                continue
+            db.statement_runs.update_one(
+                {"_id": month},
+                {"$addToSet": {"done_partitions": partition}, "$inc": {"generated": counts["generated"]}}
+            )
+
+    status = "failed" if failed else "completed"
+    db.statement_runs.update_one({"_id": month}, {"$set": {"status": status, "finished_at": datetime.utcnow()}})
+    logging.info(f"Statements {month}: {status}")
+    return status
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate monthly wallet statements")
+    parser.add_argument("month", help="YYYY-MM")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(0 if run(args.month, args.processes) == "completed" else 1)
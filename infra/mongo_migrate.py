@@ -1,8 +1,30 @@
 # BiPay MongoDB Indexes & Migrations
 
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import OperationFailure
 import asyncio
 
+INDEX_NOT_FOUND = 27
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+async def replace_index(collection, keys, **options):
+    """create_index, rebuilding an existing index on the same keys whose options changed"""
+    try:
+        await collection.create_index(keys, **options)
+    except OperationFailure as e:
+        if e.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+            raise
+        await collection.drop_index(keys)
+        await collection.create_index(keys, **options)
+
+async def drop_index_if_exists(collection, name):
+    try:
+        await collection.drop_index(name)
+    except OperationFailure as e:
+        if e.code != INDEX_NOT_FOUND:
+            raise
+
 async def create_indexes():
     client = AsyncIOMotorClient("mongodb://localhost:27017/bipay")
     db = client.get_default_database()
@@ -11,10 +33,137 @@ async def create_indexes():
     await db.devices.create_index("user_id")
     await db.accounts.create_index([("owner_id", 1), ("currency", 1)])
     await db.transactions.create_index([("created_at", -1), ("from_account", 1), ("to_account", 1)])
+    # Keyset pages of one wallet's history, one index per side of the $or
+    await db.transactions.create_index([("from_account", 1), ("created_at", -1), ("_id", -1)])
+    await db.transactions.create_index([("to_account", 1), ("created_at", -1), ("_id", -1)])
     await db.ledger_entries.create_index("txn_id")
+    # Wallet history: keyset pages of one account's postings
+    await db.ledger_entries.create_index([("account_id", 1), ("created_at", -1), ("_id", -1)])
+    # TransactionQueue claims: due items by priority, and expired leases
+    await db.transaction_queue.create_index([("status", 1), ("priority", 1), ("created_at", 1)])
+    await db.transaction_queue.create_index([("status", 1), ("lease_expires_at", 1)])
+    # One transaction per queue item: a second commit of the same item fails on insert.
+    # Also finds items committed by a worker that died before marking them.
+    await replace_index(
+        db.transactions,
+        [("metadata.queue_id", 1)],
+        unique=True,
+        partialFilterExpression={"metadata.queue_id": {"$exists": True}}
+    )
+    # Monthly statement checkpoints (apps/workers/statements.py)
+    await db.statements.create_index([("month", 1), ("wallet_id", 1)])
     await db.nonces.create_index("nonce", unique=True)
     await db.nonces.create_index("expires_at", expireAfterSeconds=0)
+    # Consumed stateless nonces only need to outlive their expiry
+    await db.consumed_nonces.create_index("expires_at", expireAfterSeconds=0)
+    # Sliding windows of the mongo rate limit backend, looked up by _id
+    # (they replace the per-attempt rate_limits documents, which can be dropped)
+    await db.rate_limit_windows.create_index("expires_at", expireAfterSeconds=0)
+    # Ended sessions are kept a week for audit, then purged. Active sessions have no
+    # ended_at, so the TTL monitor never deletes one behind session_counters' back
+    # (the previous TTL index on expires_at did).
+    await drop_index_if_exists(db.user_sessions, "expires_at_1")
+    await db.user_sessions.create_index("ended_at", expireAfterSeconds=7 * 24 * 3600)
+    # Active-only indexes for the expiry sweep and oldest-session replacement
+    await db.user_sessions.create_index(
+        [("expires_at", 1), ("user_id", 1)],
+        partialFilterExpression={"status": "active"}
+    )
+    await db.user_sessions.create_index(
+        [("user_id", 1), ("last_activity", 1)],
+        partialFilterExpression={"status": "active"}
+    )
+    # Refresh token families and access token revocations
+    await db.refresh_tokens.create_index("family_id")
+    await db.refresh_tokens.create_index("user_id")
+    await db.refresh_tokens.create_index("expires_at", expireAfterSeconds=0)
+    await db.revoked_tokens.create_index("revoked_at")
+    await db.revoked_tokens.create_index("expires_at", expireAfterSeconds=0)
+    await db.subject_revocations.create_index("updated_at")
+    await db.subject_revocations.create_index("expires_at", expireAfterSeconds=0)
+    # Unified notification records: in-app feed, history and unread lookups
+    await db.notifications.create_index([("user_id", 1), ("created_at", -1)])
+    # Keyset pages of the in-app feed, all or unread only (see pagination.KEYSET_SORT)
+    await db.notifications.create_index(
+        [("user_id", 1), ("created_at", -1), ("_id", -1)],
+        partialFilterExpression={"in_app": True}
+    )
+    await db.notifications.create_index(
+        [("user_id", 1), ("read", 1), ("created_at", -1), ("_id", -1)],
+        partialFilterExpression={"in_app": True}
+    )
+    # Push queue drained by the worker's PushDispatcher
+    await db.notifications.create_index([("push_status", 1), ("push_rank", 1), ("created_at", 1)])
+    await db.notifications.create_index("push_claim", sparse=True)
+    # PushDispatcher._claim's second branch: sends whose lease ran out
+    await db.notifications.create_index(
+        [("push_lease_until", 1)],
+        partialFilterExpression={"push_status": "sending"}
+    )
+    await db.devices.create_index("fcm_token", sparse=True)
+    await migrate_notifications(db)
+    await migrate_sessions(db)
+    # Nonces written before expires_at became a datetime are never purged by the TTL index
+    await db.nonces.delete_many({"expires_at": {"$type": "number"}})
     print("Indexes created.")
 
+async def migrate_notifications(db):
+    """Fold notify_user, log_history and in_app_notifications documents into unified records (idempotent)"""
+    # notify_user documents: in-app only, text in "body"
+    await db.notifications.update_many(
+        {"channels": {"$exists": False}, "type": {"$ne": "history"}},
+        [
+            {"$set": {
+                "message": "$body", "priority": "low", "data": {}, "in_app": True,
+                "channels": ["in_app"], "delivered_channels": ["in_app"], "status": "delivered"
+            }},
+            {"$unset": "body"}
+        ]
+    )
+    # log_history documents: history only
+    await db.notifications.update_many(
+        {"type": "history", "history": {"$exists": False}},
+        [
+            {"$set": {
+                "history": {"action": "$title", "details": "$body"}, "message": "", "priority": "low",
+                "data": {}, "in_app": False, "read": True, "channels": [], "status": "recorded"
+            }},
+            {"$unset": "body"}
+        ]
+    )
+    # NotificationService records kept their in-app copy in in_app_notifications
+    await db.notifications.update_many(
+        {"channels": {"$exists": True}, "in_app": {"$exists": False}},
+        {"$set": {"in_app": False, "read": True}}
+    )
+    await db.in_app_notifications.aggregate([
+        {"$set": {
+            "in_app": True, "channels": ["in_app"], "delivered_channels": ["in_app"],
+            "status": "delivered", "delivery_attempts": 1
+        }},
+        {"$merge": {"into": "notifications", "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+    # Seed per-user unread counters (kept current by NotificationService)
+    await db.notifications.aggregate([
+        {"$match": {"in_app": True, "read": False}},
+        {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}},
+        {"$merge": {"into": "notification_counters", "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+
+async def migrate_sessions(db):
+    """Backfill ended_at on ended sessions and seed per-user active counts (idempotent)"""
+    await db.user_sessions.update_many(
+        {"status": {"$ne": "active"}, "ended_at": {"$exists": False}},
+        [{"$set": {"ended_at": {"$ifNull": ["$expired_at", "$invalidated_at", "$replaced_at", "$expires_at"]}}}]
+    )
+    # Seed session_counters (kept current by SessionManager); users without active sessions count 0.
+    # A login racing this is corrected when the user next reaches the cap, which recounts.
+    await db.session_counters.update_many({}, {"$set": {"active": 0}})
+    await db.user_sessions.aggregate([
+        {"$match": {"status": "active"}},
+        {"$group": {"_id": "$user_id", "active": {"$sum": 1}}},
+        {"$merge": {"into": "session_counters", "on": "_id", "whenMatched": "merge", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+
 if __name__ == "__main__":
     asyncio.run(create_indexes())